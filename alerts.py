@@ -0,0 +1,535 @@
+"""Price and indicator alerts.
+
+Users register one-shot conditions such as ``rsi crosses below 30`` on
+SOL 15m or ``price crosses above bb_upper`` on BTC 1h. Conditions are
+compiled into an AlertIndex keyed by (symbol, scope, field), where scope is
+'tick' for ticker fields and the candle interval for indicator fields.
+Constant thresholds sit in sorted arrays per key, so an update only bisects
+the range between the old and new value of the fields that changed; symbols
+without alerts cost one dict lookup. Conditions against another field
+(price vs bb_upper) are few and are checked when either side changes.
+
+Alerts are stored in SQLite (ALERTS_DB) by the Flask API and loaded by the
+WebSocket ingestion node, which evaluates them and pushes fired alerts to
+the owner's WebSocket connections. Owners are plain names the client
+chooses; there is no authentication yet, so anyone naming an owner can list
+or watch their alerts.
+"""
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+
+ALERTS_DB = os.environ.get('ALERTS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'alerts.db'))
+
+TICKER_FIELDS = ('price', 'change_percent', 'volume')
+INDICATOR_FIELDS = ('rsi', 'macd', 'macd_signal', 'bb_upper', 'bb_middle', 'bb_lower', 'ema_12', 'ema_26',
+                    'sma_20', 'sma_50', 'stoch_k', 'stoch_d', 'atr')
+FIELDS = TICKER_FIELDS + INDICATOR_FIELDS
+ALERT_INTERVALS = ('1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d')
+
+# 'above'/'below' fire as soon as the condition holds (also right after
+# registration); 'crosses_*' need a value on the other side first
+OPERATORS = ('above', 'below', 'crosses_above', 'crosses_below')
+UPWARD = ('above', 'crosses_above')
+
+MAX_ALERTS_PER_OWNER = 500
+
+ALERTS_ACTIVE = metrics.gauge('alerts_active', 'Alerts held by the alert index')
+ALERTS_FIRED = metrics.counter('alerts_fired_total', 'Alerts fired by field', ('field',))
+ALERT_CHECK_SECONDS = metrics.histogram('alert_check_seconds', 'Time to check alerts for one update',
+                                        buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+
+alerts_bp = Blueprint('alerts', __name__)
+
+_CONDITION = re.compile(r'^\s*([a-z_0-9]+)\s+(crosses\s+above|crosses\s+below|above|below|>|<)\s+([a-z_0-9.+-]+)\s*$')
+_OPERATOR_WORDS = {'>': 'above', '<': 'below'}
+
+
+class AlertError(ValueError):
+    """Invalid alert definition"""
+
+
+def parse_condition(text):
+    """'rsi crosses below 30' -> ('rsi', 'crosses_below', 30.0, None); a field name as target is kept"""
+    match = _CONDITION.match(text.lower())
+    if match is None:
+        raise AlertError("Condition must look like '<field> <above|below|crosses above|crosses below> <number|field>'")
+    field, op, operand = match.groups()
+    op = _OPERATOR_WORDS.get(op, re.sub(r'\s+', '_', op))
+    try:
+        return field, op, float(operand), None
+    except ValueError:
+        return field, op, None, operand
+
+
+def field_scope(field, interval):
+    return 'tick' if field in TICKER_FIELDS else interval
+
+
+class Alert:
+    __slots__ = ('id', 'owner', 'symbol', 'interval', 'field', 'op', 'value', 'target', 'note', 'created_at')
+
+    def __init__(self, id, owner, symbol, interval, field, op, value=None, target=None, note=None, created_at=None):
+        self.id = id
+        self.owner = owner
+        self.symbol = symbol
+        self.interval = interval
+        self.field = field
+        self.op = op
+        self.value = value
+        self.target = target
+        self.note = note
+        self.created_at = created_at or time.time()
+
+    @classmethod
+    def create(cls, owner, symbol, field, op, value=None, target=None, interval='1h', note=None):
+        """Validated alert with a new id"""
+        if not owner:
+            raise AlertError("owner is required")
+        symbol = (symbol or '').upper()
+        if symbol.endswith('USDT') and len(symbol) > 4:
+            symbol = symbol[:-4]
+        if not symbol.isalnum():
+            raise AlertError("symbol is required, e.g. BTC")
+        if field not in FIELDS:
+            raise AlertError(f"Unknown field '{field}'")
+        if op not in OPERATORS:
+            raise AlertError(f"Unknown operator '{op}'")
+        if interval not in ALERT_INTERVALS:
+            raise AlertError(f"Unsupported interval '{interval}'")
+        if (value is None) == (target is None):
+            raise AlertError("Give either a numeric value or a target field")
+        if target is not None and (target not in FIELDS or target == field):
+            raise AlertError(f"Unknown target field '{target}'")
+        return cls(uuid.uuid4().hex, str(owner), symbol, interval, field, op,
+                   float(value) if value is not None else None, target, note)
+
+    @property
+    def key(self):
+        return (self.symbol, field_scope(self.field, self.interval), self.field)
+
+    @property
+    def target_key(self):
+        return (self.symbol, field_scope(self.target, self.interval), self.target)
+
+    def describe(self):
+        operand = self.target if self.target is not None else f"{self.value:g}"
+        return f"{self.symbol} {self.interval} {self.field} {self.op.replace('_', ' ')} {operand}"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ThresholdBook:
+    """Constant-threshold alerts of one key, sorted by threshold and split by direction"""
+
+    __slots__ = ('up_values', 'up_ids', 'down_values', 'down_ids', 'dead')
+
+    def __init__(self):
+        self.up_values, self.up_ids = [], []
+        self.down_values, self.down_ids = [], []
+        self.dead = 0
+
+    def add(self, alert):
+        values, ids = (self.up_values, self.up_ids) if alert.op in UPWARD else (self.down_values, self.down_ids)
+        index = bisect_right(values, alert.value)
+        values.insert(index, alert.value)
+        ids.insert(index, alert.id)
+
+    def bulk_load(self, alerts):
+        up = sorted((a.value, a.id) for a in alerts if a.op in UPWARD)
+        down = sorted((a.value, a.id) for a in alerts if a.op not in UPWARD)
+        self.up_values, self.up_ids = [v for v, _ in up], [i for _, i in up]
+        self.down_values, self.down_ids = [v for v, _ in down], [i for _, i in down]
+
+    def __len__(self):
+        return len(self.up_ids) + len(self.down_ids) - self.dead
+
+    def crossed(self, old, new):
+        """Ids whose threshold lies between old and new in the direction of the move"""
+        if old is None or new == old:
+            return []
+        if new > old:
+            # Moved up through t: old <= t < new
+            return self.up_ids[bisect_left(self.up_values, old):bisect_left(self.up_values, new)]
+        # Moved down through t: new < t <= old
+        return self.down_ids[bisect_right(self.down_values, new):bisect_right(self.down_values, old)]
+
+    def holding(self, value):
+        """Ids whose 'above'/'below' condition already holds at value"""
+        return (self.up_ids[:bisect_left(self.up_values, value)]
+                + self.down_ids[bisect_right(self.down_values, value):])
+
+    def compact(self, alive):
+        pairs_up = [(v, i) for v, i in zip(self.up_values, self.up_ids) if i in alive]
+        pairs_down = [(v, i) for v, i in zip(self.down_values, self.down_ids) if i in alive]
+        self.up_values, self.up_ids = [v for v, _ in pairs_up], [i for _, i in pairs_up]
+        self.down_values, self.down_ids = [v for v, _ in pairs_down], [i for _, i in pairs_down]
+        self.dead = 0
+
+
+class AlertIndex:
+    """Active alerts compiled for per-update checks"""
+
+    def __init__(self):
+        self.alerts = {}      # id -> Alert
+        self.books = {}       # key -> ThresholdBook
+        self.relative = {}    # key -> ids of field-vs-field alerts reading that key
+        self.values = {}      # key -> latest value
+        self.scopes = {}      # scope -> {symbol: alert count}, drives what the feed fetches
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def _track(self, alert, delta):
+        for key in (alert.key,) if alert.target is None else (alert.key, alert.target_key):
+            symbol, scope, _ = key
+            counts = self.scopes.setdefault(scope, {})
+            counts[symbol] = counts.get(symbol, 0) + delta
+            if counts[symbol] <= 0:
+                del counts[symbol]
+                if not counts:
+                    del self.scopes[scope]
+
+    def symbols(self, scope):
+        """Symbols with alerts reading fields of a scope ('tick' or an interval)"""
+        return list(self.scopes.get(scope, ()))
+
+    def load(self, alerts):
+        """Replace the index with alerts, building every book with one sort"""
+        self.__init__()
+        grouped = {}
+        for alert in alerts:
+            self.alerts[alert.id] = alert
+            self._track(alert, 1)
+            if alert.target is None:
+                grouped.setdefault(alert.key, []).append(alert)
+            else:
+                self.relative.setdefault(alert.key, set()).add(alert.id)
+                self.relative.setdefault(alert.target_key, set()).add(alert.id)
+        for key, group in grouped.items():
+            book = self.books[key] = ThresholdBook()
+            book.bulk_load(group)
+        ALERTS_ACTIVE.set(len(self.alerts))
+
+    def add(self, alert):
+        """Index an alert; returns it right away if its level condition already holds"""
+        self.alerts[alert.id] = alert
+        self._track(alert, 1)
+        if alert.target is None:
+            self.books.setdefault(alert.key, ThresholdBook()).add(alert)
+        else:
+            self.relative.setdefault(alert.key, set()).add(alert.id)
+            self.relative.setdefault(alert.target_key, set()).add(alert.id)
+        ALERTS_ACTIVE.set(len(self.alerts))
+        if alert.op in ('above', 'below') and self._holds(alert):
+            self.remove(alert.id)
+            return alert
+        return None
+
+    def remove(self, alert_id):
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        self._track(alert, -1)
+        if alert.target is None:
+            book = self.books.get(alert.key)
+            if book is not None:
+                book.dead += 1  # dropped lazily; see _maybe_compact
+                self._maybe_compact(alert.key, book)
+        else:
+            for key in (alert.key, alert.target_key):
+                ids = self.relative.get(key)
+                if ids is not None:
+                    ids.discard(alert_id)
+                    if not ids:
+                        del self.relative[key]
+        ALERTS_ACTIVE.set(len(self.alerts))
+        return alert
+
+    def _maybe_compact(self, key, book):
+        total = len(book.up_ids) + len(book.down_ids)
+        if book.dead >= total:
+            del self.books[key]
+        elif book.dead > 64 and book.dead * 2 > total:
+            book.compact(self.alerts)
+
+    def _holds(self, alert, previous=None):
+        value = self.values.get(alert.key)
+        reference = alert.value if alert.target is None else self.values.get(alert.target_key)
+        if value is None or reference is None:
+            return False
+        if alert.op == 'above':
+            return value > reference
+        if alert.op == 'below':
+            return value < reference
+        if previous is None:
+            return False
+        before, before_reference = previous
+        if before is None or before_reference is None:
+            return False
+        if alert.op == 'crosses_above':
+            return before <= before_reference and value > reference
+        return before >= before_reference and value < reference
+
+    def update(self, symbol, scope, values):
+        """Apply new field values of a symbol ('tick' or interval scope); returns fired alerts"""
+        if not self.alerts:
+            return []
+        started = time.perf_counter()
+        fired_ids = []
+        relative_ids = set()
+        previous = {}
+        for field, new in values.items():
+            if new is None:
+                continue
+            key = (symbol, scope, field)
+            old = self.values.get(key)
+            previous[key] = old
+            self.values[key] = new
+            book = self.books.get(key)
+            if book is not None:
+                fired_ids.extend(book.crossed(old, new))
+                if old is None:
+                    fired_ids.extend(i for i in book.holding(new)
+                                     if i in self.alerts and self.alerts[i].op in ('above', 'below'))
+            ids = self.relative.get(key)
+            if ids:
+                relative_ids.update(ids)
+
+        fired = []
+        for alert_id in dict.fromkeys(fired_ids):
+            alert = self.remove(alert_id)
+            if alert is not None:
+                fired.append(alert)
+        for alert_id in relative_ids:
+            alert = self.alerts.get(alert_id)
+            if alert is None:
+                continue
+            before = (previous.get(alert.key, self.values.get(alert.key)),
+                      previous.get(alert.target_key, self.values.get(alert.target_key)))
+            if self._holds(alert, before):
+                fired.append(self.remove(alert_id))
+        for alert in fired:
+            ALERTS_FIRED.inc(field=alert.field)
+        ALERT_CHECK_SECONDS.observe(time.perf_counter() - started)
+        return fired
+
+
+class AlertStore:
+    """Registered alerts in SQLite; every call uses its own connection"""
+
+    def __init__(self, path=ALERTS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS alerts (
+                    rowid INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT UNIQUE NOT NULL,
+                    owner TEXT NOT NULL,
+                    definition TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    created_at REAL NOT NULL,
+                    fired_at REAL,
+                    fired_value REAL,
+                    updated_at REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS alerts_owner ON alerts (owner, status)")
+            db.execute("CREATE INDEX IF NOT EXISTS alerts_updated ON alerts (updated_at)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _row(row):
+        data = json.loads(row['definition'])
+        data.update(status=row['status'], fired_at=row['fired_at'], fired_value=row['fired_value'])
+        return data
+
+    def add(self, alert):
+        with self._connect() as db:
+            active = db.execute("SELECT COUNT(*) FROM alerts WHERE owner = ? AND status = 'active'",
+                                (alert.owner,)).fetchone()[0]
+            if active >= MAX_ALERTS_PER_OWNER:
+                raise AlertError(f"At most {MAX_ALERTS_PER_OWNER} active alerts per owner")
+            db.execute("INSERT INTO alerts (id, owner, definition, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                       (alert.id, alert.owner, json.dumps(alert.to_dict()), alert.created_at, time.time()))
+
+    def get(self, alert_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def for_owner(self, owner, include_inactive=False):
+        query = "SELECT * FROM alerts WHERE owner = ?" + ("" if include_inactive else " AND status = 'active'")
+        with self._connect() as db:
+            return [self._row(row) for row in db.execute(query + " ORDER BY created_at", (owner,))]
+
+    def delete(self, alert_id, owner):
+        with self._connect() as db:
+            return db.execute("UPDATE alerts SET status = 'deleted', updated_at = ? "
+                              "WHERE id = ? AND owner = ? AND status = 'active'",
+                              (time.time(), alert_id, owner)).rowcount > 0
+
+    def mark_fired(self, fired):
+        """fired: [(alert, value)]"""
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("UPDATE alerts SET status = 'fired', fired_at = ?, fired_value = ?, updated_at = ? "
+                           "WHERE id = ? AND status = 'active'",
+                           [(now, value, now, alert.id) for alert, value in fired])
+
+    def changes_since(self, since):
+        """(alerts to index, ids to drop, cursor) for rows updated after `since`"""
+        with self._connect() as db:
+            rows = db.execute("SELECT id, definition, status, updated_at FROM alerts WHERE updated_at > ? "
+                              "ORDER BY updated_at", (since,)).fetchall()
+        added, removed = [], []
+        cursor = since
+        for row in rows:
+            cursor = max(cursor, row['updated_at'])
+            if row['status'] == 'active':
+                added.append(Alert(**json.loads(row['definition'])))
+            else:
+                removed.append(row['id'])
+        return added, removed, cursor
+
+    def active(self):
+        with self._connect() as db:
+            cursor = db.execute("SELECT MAX(updated_at) FROM alerts").fetchone()[0] or 0.0
+            rows = db.execute("SELECT definition FROM alerts WHERE status = 'active'")
+            return [Alert(**json.loads(row['definition'])) for row in rows], cursor
+
+
+class AlertEngine:
+    """AlertIndex kept in sync with the store, for the node that sees market updates.
+
+    fetch() only reads the store and may run in a worker thread; the first
+    one also builds the full index there, so the thread owning the index only
+    swaps it in. apply() and update() touch the index and must run on that
+    thread.
+    """
+
+    # Fired alerts are not re-indexed from rows whose status write is still pending
+    FIRED_MEMORY = 300
+
+    def __init__(self, store):
+        self.store = store
+        self.index = AlertIndex()
+        self.cursor = None
+        self.recently_fired = {}
+
+    def fetch(self):
+        if self.cursor is None:
+            alerts, cursor = self.store.active()
+            index = AlertIndex()
+            index.load(alerts)  # seconds at a million alerts: kept off the event loop
+            return True, index, [], cursor
+        # Re-read the last second: writers in other processes commit slightly out of order
+        added, removed, cursor = self.store.changes_since(self.cursor - 1.0)
+        return False, added, removed, cursor
+
+    def apply(self, changes):
+        """Apply fetched changes; returns alerts whose level condition held on registration"""
+        full, added, removed, cursor = changes
+        self.cursor = max(cursor, self.cursor or 0.0)
+        if full:
+            added.values = self.index.values  # market values seen while it was being built
+            self.index = added
+            return []
+        now = time.time()
+        self.recently_fired = {i: t for i, t in self.recently_fired.items() if now - t < self.FIRED_MEMORY}
+        for alert_id in removed:
+            self.index.remove(alert_id)
+        fired = []
+        for alert in added:
+            if alert.id in self.index.alerts or alert.id in self.recently_fired:
+                continue
+            hit = self.index.add(alert)
+            if hit is not None:
+                fired.append(hit)
+        self._remember(fired)
+        return fired
+
+    def sync(self):
+        return self.apply(self.fetch())
+
+    def update(self, symbol, scope, values):
+        fired = self.index.update(symbol, scope, values)
+        self._remember(fired)
+        return fired
+
+    def _remember(self, fired):
+        now = time.time()
+        for alert in fired:
+            self.recently_fired[alert.id] = now
+
+    def value_of(self, alert):
+        return self.index.values.get(alert.key)
+
+
+def fired_payload(alert, value):
+    return dict(alert.to_dict(), message=f"{alert.describe()} (now {value:g})", value=value, fired_at=time.time())
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = AlertStore()
+    return _store
+
+
+def request_owner():
+    return request.headers.get('X-Alert-Owner') or request.args.get('owner') or (request.get_json(silent=True) or {}).get('owner')
+
+
+@alerts_bp.route('/alerts', methods=['POST'])
+def create_alert():
+    """Register an alert: {"owner", "symbol", "interval", "condition": "rsi crosses below 30"}
+    or with "field", "op" and "value"/"target" instead of "condition"."""
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('condition'):
+            field, op, value, target = parse_condition(data['condition'])
+        else:
+            field, op, value, target = data.get('field'), data.get('op'), data.get('value'), data.get('target')
+        alert = Alert.create(request_owner(), data.get('symbol'), field, op, value=value, target=target,
+                             interval=data.get('interval', '1h'), note=data.get('note'))
+        get_store().add(alert)
+        return jsonify({"success": True, "data": dict(alert.to_dict(), status='active',
+                                                      description=alert.describe())}), 201
+    except (AlertError, TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@alerts_bp.route('/alerts', methods=['GET'])
+def list_alerts():
+    owner = request_owner()
+    if not owner:
+        return jsonify({"success": False, "error": "owner is required"}), 400
+    include_inactive = request.args.get('all') == '1'
+    return jsonify({"success": True, "data": get_store().for_owner(owner, include_inactive)})
+
+
+@alerts_bp.route('/alerts/<alert_id>', methods=['DELETE'])
+def delete_alert(alert_id):
+    if not get_store().delete(alert_id, request_owner()):
+        return jsonify({"success": False, "error": "Alert not found"}), 404
+    return jsonify({"success": True})
@@ -0,0 +1,178 @@
+"""Pub/sub backplane between the ingestion node and the WebSocket edge nodes.
+
+One ingestion node polls Binance and publishes market messages; any number
+of stateless edge nodes subscribe and fan them out to their own clients.
+The backplane keeps the latest message per topic so a node that joins (or
+rejoins after a drop) starts from the current snapshot instead of waiting
+for the next update.
+
+InMemoryBackplane serves a single process (standalone mode and tests).
+SocketBackplane links processes over TCP with newline-delimited JSON
+frames: the ingestion node listens, edges connect and reconnect on their own.
+"""
+import asyncio
+import json
+
+import metrics
+
+BACKPLANE_MESSAGES = metrics.counter('backplane_messages_total', 'Backplane frames by direction', ('direction',))
+BACKPLANE_PEERS = metrics.gauge('backplane_peers', 'Edge nodes connected to the ingestion node')
+
+# An edge whose unsent frames exceed this is dropped; it resyncs from the snapshot
+MAX_PEER_BUFFER = 4 * 1024 * 1024
+
+
+class Backplane:
+    """Interface: publish(topic, data), subscribe(handler) and snapshot()"""
+
+    def __init__(self):
+        self.state = {}  # topic -> latest data
+        self.handlers = []
+
+    async def start(self):
+        return self
+
+    async def close(self):
+        pass
+
+    def subscribe(self, handler):
+        """Register ``async handler(topic, data)``; it is replayed the current snapshot first"""
+        self.handlers.append(handler)
+        for topic, data in self.snapshot().items():
+            asyncio.ensure_future(handler(topic, data))
+
+    def snapshot(self):
+        return dict(self.state)
+
+    async def publish(self, topic, data):
+        raise NotImplementedError
+
+    async def deliver(self, topic, data):
+        """Record the latest data of a topic and hand it to the local handlers"""
+        self.state[topic] = data
+        for handler in list(self.handlers):
+            try:
+                await handler(topic, data)
+            except Exception as e:
+                print(f"Backplane handler error ({topic}): {e}")
+
+
+class InMemoryBackplane(Backplane):
+    """Publisher and subscribers in one process"""
+
+    async def publish(self, topic, data):
+        BACKPLANE_MESSAGES.inc(direction='out')
+        await self.deliver(topic, data)
+
+
+def encode_frame(topic, data):
+    return json.dumps({'topic': topic, 'data': data}, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class SocketBackplane(Backplane):
+    """TCP backplane; role 'publisher' listens on host:port, role 'subscriber' connects to it"""
+
+    def __init__(self, host='127.0.0.1', port=8766, role='subscriber', reconnect_delay=1.0, max_reconnect_delay=30.0):
+        super().__init__()
+        if role not in ('publisher', 'subscriber'):
+            raise ValueError("role must be 'publisher' or 'subscriber'")
+        self.host = host
+        self.port = port
+        self.role = role
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.peers = set()
+        self.connected = asyncio.Event()
+        self._server = None
+        self._task = None
+
+    async def start(self):
+        if self.role == 'publisher':
+            self._server = await asyncio.start_server(self._serve_peer, self.host, self.port)
+            BACKPLANE_PEERS.set_function(lambda: len(self.peers))
+        else:
+            self._task = asyncio.create_task(self._subscribe_loop())
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self.peers):
+                writer.close()
+            await self._server.wait_closed()
+        if self._task is not None:
+            self._task.cancel()
+
+    # Publisher side
+
+    async def _serve_peer(self, reader, writer):
+        # Snapshot first, then live frames; both go through the same writer
+        for topic, data in self.snapshot().items():
+            writer.write(encode_frame(topic, data))
+        self.peers.add(writer)
+        print(f"Backplane peer joined. Total peers: {len(self.peers)}")
+        try:
+            await reader.read()  # edges never send; returns when they disconnect
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.peers.discard(writer)
+            writer.close()
+            print(f"Backplane peer left. Total peers: {len(self.peers)}")
+
+    async def publish(self, topic, data):
+        if self.role != 'publisher':
+            raise RuntimeError("Only the publisher node publishes to the backplane")
+        frame = encode_frame(topic, data)
+        for writer in list(self.peers):
+            if writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+                print("Dropping slow backplane peer")
+                self.peers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+        BACKPLANE_MESSAGES.inc(direction='out')
+        await self.deliver(topic, data)  # an ingestion node can serve clients too
+
+    # Subscriber side
+
+    async def _subscribe_loop(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_PEER_BUFFER)
+                print(f"Connected to backplane at {self.host}:{self.port}")
+                self.connected.set()
+                delay = self.reconnect_delay
+                try:
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        frame = json.loads(line)
+                        BACKPLANE_MESSAGES.inc(direction='in')
+                        await self.deliver(frame['topic'], frame['data'])
+                finally:
+                    self.connected.clear()
+                    writer.close()
+                print("Backplane connection closed, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Backplane connection error: {e}")
+            await asyncio.sleep(delay)
+            delay = min(self.max_reconnect_delay, delay * 2)
+
+
+def from_env(environ):
+    """Backplane for a WebSocket node from WS_ROLE / BACKPLANE_HOST / BACKPLANE_PORT"""
+    role = environ.get('WS_ROLE', 'standalone')
+    if role == 'standalone':
+        return InMemoryBackplane()
+    host = environ.get('BACKPLANE_HOST', '127.0.0.1' if role == 'edge' else '0.0.0.0')
+    port = int(environ.get('BACKPLANE_PORT', '8766'))
+    if role == 'ingest':
+        return SocketBackplane(host, port, role='publisher')
+    if role == 'edge':
+        return SocketBackplane(host, port, role='subscriber')
+    raise ValueError(f"Unknown WS_ROLE '{role}'")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Benchmark the NumPy indicator path against the pandas/ta path.
+
+Checks every kernel in indicators.py against the matching ``ta`` indicator
+class on synthetic klines, then times the full kline -> indicators step of
+/technical-analysis both ways:
+
+    python bench_indicators.py --candles 200 --iterations 200
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from ta import add_all_ta_features
+from ta.momentum import RSIIndicator, StochasticOscillator
+from ta.trend import EMAIndicator, MACD, SMAIndicator
+from ta.utils import dropna
+from ta.volatility import AverageTrueRange, BollingerBands
+from ta.volume import VolumeWeightedAveragePrice
+
+import indicators
+
+
+def synthetic_klines(count, seed=1):
+    """Random-walk klines formatted like the Binance API (prices as strings)"""
+    rng = random.Random(seed)
+    price = 30000.0
+    klines = []
+    open_time = 1700000000000
+    for _ in range(count):
+        open_price = price
+        price *= 1 + rng.gauss(0, 0.004)
+        high = max(open_price, price) * (1 + abs(rng.gauss(0, 0.002)))
+        low = min(open_price, price) * (1 - abs(rng.gauss(0, 0.002)))
+        volume = rng.uniform(10, 500)
+        klines.append([
+            open_time, f"{open_price:.2f}", f"{high:.2f}", f"{low:.2f}", f"{price:.2f}",
+            f"{volume:.5f}", open_time + 3599999, f"{volume * price:.2f}", rng.randint(100, 5000),
+            f"{volume / 2:.5f}", f"{volume * price / 2:.2f}", "0"
+        ])
+        open_time += 3600000
+    return klines
+
+
+def pandas_path(klines):
+    """The kline -> indicators step as done with pandas and add_all_ta_features"""
+    df = pd.DataFrame(klines, columns=[
+        'timestamp', 'open', 'high', 'low', 'close', 'volume',
+        'close_time', 'quote_asset_volume', 'number_of_trades',
+        'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
+    ])
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col])
+    df = dropna(df)
+    df = add_all_ta_features(df, open="open", high="high", low="low", close="close", volume="volume")
+    latest = df.iloc[-1]
+    return {column: latest.get(column) for column in (
+        'momentum_rsi', 'trend_macd', 'trend_macd_signal', 'volatility_bbh', 'volatility_bbm',
+        'volatility_bbl', 'trend_ema_fast', 'trend_ema_slow', 'trend_sma_fast', 'trend_sma_slow',
+        'volume_sma_em', 'momentum_stoch', 'momentum_stoch_signal', 'close'
+    )}
+
+
+def numpy_path(klines):
+    return indicators.technical_indicators(indicators.parse_klines(klines))
+
+
+def parity(klines):
+    """Maximum relative error of every kernel against its ta counterpart"""
+    data = indicators.parse_klines(klines)
+    close, high, low, volume = (pd.Series(data[c]) for c in ('close', 'high', 'low', 'volume'))
+    macd_line, macd_signal, _ = indicators.macd(data['close'])
+    bb_upper, bb_middle, bb_lower = indicators.bollinger_bands(data['close'])
+    stoch_k, stoch_d = indicators.stochastic(data['high'], data['low'], data['close'])
+    ta_macd = MACD(close)
+    ta_bb = BollingerBands(close)
+    ta_stoch = StochasticOscillator(high, low, close)
+    ta_atr = AverageTrueRange(high, low, close).average_true_range().to_numpy(copy=True)
+    ta_atr[:13] = np.nan  # ta reports zeros during warm-up
+
+    pairs = {
+        'rsi': (indicators.rsi(data['close']), RSIIndicator(close).rsi()),
+        'macd': (macd_line, ta_macd.macd()),
+        'macd_signal': (macd_signal, ta_macd.macd_signal()),
+        'bb_upper': (bb_upper, ta_bb.bollinger_hband()),
+        'bb_middle': (bb_middle, ta_bb.bollinger_mavg()),
+        'bb_lower': (bb_lower, ta_bb.bollinger_lband()),
+        'sma_20': (indicators.sma(data['close'], 20), SMAIndicator(close, 20).sma_indicator()),
+        'sma_50': (indicators.sma(data['close'], 50), SMAIndicator(close, 50).sma_indicator()),
+        'volume_sma': (indicators.sma(data['volume'], 20), SMAIndicator(volume, 20).sma_indicator()),
+        'stoch_k': (stoch_k, ta_stoch.stoch()),
+        'stoch_d': (stoch_d, ta_stoch.stoch_signal()),
+        'vwap': (indicators.vwap(data['high'], data['low'], data['close'], data['volume']),
+                 VolumeWeightedAveragePrice(high, low, close, volume).volume_weighted_average_price()),
+        'atr': (indicators.atr(data['high'], data['low'], data['close']), ta_atr)
+    }
+    for window in (12, 26) + indicators.EMA_WINDOWS:
+        pairs[f'ema_{window}'] = (indicators.ema(data['close'], window),
+                                  EMAIndicator(close, window).ema_indicator())
+
+    report = {}
+    for name, (ours, theirs) in pairs.items():
+        theirs = np.asarray(theirs, dtype=np.float64)
+        if not np.array_equal(np.isnan(ours), np.isnan(theirs)):
+            report[name] = {'max_rel_error': None, 'nan_mismatch': True}
+            continue
+        valid = ~np.isnan(theirs)
+        if not valid.any():
+            report[name] = {'max_rel_error': 0.0, 'nan_mismatch': False}
+            continue
+        scale = np.maximum(np.abs(theirs[valid]), 1e-12)
+        report[name] = {
+            'max_rel_error': float(np.max(np.abs(ours[valid] - theirs[valid]) / scale)),
+            'nan_mismatch': False
+        }
+    return report
+
+
+def time_call(function, klines, iterations):
+    function(klines)  # warm up
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function(klines)
+        samples.append(time.perf_counter() - started)
+    return {
+        'mean_ms': round(statistics.mean(samples) * 1000, 4),
+        'p50_ms': round(statistics.median(samples) * 1000, 4),
+        'min_ms': round(min(samples) * 1000, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NumPy indicators against pandas/ta")
+    parser.add_argument('--candles', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    klines = synthetic_klines(args.candles)
+
+    checks = parity(klines)
+    failures = [name for name, check in checks.items()
+                if check['nan_mismatch'] or check['max_rel_error'] > args.tolerance]
+    print(f"{'indicator':14} {'max rel error':>14}")
+    for name, check in checks.items():
+        error = 'NaN mismatch' if check['nan_mismatch'] else f"{check['max_rel_error']:.2e}"
+        print(f"{name:14} {error:>14}")
+
+    pandas_timing = time_call(pandas_path, klines, args.iterations)
+    numpy_timing = time_call(numpy_path, klines, args.iterations)
+    speedup = pandas_timing['mean_ms'] / numpy_timing['mean_ms']
+    print(f"\n{args.candles} candles, {args.iterations} iterations")
+    print(f"pandas + ta : {pandas_timing}")
+    print(f"numpy       : {numpy_timing}")
+    print(f"speedup     : {speedup:.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'candles': args.candles, 'iterations': args.iterations, 'parity': checks,
+                       'pandas': pandas_timing, 'numpy': numpy_timing, 'speedup': speedup}, f, indent=2)
+
+    if failures:
+        print(f"\nOutside tolerance {args.tolerance}: {', '.join(failures)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark order book queries while the book is being updated.
+
+A writer thread applies simulated depth diffs at --rate events per second
+while the main thread times the calculator's queries (slippage both ways,
+walls, summary):
+
+    python bench_orderbook.py --rate 200 --queries 5000
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import orderbook
+
+
+def writer(book, source, rate, stop, applied):
+    interval = 1.0 / rate
+    while not stop.is_set():
+        book.apply_diff(source.next_event(book.symbol))
+        applied[0] += 1
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark order book queries under updates")
+    parser.add_argument('--rate', type=int, default=200, help="diff events per second")
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--levels', type=int, default=1000, help="levels per side of the simulated book")
+    args = parser.parse_args()
+
+    source = orderbook.SimulatedDepthSource(levels=args.levels, seed=1)
+    book = orderbook.OrderBook('BTCUSDT')
+    book.load_snapshot(source.snapshot('BTCUSDT'))
+
+    stop = threading.Event()
+    applied = [0]
+    thread = threading.Thread(target=writer, args=(book, source, args.rate, stop, applied), daemon=True)
+    thread.start()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        query_started = time.perf_counter()
+        book.slippage('buy', 25)
+        book.slippage('sell', 25)
+        book.walls()
+        book.summary()
+        samples.append(time.perf_counter() - query_started)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+
+    samples.sort()
+    print(json.dumps({
+        'levels_per_side': {'bids': len(book.bids), 'asks': len(book.asks)},
+        'updates_applied': applied[0],
+        'updates_per_second': round(applied[0] / elapsed, 1),
+        'query_mean_ms': round(statistics.mean(samples) * 1000, 4),
+        'query_p50_ms': round(samples[len(samples) // 2] * 1000, 4),
+        'query_p99_ms': round(samples[int(len(samples) * 0.99)] * 1000, 4)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark prediction scoring throughput on one core.
+
+Times the rule scorer and the tree model at several batch sizes, using
+the trained model at MODEL_PATH or, without one, a model of the same
+shape fitted to synthetic features:
+
+    python bench_scoring.py --batches 1,8,64,512 --seconds 2
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import indicators
+import scoring
+import train_model
+from bench_indicators import synthetic_klines
+
+
+def sample_rows(count):
+    """Prediction inputs from synthetic klines at different points of one random walk"""
+    klines = synthetic_klines(count + 200, seed=3)
+    rows = []
+    for end in range(200, 200 + count):
+        data = indicators.parse_klines(klines[end - 200:end])
+        rows.append({'indicators': indicators.technical_indicators(data), 'fear_greed': 50, 'news_sentiment': None})
+    return rows
+
+
+def load_model(rounds, depth):
+    if os.path.exists(scoring.MODEL_PATH):
+        return scoring.TreeModel.load(scoring.MODEL_PATH), scoring.MODEL_PATH
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, len(scoring.FEATURES)))
+    y = np.digitize(X[:, 0] + 0.5 * X[:, 3], [-0.8, 0.8])
+    return train_model.train(X, y, rounds, depth, 0.1, 64), 'synthetic'
+
+
+def throughput(function, rows, batch, seconds):
+    """Rows per second scoring `rows` in batches of `batch` for about `seconds`"""
+    batches = [rows[i:i + batch] for i in range(0, len(rows) - batch + 1, batch)] or [rows[:batch]]
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for chunk in batches:
+            function(chunk)
+            done += len(chunk)
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prediction scoring throughput per core")
+    parser.add_argument('--batches', default='1,8,64,512')
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--rounds', type=int, default=60, help="rounds of the synthetic model")
+    parser.add_argument('--depth', type=int, default=4, help="depth of the synthetic model")
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batches.split(',')]
+    rows = sample_rows(max(batch_sizes) * 2)
+    model, source = load_model(args.rounds, args.depth)
+    X = scoring.batch_features([row['indicators'] for row in rows])
+    rule_scorer = scoring.RuleScorer()
+    model_scorer = scoring.ModelScorer(model)
+
+    report = {'model': source, 'trees': len(model.feature), 'depth': model.depth, 'rows_per_second': {}}
+    for batch in batch_sizes:
+        report['rows_per_second'][batch] = {
+            'rules': round(throughput(rule_scorer.score, rows, batch, args.seconds)),
+            'model_only': round(throughput(lambda chunk: model.predict_proba(X[:len(chunk)]), rows, batch, args.seconds)),
+            'model_scorer': round(throughput(model_scorer.score, rows, batch, args.seconds))
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Local candle history in append-only fixed-record files.
+
+Closed candles of each (symbol, interval) live in
+database/candles/<SYMBOL>/<interval>.bin as packed CANDLE_DTYPE records in
+open_time order. Reads memory-map the file and binary-search open_time,
+so any range is a zero-copy NumPy slice however long the history; the
+model trainer, the export endpoint and chart downsampling all read from
+here. Readers only ever see whole records.
+
+The CLI creates a series and backfills it; after that the app's primary
+worker (start_sync, from main.start_services) appends every stored series'
+candles as they close. Appends hold an flock on the file, so the CLI and
+the app never append the same candles twice.
+
+    python candle_store.py sync BTCUSDT ETHUSDT --interval 1h --days 365
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import upstream
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+CANDLE_DIR = os.environ.get('CANDLE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'candles'))
+BINANCE_KLINES_URL = "https://api.binance.com/api/v3/klines"
+# Klines per Binance request while syncing
+SYNC_PAGE = 1000
+# Seconds after a candle closes before the scheduled sync fetches it
+SYNC_OFFSET = 5.0
+
+CANDLE_DTYPE = np.dtype([
+    ('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('volume', '<f8'), ('quote_volume', '<f8'), ('trades', '<i8')
+])
+
+INTERVAL_MS = {
+    '1m': 60000, '3m': 180000, '5m': 300000, '15m': 900000, '30m': 1800000, '1h': 3600000,
+    '2h': 7200000, '4h': 14400000, '6h': 21600000, '8h': 28800000, '12h': 43200000,
+    '1d': 86400000, '3d': 259200000, '1w': 604800000
+}
+
+EMPTY = np.empty(0, dtype=CANDLE_DTYPE)
+
+
+def rows_from_klines(klines):
+    """Binance klines arrays -> CANDLE_DTYPE records"""
+    rows = np.empty(len(klines), dtype=CANDLE_DTYPE)
+    for i, k in enumerate(klines):
+        rows[i] = (k[0], k[1], k[2], k[3], k[4], k[5], k[7], k[8])
+    return rows
+
+
+def to_klines(rows, interval, last_open_times=None):
+    """CANDLE_DTYPE records -> Binance klines arrays, as /klines serves them.
+
+    Rows that merge several candles pass the open_time of their last one
+    so the close time spans the whole row.
+    """
+    interval_ms = INTERVAL_MS[interval]
+    if last_open_times is None:
+        last_open_times = rows['open_time']
+    return [[int(r['open_time']), repr(float(r['open'])), repr(float(r['high'])), repr(float(r['low'])),
+             repr(float(r['close'])), repr(float(r['volume'])), int(last) + interval_ms - 1,
+             repr(float(r['quote_volume'])), int(r['trades']), '0', '0', '0'] for r, last in zip(rows, last_open_times)]
+
+
+def parse_time(value):
+    """Epoch milliseconds or an ISO date/datetime (UTC unless it says otherwise) -> ms"""
+    if value is None or value == '':
+        return None
+    if value.lstrip('-').isdigit():
+        return int(value)
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Unrecognised time '{value}', use epoch ms or an ISO date") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+class CandleStore:
+    def __init__(self, root=CANDLE_DIR):
+        self.root = root
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def path(self, symbol, interval):
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"Unknown interval '{interval}'")
+        symbol = symbol.upper()
+        if not symbol.isalnum():
+            raise ValueError(f"Invalid symbol '{symbol}'")
+        return os.path.join(self.root, symbol, f"{interval}.bin")
+
+    def series(self):
+        """(symbol, interval) pairs with stored candles"""
+        found = []
+        if os.path.isdir(self.root):
+            for symbol in sorted(os.listdir(self.root)):
+                for name in sorted(os.listdir(os.path.join(self.root, symbol))):
+                    if name.endswith('.bin'):
+                        found.append((symbol, name[:-4]))
+        return found
+
+    def count(self, symbol, interval):
+        try:
+            return os.path.getsize(self.path(symbol, interval)) // CANDLE_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def all(self, symbol, interval):
+        """Every stored candle as a read-only memory map"""
+        count = self.count(symbol, interval)
+        if not count:
+            return EMPTY
+        return np.memmap(self.path(symbol, interval), dtype=CANDLE_DTYPE, mode='r', shape=(count,))
+
+    def bounds(self, candles, start=None, end=None):
+        """Index range of candles opening in [start, end) (ms)"""
+        times = candles['open_time']
+        lo = int(np.searchsorted(times, start)) if start is not None else 0
+        hi = int(np.searchsorted(times, end)) if end is not None else len(candles)
+        return lo, max(lo, hi)
+
+    def read(self, symbol, interval, start=None, end=None):
+        """Candles opening in [start, end) (ms) as a zero-copy slice"""
+        candles = self.all(symbol, interval)
+        lo, hi = self.bounds(candles, start, end)
+        return candles[lo:hi]
+
+    def last(self, symbol, interval, count):
+        """The latest `count` candles"""
+        return self.all(symbol, interval)[-count:]
+
+    def last_open_time(self, symbol, interval):
+        candles = self.all(symbol, interval)
+        return int(candles['open_time'][-1]) if len(candles) else None
+
+    def append(self, symbol, interval, klines):
+        """Store the closed klines newer than what is stored; returns how many were added"""
+        path = self.path(symbol, interval)
+        with self._lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        rows = rows_from_klines(klines)
+        rows = rows[rows['open_time'] + INTERVAL_MS[interval] <= time.time() * 1000]  # the open candle still changes
+        if not len(rows):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with lock, open(path, 'ab') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # another process may be appending; released on close
+            last = self.last_open_time(symbol, interval)
+            if last is not None:
+                rows = rows[rows['open_time'] > last]
+            if len(rows):
+                f.write(rows.tobytes())
+            return len(rows)
+
+    def sync(self, symbol, interval, days=30):
+        """Fetch closed candles from Binance since the last stored one (or `days` back)"""
+        symbol = symbol.upper()
+        last = self.last_open_time(symbol, interval)
+        start = last + INTERVAL_MS[interval] if last is not None else int((time.time() - days * 86400) * 1000)
+        added = 0
+        while True:
+            response = upstream.get(BINANCE_KLINES_URL, params={
+                'symbol': symbol, 'interval': interval, 'startTime': start, 'limit': SYNC_PAGE
+            }, timeout=10, stale_on_error=False)
+            if response.status_code != 200:
+                raise RuntimeError(f"klines for {symbol} returned {response.status_code}")
+            klines = response.json()
+            added += self.append(symbol, interval, klines)
+            if len(klines) < SYNC_PAGE:
+                return added
+            start = klines[-1][0] + INTERVAL_MS[interval]
+
+
+    def sync_interval(self, interval):
+        """Sync every stored series of an interval"""
+        for symbol, stored in self.series():
+            if stored == interval:
+                try:
+                    self.sync(symbol, interval)
+                except Exception as e:
+                    print(f"Candle sync error for {symbol} {interval}: {e}")
+
+
+_store = None
+_scheduler = None
+
+
+def get_store():
+    """Process-wide CandleStore for CANDLE_DIR"""
+    global _store
+    if _store is None:
+        _store = CandleStore()
+    return _store
+
+
+def start_sync():
+    """Append the closed candles of every stored series just after each close, in this process"""
+    global _scheduler
+    import scheduler
+    if _scheduler is None:
+        store = get_store()
+        _scheduler = scheduler.Scheduler()
+        for interval in INTERVAL_MS:
+            _scheduler.on_candle_close(f'candles_{interval}', lambda interval=interval: store.sync_interval(interval),
+                                       interval, offset=SYNC_OFFSET, blocking=True)
+        _scheduler.start_in_thread()
+    return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local candle history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync = commands.add_parser('sync', help="fetch closed candles from Binance")
+    sync.add_argument('symbols', nargs='+')
+    sync.add_argument('--interval', default='1h')
+    sync.add_argument('--days', type=float, default=30, help="history to fetch for a new series")
+    commands.add_parser('list', help="show stored series")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == 'sync':
+        for symbol in args.symbols:
+            added = store.sync(symbol, args.interval, args.days)
+            print(f"{symbol.upper()} {args.interval}: +{added} candles, {store.count(symbol, args.interval)} stored")
+    else:
+        for symbol, interval in store.series():
+            candles = store.all(symbol, interval)
+            print(f"{symbol} {interval}: {len(candles)} candles from {int(candles['open_time'][0])} "
+                  f"to {int(candles['open_time'][-1])}")
+
+
+if __name__ == '__main__':
+    main()
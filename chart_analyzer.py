@@ -0,0 +1,325 @@
+"""Chart screenshot analysis: OCR plus candle pattern detection.
+
+Uploads are streamed to a temporary file in fixed-size chunks while being
+hashed, so memory use stays flat however many arrive at once and oversized
+bodies are cut off as soon as they pass the limit. The CPU-bound analysis
+runs in a small process pool with a bounded queue; results are cached by
+the SHA-256 of the image, so re-uploading a screenshot costs only the hash.
+
+Decoding needs Pillow or OpenCV, OCR needs pytesseract (and the tesseract
+binary); both are optional and missing pieces are reported in the result.
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get('CHART_MAX_UPLOAD_MB', '8')) * 1024 * 1024)
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', str(min(2, os.cpu_count() or 1))))
+# Analyses allowed to run or wait per worker before uploads are turned away
+QUEUE_PER_WORKER = 2
+ANALYSIS_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+CACHE_SIZE = 512
+
+# Images are downscaled to at most this width before pattern detection
+MAX_ANALYSIS_WIDTH = 1600
+
+ANALYSES = metrics.counter('chart_analyses_total', 'Chart analyses by outcome', ('result',))
+ANALYSIS_SECONDS = metrics.histogram('chart_analysis_seconds', 'Time from upload to analysis result')
+
+SYMBOL_PATTERN = re.compile(r'\b([A-Z]{2,10})\s*/?\s*(USDT|BUSD|USDC|USD|BTC)\b')
+TIMEFRAME_PATTERN = re.compile(r'\b(1m|3m|5m|15m|30m|1h|2h|4h|6h|8h|12h|1d|1D|3d|1w|1W|1M)\b')
+
+
+class UploadTooLarge(ValueError):
+    """The upload is bigger than MAX_UPLOAD_BYTES"""
+
+
+class AnalyzerBusy(RuntimeError):
+    """Every worker is busy and the queue is full"""
+
+
+class DecoderMissing(Exception):
+    """Neither Pillow nor OpenCV is installed, so no image can be decoded"""
+
+
+def receive_upload(stream, limit=MAX_UPLOAD_BYTES):
+    """Copy an upload stream to a temporary file; returns (path, sha256 hex, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    handle = tempfile.NamedTemporaryFile(prefix='chart-', suffix='.img', delete=False)
+    try:
+        with handle:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(f"Upload exceeds the {limit} byte limit")
+                digest.update(chunk)
+                handle.write(chunk)
+    except BaseException:
+        os.unlink(handle.name)
+        raise
+    return handle.name, digest.hexdigest(), size
+
+
+def load_pixels(path):
+    """RGB uint8 array of an image file, downscaled for analysis"""
+    import numpy as np
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if Image is not None:
+        with Image.open(path) as image:
+            # Scale down before converting: convert() at full resolution copies the whole image.
+            # A JPEG is even decoded at a fraction of its size (draft is a no-op for other formats)
+            image.draft('RGB', (MAX_ANALYSIS_WIDTH, max(1, image.height * MAX_ANALYSIS_WIDTH // image.width)))
+            if image.mode in ('P', '1'):
+                image = image.convert('RGB')  # these modes only resize with nearest neighbour
+            if image.width > MAX_ANALYSIS_WIDTH:
+                image.thumbnail((MAX_ANALYSIS_WIDTH, image.height))
+            return np.asarray(image.convert('RGB'))
+    try:
+        import cv2
+    except ImportError:
+        raise DecoderMissing("Image decoding requires Pillow or OpenCV")
+    pixels = cv2.imread(path, cv2.IMREAD_COLOR)
+    if pixels is None:
+        raise ValueError("Unsupported or corrupt image")
+    if pixels.shape[1] > MAX_ANALYSIS_WIDTH:
+        height = pixels.shape[0] * MAX_ANALYSIS_WIDTH // pixels.shape[1]
+        pixels = cv2.resize(pixels, (MAX_ANALYSIS_WIDTH, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB)
+
+
+def read_text(pixels):
+    """OCR the screenshot; returns (text, None) or (None, reason)"""
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        return None, "pytesseract and Pillow are not installed"
+    try:
+        return pytesseract.image_to_string(Image.fromarray(pixels)), None
+    except Exception as e:  # tesseract binary missing or failing
+        return None, str(e)
+
+
+def chart_labels(text):
+    """Trading pair and timeframe printed on the chart, if any"""
+    labels = {'symbol': None, 'timeframe': None}
+    if not text:
+        return labels
+    symbol = SYMBOL_PATTERN.search(text.upper())
+    if symbol:
+        labels['symbol'] = symbol.group(1) + symbol.group(2)
+    timeframe = TIMEFRAME_PATTERN.search(text)
+    if timeframe:
+        labels['timeframe'] = timeframe.group(1)
+    return labels
+
+
+def candle_series(pixels):
+    """Per-column candle extent from green/red pixels, as (high, low, close) in [0, 1].
+
+    Columns without candle pixels are dropped; 1.0 is the top of the image.
+    """
+    import numpy as np
+    rgb = pixels.astype(np.int16)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    green = (g - r > 40) & (g - b > 20)
+    red = (r - g > 40) & (r - b > 20)
+    mask = green | red
+    present = mask.any(axis=0)
+    if present.sum() < 20:
+        return None
+    height = mask.shape[0]
+    rows = np.arange(height)[:, None]
+    top = np.where(mask, rows, height).min(axis=0)[present]
+    bottom = np.where(mask, rows, -1).max(axis=0)[present]
+    # A green column closes at its top, a red one at its bottom
+    bullish = green.sum(axis=0)[present] >= red.sum(axis=0)[present]
+    close = np.where(bullish, top, bottom)
+    scale = float(height - 1) or 1.0
+    return 1 - top / scale, 1 - bottom / scale, 1 - close / scale
+
+
+def _levels(values, tolerance=0.015, touches=3):
+    """Price levels touched by at least `touches` columns, strongest first"""
+    import numpy as np
+    bins = np.round(values / tolerance).astype(int)
+    counts = np.bincount(bins - bins.min())
+    levels = [(int(count), (index + bins.min()) * tolerance) for index, count in enumerate(counts) if count >= touches]
+    levels.sort(reverse=True)
+    return [round(float(level), 4) for _, level in levels[:3]]
+
+
+def _extrema(series, order):
+    """Indices of local maxima and minima over a +-order window"""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    if len(series) < 2 * order + 1:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    windows = sliding_window_view(series, 2 * order + 1)
+    center = series[order:len(series) - order]
+    peaks = np.flatnonzero(center == windows.max(axis=1)) + order
+    troughs = np.flatnonzero(center == windows.min(axis=1)) + order
+    return peaks, troughs
+
+
+def detect_patterns(high, low, close):
+    """Trend, support/resistance and double top/bottom on normalized candle extents"""
+    import numpy as np
+    x = np.arange(len(close), dtype=np.float64)
+    slope = np.polyfit(x, close, 1)[0] * len(close)  # total normalized move across the chart
+    if slope > 0.1:
+        trend = 'uptrend'
+    elif slope < -0.1:
+        trend = 'downtrend'
+    else:
+        trend = 'sideways'
+
+    patterns = []
+    order = max(3, len(close) // 20)
+    peaks, _ = _extrema(high, order)
+    _, troughs = _extrema(low, order)
+    if len(peaks) >= 2:
+        first, second = high[peaks[-2]], high[peaks[-1]]
+        between = low[peaks[-2]:peaks[-1] + 1].min()
+        if abs(first - second) < 0.02 and min(first, second) - between > 0.05:
+            patterns.append({'name': 'double_top', 'bias': 'bearish', 'level': round(float(max(first, second)), 4)})
+    if len(troughs) >= 2:
+        first, second = low[troughs[-2]], low[troughs[-1]]
+        between = high[troughs[-2]:troughs[-1] + 1].max()
+        if abs(first - second) < 0.02 and between - max(first, second) > 0.05:
+            patterns.append({'name': 'double_bottom', 'bias': 'bullish', 'level': round(float(min(first, second)), 4)})
+
+    last = float(close[-1])
+    resistance = [level for level in _levels(high) if level > last]
+    support = [level for level in _levels(low) if level < last]
+    if resistance and last >= resistance[0] - 0.01:
+        patterns.append({'name': 'testing_resistance', 'bias': 'neutral', 'level': resistance[0]})
+    if support and last <= support[0] + 0.01:
+        patterns.append({'name': 'testing_support', 'bias': 'neutral', 'level': support[0]})
+
+    return {
+        'trend': trend,
+        'trend_strength': round(float(abs(slope)), 4),
+        'patterns': patterns,
+        'support_levels': support,
+        'resistance_levels': resistance,
+        'last_close_position': round(last, 4),
+        'candle_columns': int(len(close))
+    }
+
+
+def analyze_file(path):
+    """Full analysis of an image file; runs inside a pool worker"""
+    pixels = load_pixels(path)
+    text, ocr_error = read_text(pixels)
+    result = {
+        'width': int(pixels.shape[1]),
+        'height': int(pixels.shape[0]),
+        'labels': chart_labels(text),
+        'ocr': {'available': ocr_error is None, 'error': ocr_error},
+        'analysis': None
+    }
+    series = candle_series(pixels)
+    if series is not None:
+        result['analysis'] = detect_patterns(*series)
+    return result
+
+
+class ChartAnalyzer:
+    """Bounded process pool with a content-hash result cache"""
+
+    def __init__(self, workers=CHART_WORKERS, queue_per_worker=QUEUE_PER_WORKER, cache_size=CACHE_SIZE):
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self._slots = threading.BoundedSemaphore(self.workers * queue_per_worker)
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: forking a threaded web server can deadlock the children
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def cached(self, digest):
+        with self._lock:
+            result = self._cache.get(digest)
+            if result is not None:
+                self._cache.move_to_end(digest)
+        metrics.record_cache('chart_analysis', result is not None)
+        return result
+
+    def analyze(self, path, digest):
+        """Analysis for an uploaded file, from the cache or the pool; takes ownership of the file"""
+        result = self.cached(digest)
+        if result is not None:
+            os.unlink(path)
+            ANALYSES.inc(result='cached')
+            return result
+        with self._lock:
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                if not self._slots.acquire(blocking=False):
+                    os.unlink(path)
+                    ANALYSES.inc(result='busy')
+                    raise AnalyzerBusy("Chart analyzer is busy, retry shortly")
+                try:
+                    future = self._inflight[digest] = self._executor().submit(analyze_file, path)
+                except Exception:
+                    self._slots.release()
+                    self._pool = None  # broken pool, start a fresh one next time
+                    os.unlink(path)
+                    raise
+        if owner:
+            future.add_done_callback(lambda done: self._finish(digest, path, done))
+        else:
+            os.unlink(path)  # an identical upload is already being analyzed
+        result = future.result(timeout=ANALYSIS_TIMEOUT)
+        ANALYSES.inc(result='analyzed')
+        return result
+
+    def _finish(self, digest, path, future):
+        self._slots.release()
+        os.unlink(path)
+        with self._lock:
+            self._inflight.pop(digest, None)
+            if not future.cancelled() and future.exception() is None:
+                self._cache[digest] = future.result()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = ChartAnalyzer()
+        return _analyzer
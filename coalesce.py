@@ -0,0 +1,146 @@
+"""Request coalescing for identical concurrent API calls.
+
+The first request for a key (path plus sorted query string) runs the view;
+identical requests arriving while it runs, or within ``window`` seconds
+after it finished, wait for and share its serialized response body instead
+of doing the work again. This is the server-side counterpart of the
+200-500 ms debounce the frontend is supposed to apply; hot routes pass a
+longer window to keep their encoded body (and its compressed variants)
+around as a short-lived response cache. Under serve.py, bodies of windows of
+at least SHARED_MIN_WINDOW are also put in the shared cache, so the other
+worker processes reuse them too.
+"""
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+import metrics
+import shared_cache
+from responses import EncodedBody, encoded_response
+
+COALESCE_WINDOW = float(os.environ.get('COALESCE_WINDOW', '0.3'))
+# Shorter windows are not worth a shared cache round trip
+SHARED_MIN_WINDOW = 1.0
+
+COALESCED = metrics.counter('coalesced_requests_total', 'Requests by coalescing outcome', ('endpoint', 'result'))
+
+
+class _Entry:
+    __slots__ = ('event', 'result', 'error', 'done_at', 'shareable', 'window')
+
+    def __init__(self, window):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+        self.shareable = True
+        self.window = window
+
+
+class Coalescer:
+    """Single-flight execution with a short reuse window per key"""
+
+    def __init__(self, window=COALESCE_WINDOW, max_entries=4096):
+        self.window = window
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _usable(self, entry, now):
+        if entry.done_at is None:
+            return True  # still in flight
+        return entry.shareable and now - entry.done_at <= entry.window
+
+    def run(self, key, compute, shareable=None, window=None):
+        """Return (result, outcome) where outcome is 'leader', 'inflight' or 'window'.
+
+        shareable(result) decides whether a finished result may be reused by
+        requests arriving after it completed; in-flight waiters always share.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._usable(entry, now):
+                leader = False
+                outcome = 'inflight' if entry.done_at is None else 'window'
+            else:
+                entry = self._entries[key] = _Entry(self.window if window is None else window)
+                leader = True
+                outcome = 'leader'
+                if len(self._entries) > self.max_entries:
+                    self._prune(now)
+
+        if leader:
+            try:
+                entry.result = compute()
+                if shareable is not None:
+                    entry.shareable = shareable(entry.result)
+            except BaseException as e:
+                entry.error = e
+                entry.shareable = False
+            finally:
+                entry.done_at = time.monotonic()
+                entry.event.set()
+        else:
+            entry.event.wait()
+
+        if entry.error is not None:
+            raise entry.error
+        return entry.result, outcome
+
+    def _prune(self, now):
+        for key, entry in list(self._entries.items()):
+            if entry.done_at is not None and now - entry.done_at > entry.window:
+                del self._entries[key]
+
+
+coalescer = Coalescer()
+
+
+def request_key():
+    args = sorted(request.args.items(multi=True))
+    query = '&'.join(f"{k}={v}" for k, v in args)
+    return f"{request.method} {request.path}?{query}"
+
+
+def coalesced(view=None, window=None):
+    """Share one execution and encoded response between identical GET requests.
+
+    Use as ``@coalesced`` or ``@coalesced(window=seconds)``. The view should
+    return an uncompressed body; compression is negotiated per request from
+    the shared EncodedBody.
+    """
+    if view is None:
+        return lambda function: coalesced(function, window)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        key = request_key()
+        reuse = coalescer.window if window is None else window
+        cache = shared_cache.get_cache() if reuse >= SHARED_MIN_WINDOW else None
+
+        def compute():
+            if cache is not None:
+                hit = cache.get('response', key)
+                if hit is not None:
+                    status, content_type, data, _ = hit
+                    return EncodedBody(data, content_type), status
+            response = current_app.make_response(view(*args, **kwargs))
+            body = EncodedBody(response.get_data(), response.headers.get('Content-Type'))
+            if cache is not None and response.status_code < 500:
+                cache.set('response', key, response.status_code, body.content_type, body.data, reuse)
+            return body, response.status_code
+
+        (body, status), outcome = coalescer.run(
+            key, compute, shareable=lambda result: result[1] < 500, window=window
+        )
+        COALESCED.inc(endpoint=view.__name__, result=outcome)
+        headers = {'X-Coalesced': outcome} if outcome != 'leader' else None
+        return encoded_response(body, status, headers)
+    return wrapper
@@ -0,0 +1,260 @@
+"""Rolling cross-asset correlation, beta and relative strength.
+
+CorrelationTracker keeps the last CORRELATION_WINDOW log returns of every
+watched pair in a ring buffer, together with their running sums and the
+running sum of outer products. Each candle close adds one row of returns
+and retires the oldest, so covariance, correlation and beta to BTC are
+updated in O(symbols^2) instead of recomputed over the window; the sums are
+rebuilt from the ring every RESEED_EVERY updates so float error cannot
+accumulate. The response body is encoded once per update, and GET
+/api/correlation only hands it out. numpy is imported when the tracker
+starts, so FAST_START keeps it off the start-up path. Under serve.py only
+the primary worker tracks (start_tracker); the other workers hand out the
+body it publishes to the shared cache.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, jsonify
+
+import metrics
+import scheduler
+import shared_cache
+import venues
+from responses import EncodedBody, dumps, encoded_response
+
+CORRELATION_INTERVAL = os.environ.get('CORRELATION_INTERVAL', '1h')
+# Candles of returns in the window (a week of hourly candles by default)
+CORRELATION_WINDOW = int(os.environ.get('CORRELATION_WINDOW', '168'))
+RESEED_EVERY = 500
+BENCHMARK = 'BTCUSDT'
+FETCH_THREADS = 8
+
+# The /coins/list coins
+DEFAULT_SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT', 'ADAUSDT', 'DOGEUSDT', 'DOTUSDT', 'LINKUSDT',
+                   'LTCUSDT', 'UNIUSDT', 'AVAXUSDT', 'MATICUSDT', 'SHIBUSDT', 'TRXUSDT', 'ATOMUSDT']
+
+CORRELATION_UPDATE_SECONDS = metrics.histogram('correlation_update_seconds', 'Duration of correlation updates',
+                                               ('kind',))
+
+correlation_bp = Blueprint('correlation', __name__)
+
+
+class RollingMoments:
+    """Windowed means and covariance of return vectors, updated one row at a time"""
+
+    def __init__(self, width, window):
+        import numpy as np
+        self.window = window
+        self.ring = np.zeros((window, width))
+        self.count = 0
+        self.position = 0
+        self.updates = 0
+        self.sum = np.zeros(width)
+        self.cross = np.zeros((width, width))
+
+    def push(self, row):
+        import numpy as np
+        if self.count == self.window:
+            old = self.ring[self.position]
+            self.sum -= old
+            self.cross -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.ring[self.position] = row
+        self.sum += row
+        self.cross += np.outer(row, row)
+        self.position = (self.position + 1) % self.window
+        self.updates += 1
+        if self.updates % RESEED_EVERY == 0:
+            self.reseed()
+
+    def reseed(self):
+        rows = self.ring[:self.count]
+        self.sum = rows.sum(axis=0)
+        self.cross = rows.T @ rows
+
+    def covariance(self):
+        import numpy as np
+        mean = self.sum / self.count
+        return (self.cross - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+
+def closed_candles(symbol, interval, limit):
+    """(open_times, closes) of the closed candles among the last `limit` klines, or None if unlisted"""
+    import numpy as np
+    _, response = venues.get_aggregator().klines(symbol, interval, limit)
+    if response.status_code != 200:
+        return None
+    klines = response.json()
+    now_ms = time.time() * 1000
+    klines = [k for k in klines if int(k[6]) < now_ms]
+    return np.array([int(k[0]) for k in klines], dtype=np.int64), np.array([float(k[4]) for k in klines])
+
+
+class CorrelationTracker:
+    def __init__(self, symbols=None, interval=CORRELATION_INTERVAL, window=CORRELATION_WINDOW):
+        self.requested = list(symbols or DEFAULT_SYMBOLS)
+        self.interval = interval
+        self.window = window
+        self.interval_ms = scheduler.INTERVAL_SECONDS[interval] * 1000
+        self.symbols = []
+        self.unavailable = []
+        self.moments = None
+        self.last_open_time = None
+        self.last_close = None
+        self._body = None  # EncodedBody of the latest result
+        self.shared = shared_cache.Published('correlation', interval, EncodedBody)
+        self.scheduler = None
+        self._lock = threading.Lock()
+
+    @property
+    def body(self):
+        """EncodedBody of the latest result: this tracker's own, or the published one if it is not started"""
+        if self.scheduler is None:
+            published = self.shared.latest()
+            if published is not None:
+                return published
+        return self._body
+
+    def start(self):
+        self.scheduler = scheduler.Scheduler()
+        self.scheduler.on_candle_close('correlation', self.refresh, self.interval, offset=3, blocking=True)
+        self.scheduler.start_in_thread()
+        threading.Thread(target=self._first_refresh, name='correlation-seed', daemon=True).start()
+        return self
+
+    def _first_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error loading the correlation window: {e}")
+
+    def fetch(self, symbols, limit):
+        with ThreadPoolExecutor(max_workers=FETCH_THREADS) as pool:
+            return dict(zip(symbols, pool.map(lambda s: closed_candles(s, self.interval, limit), symbols)))
+
+    def refresh(self):
+        """Add the candle that just closed, or rebuild the window after a gap"""
+        import numpy as np
+        with self._lock:
+            if self.moments is None:
+                self.seed()
+                return
+            started = time.perf_counter()
+            candles = self.fetch(self.symbols, 3)
+            expected = self.last_open_time + self.interval_ms
+            closes = np.empty(len(self.symbols))
+            for i, symbol in enumerate(self.symbols):
+                times, prices = candles[symbol] or (np.empty(0, np.int64), np.empty(0))
+                at = np.flatnonzero(times == expected)
+                if len(times) and times[-1] > expected:
+                    # Missed a close (restart, failed run): rebuild from history
+                    self.seed()
+                    return
+                # A pair without the candle is taken as unchanged
+                closes[i] = prices[at[0]] if len(at) else self.last_close[i]
+            if not any(candles[s] is not None and expected in candles[s][0] for s in self.symbols):
+                return  # the close is not published anywhere yet; the next run catches up
+            self.moments.push(np.log(closes / self.last_close))
+            self.last_close, self.last_open_time = closes, expected
+            self.publish()
+            CORRELATION_UPDATE_SECONDS.observe(time.perf_counter() - started, kind='incremental')
+
+    def seed(self):
+        """Fill the window from the last `window` + 1 closed candles of every pair"""
+        import numpy as np
+        started = time.perf_counter()
+        candles = self.fetch(self.requested, self.window + 2)
+        self.symbols = [s for s in self.requested if candles[s] is not None and len(candles[s][0])]
+        self.unavailable = [s for s in self.requested if s not in self.symbols]
+        if BENCHMARK not in self.symbols:
+            raise RuntimeError(f"No candles for the benchmark {BENCHMARK}")
+        times = candles[BENCHMARK][0][-(self.window + 1):]
+        closes = np.empty((len(times), len(self.symbols)))
+        for i, symbol in enumerate(self.symbols):
+            symbol_times, prices = candles[symbol]
+            # Align on the benchmark's candles; a missing candle repeats the previous close
+            at = np.clip(np.searchsorted(symbol_times, times, side='right') - 1, 0, None)
+            closes[:, i] = prices[at]
+        moments = RollingMoments(len(self.symbols), self.window)
+        for row in np.diff(np.log(closes), axis=0):
+            moments.push(row)
+        self.moments = moments
+        self.last_open_time, self.last_close = int(times[-1]), closes[-1]
+        self.publish()
+        CORRELATION_UPDATE_SECONDS.observe(time.perf_counter() - started, kind='seed')
+
+    def publish(self):
+        self._body = EncodedBody(dumps({"success": True, "data": self.result()}))
+        # Kept until two candles were missed
+        self.shared.publish(self._body.data, 2 * self.interval_ms / 1000, 'application/json')
+
+    def result(self):
+        import numpy as np
+        moments = self.moments
+        cov = moments.covariance()
+        std = np.sqrt(np.maximum(np.diag(cov), 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(std, std)
+        b = self.symbols.index(BENCHMARK)
+        beta = cov[:, b] / cov[b, b] if cov[b, b] > 0 else np.full(len(self.symbols), np.nan)
+        window_return = np.expm1(moments.sum) * 100
+        strength = moments.sum - moments.sum[b]
+        order = np.argsort(-strength)
+
+        def clean(value, digits=4):
+            return round(float(value), digits) if np.isfinite(value) else None
+
+        return {
+            'interval': self.interval,
+            'window': moments.count,
+            'as_of': self.last_open_time + self.interval_ms,
+            'symbols': self.symbols,
+            'unavailable': self.unavailable,
+            'correlation': [[clean(v) for v in row] for row in corr],
+            'beta_to_btc': {s: clean(beta[i]) for i, s in enumerate(self.symbols)},
+            'volatility_pct': {s: clean(std[i] * 100) for i, s in enumerate(self.symbols)},
+            'relative_strength': [{
+                'rank': rank + 1,
+                'symbol': self.symbols[i],
+                'return_pct': clean(window_return[i], 2),
+                'vs_btc_pct': clean(np.expm1(strength[i]) * 100, 2)
+            } for rank, i in enumerate(order)]
+        }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Shared tracker: seeded and updated on each candle close in the process that runs start_tracker,
+    reading the published result elsewhere (tracking on first use when there is no shared cache)"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = CorrelationTracker()
+            if shared_cache.get_cache() is None:
+                _tracker.start()
+        return _tracker
+
+
+def start_tracker():
+    """Track the correlation window in this process and publish it to the other workers"""
+    tracker = get_tracker()
+    with _tracker_lock:
+        if tracker.scheduler is None:
+            tracker.start()
+    return tracker
+
+
+@correlation_bp.route('/correlation', methods=['GET'])
+def get_correlation():
+    """Rolling return correlations, beta to BTC and relative strength of the watched coins"""
+    body = get_tracker().body
+    if body is None:
+        return jsonify({"success": False, "error": "Correlation window is still loading"}), 503
+    return encoded_response(body)
@@ -6,6 +6,8 @@ from ta import add_all_ta_features
 from ta.utils import dropna
 import json
 from datetime import datetime, timedelta
+import upstream
+from upstream import UpstreamError
 
 crypto_bp = Blueprint('crypto', __name__)
 
@@ -22,13 +24,15 @@ FEAR_GREED_URL = "https://api.alternative.me/fng/"
 def get_coins_list():
     """Get list of all coins from CoinGecko"""
     try:
-        response = requests.get(f"{COINGECKO_BASE_URL}/coins/list")
+        response = upstream.get(f"{COINGECKO_BASE_URL}/coins/list")
         if response.status_code == 200:
             coins = response.json()
             # Filter to get only top coins or Binance-listed coins for better performance
-            return jsonify({"success": True, "data": coins[:500]})  # Limit to first 500
+            return jsonify({"success": True, "data": coins[:500], "stale": response.stale})  # Limit to first 500
         else:
             return jsonify({"success": False, "error": "Failed to fetch coins list"}), 500
+    except UpstreamError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -36,12 +40,14 @@ def get_coins_list():
 def get_coin_data(coin_id):
     """Get detailed coin data from CoinGecko"""
     try:
-        response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}")
+        response = upstream.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}")
         if response.status_code == 200:
             coin_data = response.json()
-            return jsonify({"success": True, "data": coin_data})
+            return jsonify({"success": True, "data": coin_data, "stale": response.stale})
         else:
             return jsonify({"success": False, "error": "Coin not found"}), 404
+    except UpstreamError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
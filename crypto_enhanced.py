@@ -1,12 +1,19 @@
-from flask import Blueprint, jsonify, request
-import requests
-import pandas as pd
-import numpy as np
-from ta import add_all_ta_features
-from ta.utils import dropna
+from flask import Blueprint, Response, jsonify, request, g
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+import threading
+import os
 import time
+import jobs
+import metrics
+import news
+import upstream
+import venues
+from coalesce import coalesced
+from responses import json_body, json_response, project, raw_envelope, stale_fields
+from upstream import UpstreamError
 
 crypto_bp = Blueprint('crypto', __name__)
 
@@ -19,79 +26,143 @@ BINANCE_BASE_URL = "https://api.binance.com/api/v3"
 # Alternative.me Fear & Greed Index API
 FEAR_GREED_URL = "https://api.alternative.me/fng/"
 
+# How long hot responses are reused by identical requests (seconds). CoinGecko
+# refreshes coin data about once a minute; Binance klines change every tick
+COIN_RESPONSE_TTL = float(os.environ.get('COIN_RESPONSE_TTL', '30'))
+KLINES_RESPONSE_TTL = float(os.environ.get('KLINES_RESPONSE_TTL', '1'))
+ANALYSIS_RESPONSE_TTL = float(os.environ.get('ANALYSIS_RESPONSE_TTL', '5'))
+
+# Trading calculator: ATR multiples of the stop and target, and how long to
+# wait for a newly watched order book to sync before answering without it
+ATR_STOP_MULTIPLE = 1.5
+ATR_TARGET_MULTIPLE = 2.5
+ORDERBOOK_WAIT = float(os.environ.get('ORDERBOOK_WAIT', '2'))
+
+# Indicator engine: 'numpy' (indicators.py) or 'ta' (pandas + add_all_ta_features)
+TA_ENGINE = os.environ.get('TA_ENGINE', 'numpy')
+
+# Heavy analytics modules (numpy, plus pandas and ta for the 'ta' engine)
+# are imported on first use so light routes such as /coins/list are served
+# without paying for them
+_analytics = None
+_analytics_lock = threading.Lock()
+
+def load_analytics():
+    """Import the indicator engine once and return it as a namespace"""
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                started = time.perf_counter()
+                import indicators
+                analytics = SimpleNamespace(indicators=indicators)
+                if TA_ENGINE == 'ta':
+                    import pandas as pd
+                    from ta import add_all_ta_features
+                    from ta.utils import dropna
+                    analytics.pd = pd
+                    analytics.add_all_ta_features = add_all_ta_features
+                    analytics.dropna = dropna
+                _analytics = analytics
+                ANALYTICS_IMPORT_SECONDS.set(time.perf_counter() - started)
+    return _analytics
+
+def warm_analytics():
+    """Import the analytics modules in a background thread"""
+    thread = threading.Thread(target=load_analytics, name='analytics-warmup', daemon=True)
+    thread.start()
+    return thread
+
+# Instrumentation
+ANALYTICS_IMPORT_SECONDS = metrics.gauge('analytics_import_seconds', 'Time taken to import the indicator engine')
+REQUEST_SECONDS = metrics.histogram('crypto_request_seconds', 'Crypto API request duration', ('endpoint', 'status'))
+STAGE_SECONDS = metrics.histogram('crypto_stage_seconds', 'Duration of processing stages per endpoint', ('endpoint', 'stage'))
+
+@crypto_bp.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@crypto_bp.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                endpoint=request.endpoint or '', status=str(response.status_code))
+    return response
+
+def http_get(url, params=None, timeout=10):
+    """GET through the shared upstream client (retries, circuit breaker, last good value)"""
+    return upstream.get(url, params=params, timeout=timeout)
+
+def success_body(data, response):
+    """Success envelope, flagged when the upstream data is a stale cached copy"""
+    body = {"success": True, "data": data}
+    body.update(stale_fields(response))
+    return body
+
+def unavailable(e):
+    return jsonify({"success": False, "error": f"Upstream unavailable: {e}"}), 503
+
 # Rate limiting helper
 last_request_time = {}
 
 def rate_limit(endpoint, min_interval=1):
     """Simple rate limiting to avoid API bans"""
     current_time = time.time()
+    waited = 0.0
     if endpoint in last_request_time:
         time_diff = current_time - last_request_time[endpoint]
         if time_diff < min_interval:
-            time.sleep(min_interval - time_diff)
+            waited = min_interval - time_diff
+            time.sleep(waited)
     last_request_time[endpoint] = time.time()
+    metrics.RATE_LIMIT_WAIT.observe(waited, endpoint=endpoint)
+
+# Popular coins served by /coins/list
+POPULAR_COINS = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "binancecoin", "symbol": "bnb", "name": "BNB"},
+    {"id": "solana", "symbol": "sol", "name": "Solana"},
+    {"id": "cardano", "symbol": "ada", "name": "Cardano"},
+    {"id": "dogecoin", "symbol": "doge", "name": "Dogecoin"},
+    {"id": "polkadot", "symbol": "dot", "name": "Polkadot"},
+    {"id": "chainlink", "symbol": "link", "name": "Chainlink"},
+    {"id": "litecoin", "symbol": "ltc", "name": "Litecoin"},
+    {"id": "uniswap", "symbol": "uni", "name": "Uniswap"},
+    {"id": "avalanche-2", "symbol": "avax", "name": "Avalanche"},
+    {"id": "polygon", "symbol": "matic", "name": "Polygon"},
+    {"id": "shiba-inu", "symbol": "shib", "name": "Shiba Inu"},
+    {"id": "tron", "symbol": "trx", "name": "TRON"},
+    {"id": "cosmos", "symbol": "atom", "name": "Cosmos"}
+]
 
 @crypto_bp.route('/coins/list', methods=['GET'])
 def get_coins_list():
-    """Get list of all coins from CoinGecko"""
-    try:
-        rate_limit('coins_list', 2)  # 2 second rate limit
-        
-        response = requests.get(f"{COINGECKO_BASE_URL}/coins/list", timeout=10)
-        if response.status_code == 200:
-            coins = response.json()
-            # Filter to get only top coins for better performance
-            popular_coins = [
-                {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
-                {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
-                {"id": "binancecoin", "symbol": "bnb", "name": "BNB"},
-                {"id": "solana", "symbol": "sol", "name": "Solana"},
-                {"id": "cardano", "symbol": "ada", "name": "Cardano"},
-                {"id": "dogecoin", "symbol": "doge", "name": "Dogecoin"},
-                {"id": "polkadot", "symbol": "dot", "name": "Polkadot"},
-                {"id": "chainlink", "symbol": "link", "name": "Chainlink"},
-                {"id": "litecoin", "symbol": "ltc", "name": "Litecoin"},
-                {"id": "uniswap", "symbol": "uni", "name": "Uniswap"},
-                {"id": "avalanche-2", "symbol": "avax", "name": "Avalanche"},
-                {"id": "polygon", "symbol": "matic", "name": "Polygon"},
-                {"id": "shiba-inu", "symbol": "shib", "name": "Shiba Inu"},
-                {"id": "tron", "symbol": "trx", "name": "TRON"},
-                {"id": "cosmos", "symbol": "atom", "name": "Cosmos"}
-            ]
-            return jsonify({"success": True, "data": popular_coins})
-        else:
-            # Fallback to hardcoded list if API fails
-            popular_coins = [
-                {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
-                {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
-                {"id": "binancecoin", "symbol": "bnb", "name": "BNB"},
-                {"id": "solana", "symbol": "sol", "name": "Solana"},
-                {"id": "cardano", "symbol": "ada", "name": "Cardano"}
-            ]
-            return jsonify({"success": True, "data": popular_coins})
-    except Exception as e:
-        # Fallback to hardcoded list on error
-        popular_coins = [
-            {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
-            {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
-            {"id": "binancecoin", "symbol": "bnb", "name": "BNB"},
-            {"id": "solana", "symbol": "sol", "name": "Solana"},
-            {"id": "cardano", "symbol": "ada", "name": "Cardano"}
-        ]
-        return jsonify({"success": True, "data": popular_coins})
+    """Get list of popular coins"""
+    # The full CoinGecko list was fetched here and then discarded in favour
+    # of this list, so serve it directly without an upstream round trip
+    return jsonify({"success": True, "data": POPULAR_COINS})
 
 @crypto_bp.route('/coin/<coin_id>', methods=['GET'])
+@coalesced(window=COIN_RESPONSE_TTL)
 def get_coin_data(coin_id):
-    """Get detailed coin data from CoinGecko"""
+    """Get detailed coin data from CoinGecko (?fields=id,market_data.current_price.usd to trim it)"""
     try:
         rate_limit('coin_data', 1)
         
-        response = requests.get(f"{COINGECKO_BASE_URL}/coins/{coin_id}", timeout=10)
+        response = http_get(f"{COINGECKO_BASE_URL}/coins/{coin_id}", timeout=10)
         if response.status_code == 200:
-            coin_data = response.json()
-            return jsonify({"success": True, "data": coin_data})
+            fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+            if not fields:
+                # Forward CoinGecko's bytes without a decode/encode round trip
+                return Response(raw_envelope(response.content, stale_fields(response)),
+                                content_type='application/json')
+            return json_body(success_body(project(response.json(), fields), response))
         else:
             return jsonify({"success": False, "error": "Coin not found"}), 404
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -105,80 +176,117 @@ def get_coin_by_contract(contract_address):
         platforms = ['ethereum', 'binance-smart-chain']
         
         for platform in platforms:
-            response = requests.get(f"{COINGECKO_BASE_URL}/coins/{platform}/contract/{contract_address}", timeout=10)
+            response = http_get(f"{COINGECKO_BASE_URL}/coins/{platform}/contract/{contract_address}", timeout=10)
             if response.status_code == 200:
                 coin_data = response.json()
-                return jsonify({"success": True, "data": coin_data})
+                return jsonify(success_body(coin_data, response))
         
         return jsonify({"success": False, "error": "Contract not found"}), 404
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @crypto_bp.route('/klines/<symbol>', methods=['GET'])
+@coalesced(window=KLINES_RESPONSE_TTL)
 def get_klines(symbol):
-    """Get candlestick data from Binance"""
+    """Get candlestick data from Binance (?width=<px> for a downsampled range from the candle store)"""
+    if request.args.get('width'):
+        return get_downsampled_klines(symbol)
     try:
         rate_limit('klines', 0.5)  # 500ms rate limit
         
         interval = request.args.get('interval', '1h')  # Default to 1 hour
-        limit = request.args.get('limit', '100')  # Default to 100 candles
-        
-        params = {
-            'symbol': symbol.upper(),
-            'interval': interval,
-            'limit': limit
-        }
+        try:
+            limit = venues.kline_limit(request.args.get('limit', '100'))  # Default to 100 candles
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        response = requests.get(f"{BINANCE_BASE_URL}/klines", params=params, timeout=10)
+        with STAGE_SECONDS.time(endpoint='klines', stage='upstream'):
+            venue, response = venues.get_aggregator().klines(symbol, interval, limit)
         if response.status_code == 200:
-            klines = response.json()
-            return jsonify({"success": True, "data": klines})
+            # Venues answer with the Binance klines array the client wants
+            with STAGE_SECONDS.time(endpoint='klines', stage='encode'):
+                body = raw_envelope(response.content, dict(stale_fields(response), venue=venue))
+            return Response(body, content_type='application/json')
         else:
             return jsonify({"success": False, "error": "Failed to fetch klines"}), 500
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
-@crypto_bp.route('/technical-analysis/<symbol>', methods=['GET'])
-def get_technical_analysis(symbol):
-    """Get technical analysis indicators"""
+def get_downsampled_klines(symbol):
+    """Stored klines of [start, end) reduced to about `width` points (mode=ohlc or line)"""
+    import candle_store  # numpy modules: kept off the module import path like scanner
+    import downsample
     try:
-        rate_limit('technical_analysis', 1)
-        
         interval = request.args.get('interval', '1h')
-        limit = request.args.get('limit', '200')  # Need more data for indicators
-        
-        # Get klines data from Binance
-        params = {
-            'symbol': symbol.upper(),
-            'interval': interval,
-            'limit': limit
-        }
-        
-        response = requests.get(f"{BINANCE_BASE_URL}/klines", params=params, timeout=10)
-        if response.status_code != 200:
-            # Return sample data if Binance API fails
-            return jsonify({
-                "success": True, 
-                "data": {
-                    'rsi': 65.5,
-                    'macd': 0.0012,
-                    'macd_signal': 0.0008,
-                    'bb_upper': 52000.0,
-                    'bb_middle': 50000.0,
-                    'bb_lower': 48000.0,
-                    'ema_12': 50500.0,
-                    'ema_26': 49800.0,
-                    'sma_20': 50200.0,
-                    'sma_50': 49500.0,
-                    'volume_sma': 1500000.0,
-                    'stoch_k': 70.2,
-                    'stoch_d': 68.5,
-                    'current_price': 50000.0
-                }
+        mode = request.args.get('mode', 'ohlc')
+        width = int(request.args.get('width'))
+        if mode not in downsample.MODES:
+            raise ValueError(f"Unsupported mode '{mode}', use one of {', '.join(downsample.MODES)}")
+        if not 0 < width <= downsample.MAX_WIDTH:
+            raise ValueError(f"width must be between 1 and {downsample.MAX_WIDTH}")
+        start = candle_store.parse_time(request.args.get('start'))
+        end = candle_store.parse_time(request.args.get('end'))
+        
+        with STAGE_SECONDS.time(endpoint='klines', stage='downsample'):
+            klines, level, source_count = downsample.downsample(
+                candle_store.get_store(), symbol, interval, width, mode, start, end)
+        if not source_count:
+            return jsonify({"success": False, "error": f"No stored {interval} candles for {symbol.upper()} in range"}), 404
+        with STAGE_SECONDS.time(endpoint='klines', stage='encode'):
+            return json_body({
+                "success": True,
+                "data": klines,
+                "downsample": {"mode": mode, "candles_per_point": level, "source_candles": source_count}
             })
-        
-        klines = response.json()
-        
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def basic_indicators(current_price, volume_mean):
+    """Neutral indicator values used when there is too little data"""
+    return {
+        'rsi': 50.0,
+        'macd': 0.0,
+        'macd_signal': 0.0,
+        'bb_upper': current_price * 1.02,
+        'bb_middle': current_price,
+        'bb_lower': current_price * 0.98,
+        'ema_12': current_price,
+        'ema_26': current_price,
+        'sma_20': current_price,
+        'sma_50': current_price,
+        'volume_sma': volume_mean,
+        'stoch_k': 50.0,
+        'stoch_d': 50.0,
+        'current_price': current_price
+    }
+
+def numpy_indicators(klines):
+    """Indicators from raw klines using the NumPy kernels in indicators.py"""
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='imports'):
+        engine = load_analytics().indicators
+    
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='arrays'):
+        data = engine.parse_klines(klines)
+    
+    if len(data['close']) < engine.MIN_CANDLES:  # Not enough data for indicators
+        return basic_indicators(float(data['close'][-1]), float(data['volume'].mean()))
+    
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='indicators'):
+        return engine.technical_indicators(data)
+
+def ta_indicators(klines):
+    """Indicators from raw klines using pandas and add_all_ta_features"""
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='imports'):
+        analytics = load_analytics()
+        pd = analytics.pd
+    
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='dataframe'):
         # Convert to DataFrame
         df = pd.DataFrame(klines, columns=[
             'timestamp', 'open', 'high', 'low', 'close', 'volume',
@@ -192,127 +300,288 @@ def get_technical_analysis(symbol):
             df[col] = pd.to_numeric(df[col])
         
         # Clean data
-        df = dropna(df)
-        
-        if len(df) < 50:  # Not enough data for indicators
-            return jsonify({
-                "success": True, 
-                "data": {
-                    'rsi': 50.0,
-                    'macd': 0.0,
-                    'macd_signal': 0.0,
-                    'bb_upper': float(df['close'].iloc[-1]) * 1.02,
-                    'bb_middle': float(df['close'].iloc[-1]),
-                    'bb_lower': float(df['close'].iloc[-1]) * 0.98,
-                    'ema_12': float(df['close'].iloc[-1]),
-                    'ema_26': float(df['close'].iloc[-1]),
-                    'sma_20': float(df['close'].iloc[-1]),
-                    'sma_50': float(df['close'].iloc[-1]),
-                    'volume_sma': float(df['volume'].mean()),
-                    'stoch_k': 50.0,
-                    'stoch_d': 50.0,
-                    'current_price': float(df['close'].iloc[-1])
-                }
-            })
-        
-        # Add technical indicators
+        df = analytics.dropna(df)
+    
+    if len(df) < analytics.indicators.MIN_CANDLES:  # Not enough data for indicators
+        return basic_indicators(float(df['close'].iloc[-1]), float(df['volume'].mean()))
+    
+    # Add technical indicators
+    try:
+        with STAGE_SECONDS.time(endpoint='technical_analysis', stage='indicators'):
+            df = analytics.add_all_ta_features(df, open="open", high="high", low="low", close="close", volume="volume")
+    except Exception as ta_error:
+        print(f"TA error: {ta_error}")
+        # Return basic indicators if TA library fails
+        return basic_indicators(float(df['close'].iloc[-1]), float(df['volume'].mean()))
+    
+    # Get latest values for key indicators
+    extract_started = time.perf_counter()
+    latest = df.iloc[-1]
+    
+    def safe_float(value, default=0.0):
         try:
-            df = add_all_ta_features(df, open="open", high="high", low="low", close="close", volume="volume")
-        except Exception as ta_error:
-            print(f"TA error: {ta_error}")
-            # Return basic indicators if TA library fails
-            return jsonify({
-                "success": True, 
-                "data": {
-                    'rsi': 50.0,
-                    'macd': 0.0,
-                    'macd_signal': 0.0,
-                    'bb_upper': float(df['close'].iloc[-1]) * 1.02,
-                    'bb_middle': float(df['close'].iloc[-1]),
-                    'bb_lower': float(df['close'].iloc[-1]) * 0.98,
-                    'ema_12': float(df['close'].iloc[-1]),
-                    'ema_26': float(df['close'].iloc[-1]),
-                    'sma_20': float(df['close'].iloc[-1]),
-                    'sma_50': float(df['close'].iloc[-1]),
-                    'volume_sma': float(df['volume'].mean()),
-                    'stoch_k': 50.0,
-                    'stoch_d': 50.0,
-                    'current_price': float(df['close'].iloc[-1])
-                }
-            })
-        
-        # Get latest values for key indicators
-        latest = df.iloc[-1]
-        
-        def safe_float(value, default=0.0):
-            try:
-                if pd.isna(value):
-                    return default
-                return float(value)
-            except:
+            if pd.isna(value):
                 return default
+            return float(value)
+        except:
+            return default
+    
+    indicators = {
+        'rsi': safe_float(latest.get('momentum_rsi'), 50.0),
+        'macd': safe_float(latest.get('trend_macd'), 0.0),
+        'macd_signal': safe_float(latest.get('trend_macd_signal'), 0.0),
+        'bb_upper': safe_float(latest.get('volatility_bbh'), float(latest['close']) * 1.02),
+        'bb_middle': safe_float(latest.get('volatility_bbm'), float(latest['close'])),
+        'bb_lower': safe_float(latest.get('volatility_bbl'), float(latest['close']) * 0.98),
+        'ema_12': safe_float(latest.get('trend_ema_fast'), float(latest['close'])),
+        'ema_26': safe_float(latest.get('trend_ema_slow'), float(latest['close'])),
+        'sma_20': safe_float(latest.get('trend_sma_fast'), float(latest['close'])),
+        'sma_50': safe_float(latest.get('trend_sma_slow'), float(latest['close'])),
+        'volume_sma': safe_float(latest.get('volume_sma_em'), float(df['volume'].mean())),
+        'stoch_k': safe_float(latest.get('momentum_stoch'), 50.0),
+        'stoch_d': safe_float(latest.get('momentum_stoch_signal'), 50.0),
+        'current_price': float(latest['close'])
+    }
+    STAGE_SECONDS.observe(time.perf_counter() - extract_started, endpoint='technical_analysis', stage='extract')
+    return indicators
+
+def fetch_technical_indicators(symbol, interval='1h', limit='200'):
+    """Fetch klines and compute indicators; returns (indicators, upstream response).
+
+    indicators is None when no venue lists the symbol.
+    """
+    # Get klines from the first venue to answer (Binance unless it is failing)
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='upstream'):
+        _, response = venues.get_aggregator().klines(symbol, interval, limit)
+    if response.status_code != 200:
+        return None, response
+    
+    with STAGE_SECONDS.time(endpoint='technical_analysis', stage='parse'):
+        klines = response.json()
+    
+    if TA_ENGINE == 'ta':
+        return ta_indicators(klines), response
+    return numpy_indicators(klines), response
+
+@crypto_bp.route('/technical-analysis/<symbol>', methods=['GET'])
+@coalesced(window=ANALYSIS_RESPONSE_TTL)
+def get_technical_analysis(symbol):
+    """Get technical analysis indicators"""
+    try:
+        rate_limit('technical_analysis', 1)
         
-        indicators = {
-            'rsi': safe_float(latest.get('momentum_rsi'), 50.0),
-            'macd': safe_float(latest.get('trend_macd'), 0.0),
-            'macd_signal': safe_float(latest.get('trend_macd_signal'), 0.0),
-            'bb_upper': safe_float(latest.get('volatility_bbh'), float(latest['close']) * 1.02),
-            'bb_middle': safe_float(latest.get('volatility_bbm'), float(latest['close'])),
-            'bb_lower': safe_float(latest.get('volatility_bbl'), float(latest['close']) * 0.98),
-            'ema_12': safe_float(latest.get('trend_ema_fast'), float(latest['close'])),
-            'ema_26': safe_float(latest.get('trend_ema_slow'), float(latest['close'])),
-            'sma_20': safe_float(latest.get('trend_sma_fast'), float(latest['close'])),
-            'sma_50': safe_float(latest.get('trend_sma_slow'), float(latest['close'])),
-            'volume_sma': safe_float(latest.get('volume_sma_em'), float(df['volume'].mean())),
-            'stoch_k': safe_float(latest.get('momentum_stoch'), 50.0),
-            'stoch_d': safe_float(latest.get('momentum_stoch_signal'), 50.0),
-            'current_price': float(latest['close'])
-        }
+        interval = request.args.get('interval', '1h')
+        try:
+            limit = venues.kline_limit(request.args.get('limit', '200'))  # Need more data for indicators
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        indicators, response = fetch_technical_indicators(symbol, interval, limit)
+        if indicators is None:
+            return jsonify({"success": False, "error": "Failed to fetch klines"}), 500
         
-        return jsonify({"success": True, "data": indicators})
+        with STAGE_SECONDS.time(endpoint='technical_analysis', stage='encode'):
+            return json_body(success_body(indicators, response))
         
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
         print(f"Technical analysis error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def start_scanners():
+    """Refresh the market scanners in this process; other workers read them from the shared cache"""
+    import scanner
+    scanner.start_scanners(http_get, BINANCE_BASE_URL)
+
+@crypto_bp.route('/scanner', methods=['GET'])
+def market_scanner():
+    """Filter precomputed indicators of every Binance USDT pair"""
+    import scanner  # pulls in numpy; kept off the module import path
+    try:
+        interval = request.args.get('interval', '15m')
+        market = scanner.get_scanner(interval, http_get, BINANCE_BASE_URL)
+        if not market.ready:
+            return jsonify({"success": False, "error": "Scanner is warming up, retry shortly"}), 503
+        
+        fields = request.args.get('fields')
+        with STAGE_SECONDS.time(endpoint='scanner', stage='query'):
+            result = market.query(
+                expression=request.args.get('filter'),
+                sort=request.args.get('sort'),
+                page=request.args.get('page', 1),
+                page_size=request.args.get('page_size', 50),
+                fields=fields.split(',') if fields else None
+            )
+        return json_response({"success": True, "data": result})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        print(f"Scanner error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@crypto_bp.route('/chart-analyze', methods=['POST'])
+def analyze_chart():
+    """Analyze a chart screenshot sent as the raw body or as multipart field 'image'"""
+    import chart_analyzer  # the image libraries are only imported by its pool workers
+    try:
+        if request.content_length and request.content_length > chart_analyzer.MAX_UPLOAD_BYTES:
+            raise chart_analyzer.UploadTooLarge("Upload is too large")
+        
+        upload = request.files.get('image')
+        stream = upload.stream if upload is not None else request.stream
+        with chart_analyzer.ANALYSIS_SECONDS.time():
+            path, digest, size = chart_analyzer.receive_upload(stream)
+            if size == 0:
+                os.unlink(path)
+                return jsonify({"success": False, "error": "No image uploaded"}), 400
+            result = chart_analyzer.get_analyzer().analyze(path, digest)
+        
+        # Match the pair read off the chart against the live Binance price
+        market = None
+        symbol = result['labels']['symbol']
+        if symbol:
+            try:
+                response = http_get(f"{BINANCE_BASE_URL}/ticker/price", params={'symbol': symbol}, timeout=5)
+                if response.status_code == 200:
+                    market = {'symbol': symbol, 'price': float(response.json()['price']), 'stale': response.stale}
+            except UpstreamError as e:
+                print(f"Chart market lookup failed: {e}")
+        
+        return json_response({"success": True, "data": dict(result, sha256=digest, market=market)})
+    except chart_analyzer.UploadTooLarge as e:
+        return jsonify({"success": False, "error": str(e)}), 413
+    except chart_analyzer.AnalyzerBusy as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except TimeoutError:
+        return jsonify({"success": False, "error": "Chart analysis timed out"}), 504
+    except chart_analyzer.DecoderMissing as e:
+        return jsonify({"success": False, "error": str(e)}), 501
+    except (ValueError, OSError):
+        return jsonify({"success": False, "error": "Unsupported or corrupt image"}), 400
+    except Exception as e:
+        print(f"Chart analysis error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@crypto_bp.route('/price/<symbol>', methods=['GET'])
+def get_composite_price(symbol):
+    """Volume-weighted price of a pair across the venues that list it"""
+    try:
+        # The WebSocket ingester on this host keeps fresh composites in shared memory
+        import snapshot
+        ticker = snapshot.fresh_ticker(symbol.upper())
+        if ticker is None:
+            ticker = venues.get_aggregator().ticker(symbol)
+        if ticker is None:
+            return jsonify({"success": False, "error": f"No venue lists {symbol.upper()}"}), 404
+        ticker['symbol'] = symbol.upper()
+        return jsonify({"success": True, "data": ticker})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@crypto_bp.route('/venues', methods=['GET'])
+def get_venue_status():
+    """Health and latency of each market data venue"""
+    return jsonify({"success": True, "data": venues.get_aggregator().status()})
+
 @crypto_bp.route('/fear-greed-index', methods=['GET'])
 def get_fear_greed_index():
     """Get Fear & Greed Index from Alternative.me"""
     try:
         rate_limit('fear_greed', 2)  # 2 second rate limit
         
-        response = requests.get(FEAR_GREED_URL, timeout=10)
+        response = http_get(FEAR_GREED_URL, timeout=10)
         if response.status_code == 200:
             data = response.json()
-            return jsonify({"success": True, "data": data})
+            return jsonify(success_body(data, response))
         else:
-            # Return sample data if API fails
-            sample_data = {
-                "name": "Fear and Greed Index",
-                "data": [
-                    {
-                        "value": "73",
-                        "value_classification": "Greed",
-                        "timestamp": str(int(time.time())),
-                        "time_until_update": "86400"
-                    }
-                ]
-            }
-            return jsonify({"success": True, "data": sample_data})
+            return jsonify({"success": False, "error": "Failed to fetch Fear & Greed Index"}), 500
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
-        # Return sample data on error
-        sample_data = {
-            "name": "Fear and Greed Index",
-            "data": [
-                {
-                    "value": "50",
-                    "value_classification": "Neutral",
-                    "timestamp": str(int(time.time())),
-                    "time_until_update": "86400"
-                }
-            ]
-        }
-        return jsonify({"success": True, "data": sample_data})
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@crypto_bp.route('/news/<symbol>', methods=['GET'])
+def get_news(symbol):
+    """Latest headlines about a coin with sentiment and impact ratings"""
+    try:
+        store = news.get_store()
+        if not store.ready:
+            return jsonify({"success": False, "error": "News feed is warming up, retry shortly"}), 503
+        
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        return json_response({"success": True, "data": {
+            'symbol': news.base_symbol(symbol),
+            'sentiment': store.sentiment(symbol),
+            'headlines': store.headlines(symbol, limit),
+            'updated_at': store.updated_at
+        }})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        print(f"News error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def fetch_atr(symbol, interval='1h'):
+    """Latest ATR(14) of a symbol, None if it is not listed or there are too few candles"""
+    _, response = venues.get_aggregator().klines(symbol, interval, 100)
+    if response.status_code != 200:
+        return None
+    engine = load_analytics().indicators
+    data = engine.parse_klines(response.json())
+    series = engine.atr(data['high'], data['low'], data['close'])
+    if not len(series) or series[-1] != series[-1]:  # NaN during the warm-up
+        return None
+    return float(series[-1])
+
+def atr_levels(entry_price, position_type, atr, walls):
+    """ATR stop and target, pulled in front of the nearest liquidity walls"""
+    direction = 1 if position_type == 'long' else -1
+    stop_loss = entry_price - direction * ATR_STOP_MULTIPLE * atr
+    take_profit = entry_price + direction * ATR_TARGET_MULTIPLE * atr
+    stop_wall = target_wall = None
+    if walls:
+        # A long is protected by bid walls below and capped by ask walls above
+        supports, resistances = (walls['support'], walls['resistance']) if direction == 1 \
+            else (walls['resistance'], walls['support'])
+        for wall in supports:
+            if (wall['price'] - stop_loss) * direction > 0 and (entry_price - wall['price']) * direction > 0:
+                stop_wall = wall
+                stop_loss = wall['price'] - direction * 0.25 * atr  # just beyond the wall
+                break
+        for wall in resistances:
+            if (take_profit - wall['price']) * direction > 0 and (wall['price'] - entry_price) * direction > 0:
+                target_wall = wall
+                take_profit = wall['price'] - direction * 0.1 * atr  # in front of the wall
+                break
+    return {
+        'stop_loss': round(stop_loss, 6),
+        'take_profit': round(take_profit, 6),
+        'stop_multiple': ATR_STOP_MULTIPLE,
+        'target_multiple': ATR_TARGET_MULTIPLE,
+        'stop_wall': stop_wall,
+        'target_wall': target_wall
+    }
+
+def liquidity(symbol, position_type, quantity):
+    """Order book view for the calculator, None while the book is not synced or for an unlisted pair"""
+    import orderbook
+    try:
+        book = orderbook.get_books().get(symbol, wait=ORDERBOOK_WAIT)
+    except orderbook.UnknownSymbol:
+        return None
+    if book is None:
+        return None
+    entry_side, exit_side = ('buy', 'sell') if position_type == 'long' else ('sell', 'buy')
+    summary = book.summary()
+    return {
+        'mid': summary['mid'],
+        'spread_pct': summary['spread_pct'],
+        'entry_slippage': book.slippage(entry_side, quantity) if quantity > 0 else None,
+        'exit_slippage': book.slippage(exit_side, quantity) if quantity > 0 else None,
+        'walls': book.walls(),
+        'book_age': summary['age']
+    }
 
 @crypto_bp.route('/trading-calculator', methods=['POST'])
 def trading_calculator():
@@ -362,191 +631,169 @@ def trading_calculator():
             'risk_reward_ratio': round(abs(tp_pnl / sl_pnl) if sl_pnl != 0 else 0, 2)
         }
         
+        # With a symbol, add order book slippage and walls and ATR-based levels
+        symbol = data.get('symbol')
+        if symbol:
+            symbol = symbol.upper()
+            interval = data.get('interval', '1h')
+            try:
+                result['liquidity'] = liquidity(symbol, position_type, position_size * leverage)
+            except Exception as e:
+                print(f"Order book error for {symbol}: {e}")
+                result['liquidity'] = None
+            try:
+                atr = fetch_atr(symbol, interval)
+            except UpstreamError:
+                atr = None
+            result['atr'] = atr
+            if atr:
+                walls = result['liquidity']['walls'] if result['liquidity'] else None
+                levels = atr_levels(entry_price, position_type, atr, walls)
+                direction = 1 if position_type == 'long' else -1
+                levels['sl_pnl'] = round((levels['stop_loss'] - entry_price) * direction * position_size * leverage, 2)
+                levels['tp_pnl'] = round((levels['take_profit'] - entry_price) * direction * position_size * leverage, 2)
+                levels['risk_reward_ratio'] = round(abs(levels['tp_pnl'] / levels['sl_pnl']) if levels['sl_pnl'] else 0, 2)
+                result['atr_levels'] = levels
+            else:
+                result['atr_levels'] = None
+        
         return jsonify({"success": True, "data": result})
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def build_prediction(symbol, interval='1h'):
+    """Prediction for a symbol; returns (result, klines response), result None if Binance failed"""
+    # Get technical analysis data
+    with STAGE_SECONDS.time(endpoint='ai_prediction', stage='technical_analysis'):
+        ta_data, ta_response = fetch_technical_indicators(symbol, interval, '200')
+    
+    if ta_data is None:
+        return None, ta_response
+    
+    # Get Fear & Greed Index (the sentiment factor is skipped if unavailable)
+    fear_greed = None
+    with STAGE_SECONDS.time(endpoint='ai_prediction', stage='fear_greed'):
+        try:
+            fg_response = http_get(FEAR_GREED_URL, timeout=10)
+            if fg_response.status_code == 200:
+                fg_data = fg_response.json()
+                if fg_data and 'data' in fg_data and len(fg_data['data']) > 0:
+                    fear_greed = int(fg_data['data'][0]['value'])
+        except UpstreamError as e:
+            print(f"Fear & Greed unavailable: {e}")
+    
+    # News sentiment comes from the background-refreshed store; None until it has headlines
+    news_sentiment = news.get_store().sentiment(symbol)
+    
+    # Rules, a tree model or both (scoring.SCORER); model calls are micro-batched across requests
+    import scoring
+    with STAGE_SECONDS.time(endpoint='ai_prediction', stage='score'):
+        scored = scoring.predict({'indicators': ta_data, 'fear_greed': fear_greed, 'news_sentiment': news_sentiment})
+    
+    result = {
+        'symbol': symbol.upper(),
+        'prediction': scored['prediction'],
+        'confidence': scored['confidence'],
+        'explanation': scored['explanation'],
+        'technical_data': ta_data,
+        'fear_greed_index': fear_greed,
+        'news_sentiment': news_sentiment,
+        'signal_breakdown': scored['signal_breakdown'],
+        'scorer': scoring.get_scorer().name,
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    return result, ta_response
+
 @crypto_bp.route('/ai-prediction/<symbol>', methods=['GET'])
+@coalesced(window=ANALYSIS_RESPONSE_TTL)
 def get_ai_prediction(symbol):
     """Generate AI-based trend prediction"""
     try:
         interval = request.args.get('interval', '1h')
         
-        # Get technical analysis data
-        ta_response = requests.get(f"http://localhost:5001/api/technical-analysis/{symbol}", 
-                                 params={'interval': interval, 'limit': '200'}, timeout=10)
-        
-        if ta_response.status_code != 200:
+        result, ta_response = build_prediction(symbol, interval)
+        if result is None:
             return jsonify({"success": False, "error": "Failed to get technical data"}), 500
         
-        ta_data = ta_response.json()['data']
-        
-        # Get Fear & Greed Index
-        fg_response = requests.get("http://localhost:5001/api/fear-greed-index", timeout=10)
-        fear_greed = 50  # Default neutral
-        if fg_response.status_code == 200:
-            fg_data = fg_response.json()['data']
-            if fg_data and 'data' in fg_data and len(fg_data['data']) > 0:
-                fear_greed = int(fg_data['data'][0]['value'])
-        
-        # Enhanced AI prediction logic
-        signals = []
-        confidence_factors = []
-        explanations = []
-        
-        # RSI Analysis (30% weight)
-        rsi = ta_data.get('rsi', 50)
-        if rsi < 30:
-            signals.append('LONG')
-            confidence_factors.append(0.3)
-            explanations.append(f"RSI ({rsi:.1f}) indicates oversold conditions")
-        elif rsi > 70:
-            signals.append('SHORT')
-            confidence_factors.append(0.3)
-            explanations.append(f"RSI ({rsi:.1f}) indicates overbought conditions")
-        elif rsi < 45:
-            signals.append('LONG')
-            confidence_factors.append(0.15)
-            explanations.append(f"RSI ({rsi:.1f}) shows bearish momentum weakening")
-        elif rsi > 55:
-            signals.append('SHORT')
-            confidence_factors.append(0.15)
-            explanations.append(f"RSI ({rsi:.1f}) shows bullish momentum weakening")
-        else:
-            signals.append('HOLD')
-            confidence_factors.append(0.1)
-        
-        # MACD Analysis (25% weight)
-        macd = ta_data.get('macd', 0)
-        macd_signal = ta_data.get('macd_signal', 0)
-        if macd and macd_signal:
-            if macd > macd_signal and macd > 0:
-                signals.append('LONG')
-                confidence_factors.append(0.25)
-                explanations.append("MACD is above signal line in positive territory (strong bullish)")
-            elif macd > macd_signal:
-                signals.append('LONG')
-                confidence_factors.append(0.15)
-                explanations.append("MACD is above signal line (bullish)")
-            elif macd < macd_signal and macd < 0:
-                signals.append('SHORT')
-                confidence_factors.append(0.25)
-                explanations.append("MACD is below signal line in negative territory (strong bearish)")
-            else:
-                signals.append('SHORT')
-                confidence_factors.append(0.15)
-                explanations.append("MACD is below signal line (bearish)")
-        
-        # Bollinger Bands Analysis (20% weight)
-        current_price = ta_data.get('current_price', 0)
-        bb_upper = ta_data.get('bb_upper', 0)
-        bb_lower = ta_data.get('bb_lower', 0)
-        bb_middle = ta_data.get('bb_middle', 0)
-        
-        if current_price and bb_upper and bb_lower and bb_middle:
-            if current_price <= bb_lower:
-                signals.append('LONG')
-                confidence_factors.append(0.2)
-                explanations.append("Price at lower Bollinger Band (oversold)")
-            elif current_price >= bb_upper:
-                signals.append('SHORT')
-                confidence_factors.append(0.2)
-                explanations.append("Price at upper Bollinger Band (overbought)")
-            elif current_price < bb_middle:
-                signals.append('LONG')
-                confidence_factors.append(0.1)
-                explanations.append("Price below Bollinger Band middle line")
-            else:
-                signals.append('SHORT')
-                confidence_factors.append(0.1)
-                explanations.append("Price above Bollinger Band middle line")
-        
-        # Moving Average Analysis (15% weight)
-        sma_20 = ta_data.get('sma_20', 0)
-        sma_50 = ta_data.get('sma_50', 0)
-        ema_12 = ta_data.get('ema_12', 0)
-        ema_26 = ta_data.get('ema_26', 0)
-        
-        if current_price and sma_20 and sma_50:
-            if current_price > sma_20 > sma_50:
-                signals.append('LONG')
-                confidence_factors.append(0.15)
-                explanations.append("Price above both SMA20 and SMA50 (uptrend)")
-            elif current_price < sma_20 < sma_50:
-                signals.append('SHORT')
-                confidence_factors.append(0.15)
-                explanations.append("Price below both SMA20 and SMA50 (downtrend)")
-        
-        if ema_12 and ema_26:
-            if ema_12 > ema_26:
-                signals.append('LONG')
-                confidence_factors.append(0.1)
-            else:
-                signals.append('SHORT')
-                confidence_factors.append(0.1)
-        
-        # Fear & Greed Analysis (10% weight)
-        if fear_greed < 25:  # Extreme Fear
-            signals.append('LONG')
-            confidence_factors.append(0.1)
-            explanations.append(f"Fear & Greed Index ({fear_greed}) shows extreme fear - contrarian buy signal")
-        elif fear_greed > 75:  # Extreme Greed
-            signals.append('SHORT')
-            confidence_factors.append(0.1)
-            explanations.append(f"Fear & Greed Index ({fear_greed}) shows extreme greed - contrarian sell signal")
-        elif fear_greed < 40:
-            signals.append('LONG')
-            confidence_factors.append(0.05)
-            explanations.append(f"Fear & Greed Index ({fear_greed}) shows fear")
-        elif fear_greed > 60:
-            signals.append('SHORT')
-            confidence_factors.append(0.05)
-            explanations.append(f"Fear & Greed Index ({fear_greed}) shows greed")
-        
-        # Calculate final prediction
-        long_count = signals.count('LONG')
-        short_count = signals.count('SHORT')
-        hold_count = signals.count('HOLD')
-        
-        if long_count > short_count and long_count > hold_count:
-            prediction = 'LONG'
-            signal_strength = long_count
-        elif short_count > long_count and short_count > hold_count:
-            prediction = 'SHORT'
-            signal_strength = short_count
-        else:
-            prediction = 'HOLD'
-            signal_strength = hold_count
-        
-        # Calculate confidence score (0-100)
-        total_signals = len(signals)
-        if total_signals > 0:
-            base_confidence = (signal_strength / total_signals) * 100
-            weight_bonus = sum(confidence_factors) * 50  # Bonus based on signal weights
-            confidence = min(95, max(25, base_confidence + weight_bonus))
-        else:
-            confidence = 50
-        
-        result = {
-            'symbol': symbol.upper(),
-            'prediction': prediction,
-            'confidence': round(confidence, 1),
-            'explanation': '. '.join(explanations[:3]) if explanations else "Analysis based on multiple technical indicators",
-            'technical_data': ta_data,
-            'fear_greed_index': fear_greed,
-            'signal_breakdown': {
-                'long_signals': long_count,
-                'short_signals': short_count,
-                'hold_signals': hold_count,
-                'total_weight': sum(confidence_factors)
-            },
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        return jsonify({"success": True, "data": result})
+        return json_body(success_body(result, ta_response))
         
+    except UpstreamError as e:
+        return unavailable(e)
     except Exception as e:
         print(f"AI prediction error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Background job kinds (see jobs.py); each takes a JSON params object
+MAX_JOB_SYMBOLS = 500
+PREDICTION_JOB_THREADS = 8
+
+def job_symbols(params):
+    symbols = params.get('symbols')
+    if not isinstance(symbols, list) or not symbols:
+        raise ValueError("params.symbols must be a non-empty list")
+    return [str(symbol).upper() for symbol in symbols[:MAX_JOB_SYMBOLS]]
+
+def technical_analysis_job(params, job):
+    """Indicators for many symbols: {"symbols": [...], "interval": "1h"}"""
+    symbols = job_symbols(params)
+    interval = params.get('interval', '1h')
+    results = {}
+    for index, symbol in enumerate(symbols):
+        try:
+            indicators, response = fetch_technical_indicators(symbol, interval, '200')
+            results[symbol] = indicators if indicators is not None else {'error': f"No venue lists {symbol} ({response.status_code})"}
+        except UpstreamError as e:
+            results[symbol] = {'error': str(e)}
+        job.progress(index + 1, len(symbols), symbol)
+    return results
+
+def ai_prediction_job(params, job):
+    """Predictions for many symbols: {"symbols": [...], "interval": "1h"}"""
+    symbols = job_symbols(params)
+    interval = params.get('interval', '1h')
+    
+    def predict(symbol):
+        try:
+            result, response = build_prediction(symbol, interval)
+            return result if result is not None else {'error': f"No venue lists {symbol} ({response.status_code})"}
+        except UpstreamError as e:
+            return {'error': str(e)}
+    
+    # Symbols run concurrently so a model scorer sees them as micro-batches
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=PREDICTION_JOB_THREADS)
+    try:
+        futures = {pool.submit(predict, symbol): symbol for symbol in symbols}
+        for index, future in enumerate(as_completed(futures)):
+            job.check_cancelled()
+            symbol = futures[future]
+            results[symbol] = future.result()
+            job.progress(index + 1, len(symbols), symbol)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return {symbol: results[symbol] for symbol in symbols}
+
+def scan_job(params, job):
+    """Market scan that waits for the scanner to warm up: same params as /scanner"""
+    import scanner
+    market = scanner.get_scanner(params.get('interval', '15m'), http_get, BINANCE_BASE_URL)
+    deadline = time.time() + 600
+    while not market.ready:
+        if time.time() > deadline:
+            raise RuntimeError("Scanner did not warm up in time")
+        job.check_cancelled()
+        time.sleep(1)
+    fields = params.get('fields')
+    return market.query(
+        expression=params.get('filter'),
+        sort=params.get('sort'),
+        page=params.get('page', 1),
+        page_size=params.get('page_size', scanner.MAX_PAGE_SIZE),
+        fields=fields.split(',') if isinstance(fields, str) else fields
+    )
+
+jobs.register('technical_analysis', technical_analysis_job)
+jobs.register('ai_prediction', ai_prediction_job)
+jobs.register('scan', scan_job)
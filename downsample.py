@@ -0,0 +1,200 @@
+"""Chart downsampling of stored candles to a screen width.
+
+/klines?width=<px> answers from the candle store with at most about
+`width` points, whatever the range:
+
+- 'ohlc' merges runs of candles into one candle each (first open, highest
+  high, lowest low, last close, summed volumes), so wicks and gaps survive
+  zooming out.
+- 'line' picks one real candle per bucket with Largest-Triangle-Three-
+  Buckets on the close, which keeps the shape of a line series better than
+  taking every n-th point.
+
+Bucket sizes are powers of two (the zoom level) and bucket edges sit on
+multiples of the size in the stored series. Whole buckets are cached in
+blocks of BLOCK_BUCKETS per (series, mode, level, block index) and a range
+is assembled from its blocks plus the partial buckets at its two ends, so
+panning and a growing series reuse every block but the newest. In line
+mode the first bucket of a block is weighed against the candle before the
+block instead of the point chosen in the bucket before it, which keeps
+blocks independent of the range they are read for.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import candle_store
+import metrics
+
+# Downsampled blocks kept per process
+DOWNSAMPLE_CACHE_SIZE = int(os.environ.get('DOWNSAMPLE_CACHE_SIZE', '256'))
+# Buckets per cached block
+BLOCK_BUCKETS = 256
+MAX_WIDTH = 10000
+MODES = ('ohlc', 'line')
+
+DOWNSAMPLE_CACHE = metrics.counter('downsample_cache_total', 'Downsampled /klines blocks by cache outcome', ('result',))
+
+
+def zoom_level(count, width):
+    """Candles per point: the smallest power of two that fits `count` into `width`"""
+    size = 1
+    while count > size * width:
+        size *= 2
+    return size
+
+
+def bucket_starts(lo, hi, size):
+    """Start indexes of the size-aligned buckets covering [lo, hi)"""
+    first = lo - lo % size
+    starts = np.arange(first, hi, size)
+    starts[0] = lo
+    return starts
+
+
+def ohlc(candles, lo, hi, size):
+    """candles[lo:hi] merged into aligned buckets of `size`: (rows, open_time of each bucket's last candle)"""
+    starts = bucket_starts(lo, hi, size)
+    segment = candles[lo:hi]
+    at = starts - lo
+    ends = np.append(at[1:], hi - lo) - 1
+    rows = np.empty(len(starts), dtype=candles.dtype)
+    rows['open_time'] = segment['open_time'][at]
+    rows['open'] = segment['open'][at]
+    rows['high'] = np.maximum.reduceat(segment['high'], at)
+    rows['low'] = np.minimum.reduceat(segment['low'], at)
+    rows['close'] = segment['close'][ends]
+    for name in ('volume', 'quote_volume', 'trades'):
+        rows[name] = np.add.reduceat(segment[name], at)
+    return rows, segment['open_time'][ends]
+
+
+def lttb(candles, lo, hi, size, anchor=None, after=None):
+    """One candle per aligned bucket of `size`, chosen by LTTB on the close: (rows, their open_time).
+
+    The first bucket keeps its first candle unless `anchor`, the index of a
+    candle before lo, is given to weigh it against; the last bucket is weighed
+    against `after` (open_time, close) if given, else the last candle.
+    """
+    starts = bucket_starts(lo, hi, size)
+    ends = np.append(starts[1:], hi)
+    x = candles['open_time'][lo:hi].astype(np.float64)
+    y = np.asarray(candles['close'][lo:hi], dtype=np.float64)
+    starts, ends = starts - lo, ends - lo
+    count = len(starts)
+    # Average of each bucket: the third vertex when choosing in the bucket before it
+    sums = np.add.reduceat(y, starts)
+    avg_y = sums / (ends - starts)
+    avg_x = np.add.reduceat(x, starts) / (ends - starts)
+    chosen = np.empty(count, dtype=np.int64)
+    if anchor is None:
+        chosen[0] = 0  # the first candle anchors the series
+        first, ax, ay = 1, x[0], y[0]
+    else:
+        first, ax, ay = 0, float(candles['open_time'][anchor]), float(candles['close'][anchor])
+    for i in range(first, count):
+        if i + 1 < count:
+            cx, cy = avg_x[i + 1], avg_y[i + 1]
+        elif after is not None:
+            cx, cy = after
+        else:
+            cx, cy = x[-1], y[-1]
+        bx, by = x[starts[i]:ends[i]], y[starts[i]:ends[i]]
+        area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        chosen[i] = starts[i] + int(area.argmax())
+        ax, ay = x[chosen[i]], y[chosen[i]]
+    rows = np.array(candles[lo:hi][chosen])
+    return rows, rows['open_time']
+
+
+def reduce_block(candles, mode, level, block):
+    """Rows of the whole buckets of block `block` at `level`: (rows, last open_times)"""
+    start = block * level * BLOCK_BUCKETS
+    stop = min(start + level * BLOCK_BUCKETS, len(candles))
+    if mode == 'ohlc':
+        return ohlc(candles, start, stop, level)
+    after = None
+    if stop + level <= len(candles):
+        # The next block's first bucket, as the last bucket would be weighed inside one long range
+        after = (float(candles['open_time'][stop:stop + level].astype(np.float64).mean()),
+                 float(np.asarray(candles['close'][stop:stop + level], dtype=np.float64).mean()))
+    return lttb(candles, start, stop, level, anchor=start - 1 if start else None, after=after)
+
+
+class DownsampleCache:
+    """LRU of downsampled blocks keyed by (symbol, interval, mode, level, block)"""
+
+    def __init__(self, size=DOWNSAMPLE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+        if value is not None:
+            DOWNSAMPLE_CACHE.inc(result='hit')
+            return value
+        DOWNSAMPLE_CACHE.inc(result='miss')
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return value
+
+
+_cache = DownsampleCache()
+
+
+def downsample(store, symbol, interval, width, mode='ohlc', start=None, end=None):
+    """Stored candles of [start, end) reduced to about `width` points.
+
+    Returns (klines, candles per point, stored candles in the range); the
+    encoded klines of each block are what is cached, so a range of cached
+    blocks only costs joining them and serialization.
+    """
+    candles = store.all(symbol, interval)
+    lo, hi = store.bounds(candles, start, end)
+    level = zoom_level(hi - lo, width)
+    if hi == lo:
+        return [], level, 0
+    reduce = ohlc if mode == 'ohlc' else lttb
+    # Whole buckets [first, last); the partial buckets around them are reduced for this range only
+    first = -(-lo // level) * level
+    last = hi - hi % level
+    if first >= last:
+        rows, last_open_times = reduce(candles, lo, hi, level)
+        return candle_store.to_klines(rows, interval, last_open_times), level, hi - lo
+
+    klines = []
+    if lo < first:
+        rows, last_open_times = reduce(candles, lo, first, level)
+        klines.extend(candle_store.to_klines(rows, interval, last_open_times))
+    span = level * BLOCK_BUCKETS
+    # The block holding the newest candles changes as they are appended: cached per series length
+    complete = len(candles) - (level if mode == 'line' else 0)
+    for block in range(first // span, (last - 1) // span + 1):
+        block_start = block * span
+        key = (symbol.upper(), interval, mode, level, block)
+        if block_start + span > complete:
+            key += (len(candles),)
+
+        def compute(block=block):
+            rows, last_open_times = reduce_block(candles, mode, level, block)
+            return candle_store.to_klines(rows, interval, last_open_times)
+
+        block_klines = _cache.get(key, compute)
+        klines.extend(block_klines[(max(first, block_start) - block_start) // level:
+                                   (min(last, block_start + span) - block_start) // level])
+    if last < hi:
+        if mode == 'ohlc':
+            rows, last_open_times = ohlc(candles, last, hi, level)
+        else:
+            rows, last_open_times = lttb(candles, last, hi, level, anchor=last - 1)
+        klines.extend(candle_store.to_klines(rows, interval, last_open_times))
+    return klines, level, hi - lo
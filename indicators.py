@@ -0,0 +1,232 @@
+"""Pandas-free technical indicator kernels.
+
+Klines are parsed straight into float64 arrays and every indicator is a
+vectorized NumPy kernel. Each kernel reproduces the corresponding ``ta``
+indicator class (same windows, warm-up NaNs and smoothing) so values agree
+with ``ta`` to floating point tolerance; bench_indicators.py checks this.
+"""
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+EMA_WINDOWS = (5, 10, 20, 50, 100, 200)
+
+# Minimum candles before indicators are computed (same threshold as the
+# pandas/ta path in crypto_enhanced)
+MIN_CANDLES = 50
+
+
+def parse_klines(klines):
+    """Parse a Binance klines array into open_time/open/high/low/close/volume arrays"""
+    if not klines:
+        empty = np.empty(0)
+        return {'open_time': np.empty(0, dtype=np.int64), 'open': empty, 'high': empty,
+                'low': empty, 'close': empty, 'volume': empty}
+    values = np.array([k[1:6] for k in klines], dtype=np.float64)
+    # Equivalent of ta.utils.dropna: drop rows with NaN or non-positive values
+    valid = np.isfinite(values).all(axis=1) & (values > 0).all(axis=1)
+    if not valid.all():
+        values = values[valid]
+        klines = [k for k, keep in zip(klines, valid) if keep]
+    return {
+        'open_time': np.array([k[0] for k in klines], dtype=np.int64),
+        'open': values[:, 0],
+        'high': values[:, 1],
+        'low': values[:, 2],
+        'close': values[:, 3],
+        'volume': values[:, 4]
+    }
+
+
+def _ewm(values, alpha, seed=None):
+    """ewm(alpha=alpha, adjust=False).mean() without warm-up masking.
+
+    Evaluated in closed form per block: within a block
+    y[t] = d**t * (d * y_prev + alpha * cumsum(x[k] * d**-k)), with d = 1 - alpha
+    and the block length chosen so d**-k stays far from overflow.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        out[:] = values
+        return out
+    block = max(1, min(n, int(300.0 / -math.log(decay))))
+    powers = decay ** np.arange(block)
+    inverse = 1.0 / powers
+    previous = values[0] if seed is None else seed
+    for start in range(0, n, block):
+        chunk = values[start:start + block]
+        size = len(chunk)
+        acc = decay * previous + alpha * np.cumsum(chunk * inverse[:size])
+        out[start:start + size] = powers[:size] * acc
+        previous = out[start + size - 1]
+    return out
+
+
+def _mask_warmup(series, count):
+    series[:min(count, len(series))] = np.nan
+    return series
+
+
+def ema(values, window):
+    """Exponential moving average, matching ta.trend.EMAIndicator"""
+    return _mask_warmup(_ewm(values, 2.0 / (window + 1)), window - 1)
+
+
+def sma(values, window):
+    """Simple moving average, matching ta.trend.SMAIndicator"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return out
+
+
+def rolling_sum(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).sum(axis=1)
+    return out
+
+
+def rolling_std(values, window):
+    """Population standard deviation (ddof=0) over a rolling window"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).std(axis=1)
+    return out
+
+
+def rolling_min(values, window):
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).min(axis=1)
+    return out
+
+
+def rolling_max(values, window):
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        out[window - 1:] = sliding_window_view(values, window).max(axis=1)
+    return out
+
+
+def rsi(close, window=14):
+    """Relative Strength Index, matching ta.momentum.RSIIndicator"""
+    diff = np.diff(close, prepend=np.nan)
+    up = np.where(diff > 0, diff, 0.0)
+    down = np.where(diff < 0, -diff, 0.0)
+    alpha = 1.0 / window
+    ema_up = _mask_warmup(_ewm(up, alpha), window - 1)
+    ema_down = _mask_warmup(_ewm(down, alpha), window - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(ema_down == 0, 100.0, 100.0 - 100.0 / (1.0 + ema_up / ema_down))
+    out[np.isnan(ema_down)] = np.nan
+    return out
+
+
+def macd(close, window_fast=12, window_slow=26, window_sign=9):
+    """MACD line, signal line and histogram, matching ta.trend.MACD"""
+    line = ema(close, window_fast) - ema(close, window_slow)
+    signal = np.full(len(close), np.nan)
+    first = window_slow - 1
+    if len(close) > first:
+        # ta feeds the NaN-prefixed MACD line to ewm, which starts at the
+        # first valid value and counts min_periods over valid values only
+        signal[first:] = ema(line[first:], window_sign)
+    return line, signal, line - signal
+
+
+def bollinger_bands(close, window=20, window_dev=2):
+    """Upper, middle and lower bands, matching ta.volatility.BollingerBands"""
+    middle = sma(close, window)
+    deviation = rolling_std(close, window) * window_dev
+    return middle + deviation, middle, middle - deviation
+
+
+def stochastic(high, low, close, window=14, smooth_window=3):
+    """%K and %D, matching ta.momentum.StochasticOscillator"""
+    lowest = rolling_min(low, window)
+    highest = rolling_max(high, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 100.0 * (close - lowest) / (highest - lowest)
+    return k, sma(k, smooth_window)
+
+
+def true_range(high, low, close):
+    previous = np.concatenate(([np.nan], close[:-1]))
+    ranges = np.vstack((high - low, np.abs(high - previous), np.abs(low - previous)))
+    return np.nanmax(ranges, axis=0) if len(close) else np.empty(0)
+
+
+def atr(high, low, close, window=14):
+    """Average True Range with Wilder smoothing, matching ta.volatility.AverageTrueRange"""
+    ranges = true_range(high, low, close)
+    out = np.full(len(close), np.nan)
+    if len(close) >= window:
+        seed = ranges[:window].mean()
+        out[window - 1] = seed
+        out[window:] = _ewm(ranges[window:], 1.0 / window, seed=seed)
+    return out
+
+
+def vwap(high, low, close, volume, window=14):
+    """Rolling VWAP of the typical price, matching ta.volume.VolumeWeightedAveragePrice"""
+    typical = (high + low + close) / 3.0
+    return rolling_sum(typical * volume, window) / rolling_sum(volume, window)
+
+
+def _last(series, default):
+    if len(series) == 0:
+        return default
+    value = series[-1]
+    return default if math.isnan(value) else float(value)
+
+
+def indicator_series(data):
+    """Full indicator series for parsed klines, keyed like technical_indicators()"""
+    close, high, low, volume = data['close'], data['high'], data['low'], data['volume']
+    macd_line, macd_signal, macd_hist = macd(close)
+    bb_upper, bb_middle, bb_lower = bollinger_bands(close)
+    stoch_k, stoch_d = stochastic(high, low, close)
+    series = {
+        'rsi': rsi(close),
+        'macd': macd_line,
+        'macd_signal': macd_signal,
+        'macd_hist': macd_hist,
+        'bb_upper': bb_upper,
+        'bb_middle': bb_middle,
+        'bb_lower': bb_lower,
+        'ema_12': ema(close, 12),
+        'ema_26': ema(close, 26),
+        'sma_20': sma(close, 20),
+        'sma_50': sma(close, 50),
+        'volume_sma': sma(volume, 20),
+        'stoch_k': stoch_k,
+        'stoch_d': stoch_d,
+        'vwap': vwap(high, low, close, volume),
+        'atr': atr(high, low, close),
+        'current_price': close
+    }
+    for window in EMA_WINDOWS:
+        series[f'ema_{window}'] = ema(close, window)
+    return series
+
+
+def technical_indicators(data):
+    """Latest indicator values for parsed klines, in the /technical-analysis shape"""
+    price = float(data['close'][-1])
+    series = indicator_series(data)
+    defaults = {
+        'rsi': 50.0, 'macd': 0.0, 'macd_signal': 0.0, 'macd_hist': 0.0,
+        'bb_upper': price * 1.02, 'bb_lower': price * 0.98,
+        'volume_sma': float(data['volume'].mean()), 'stoch_k': 50.0, 'stoch_d': 50.0, 'atr': 0.0
+    }
+    return {name: _last(values, defaults.get(name, price)) for name, values in series.items()}
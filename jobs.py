@@ -0,0 +1,450 @@
+"""Background jobs for long-running analyses.
+
+Jobs live in a SQLite table, so a restart loses nothing. A running job is
+leased to the process that claimed it, which renews the lease every few
+seconds; jobs of a process that died (its pid is gone, or its lease ran out
+after JOBS_LEASE seconds) are queued again, while jobs another live process
+is running are left alone. A pool of
+worker threads claims queued jobs by priority (interactive, normal, batch)
+and then age; one worker only ever takes interactive jobs, so a backlog of
+batch work can never starve an interactive request. Handlers report
+progress through their JobContext, which is also where cancellation is
+noticed. The WebSocket server reads the same table to push job updates.
+
+    POST   /api/jobs        {"kind": "technical_analysis", "params": {...}, "priority": "batch"}
+    GET    /api/jobs/<id>
+    DELETE /api/jobs/<id>
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+
+JOBS_DB = os.environ.get('JOBS_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'jobs.db'))
+JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', '3'))
+# A running job whose process has not renewed its lease for this long is queued again (seconds)
+JOBS_LEASE = float(os.environ.get('JOBS_LEASE', '30'))
+# A stopping process lets its running jobs finish for this long, then queues them again (seconds)
+JOBS_DRAIN_SECONDS = float(os.environ.get('JOBS_DRAIN_SECONDS', '15'))
+
+PRIORITIES = {'interactive': 0, 'normal': 5, 'batch': 10}
+TERMINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+# Progress is written at most this often per job (seconds)
+PROGRESS_INTERVAL = 0.5
+# Finished jobs are deleted after this long (seconds)
+RETENTION = 24 * 3600
+
+JOBS_SUBMITTED = metrics.counter('jobs_submitted_total', 'Jobs submitted by kind and priority', ('kind', 'priority'))
+JOBS_FINISHED = metrics.counter('jobs_finished_total', 'Jobs finished by kind and state', ('kind', 'state'))
+JOB_WAIT_SECONDS = metrics.histogram('job_wait_seconds', 'Time jobs spent queued', ('priority',),
+                                     buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0))
+JOB_RUN_SECONDS = metrics.histogram('job_run_seconds', 'Time jobs spent running', ('kind',),
+                                    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0))
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# kind -> function(params, context) returning a JSON-serializable result
+HANDLERS = {}
+
+
+def register(kind, function):
+    """Make a job kind available to /jobs"""
+    HANDLERS[kind] = function
+    return function
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once its job has been cancelled"""
+
+
+class JobStore:
+    """The jobs table; every call uses its own short-lived connection"""
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )""")
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (('owner', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:  # tables created before leases
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['priority'] = next((name for name, value in PRIORITIES.items() if value == job['priority']),
+                               job['priority'])
+        return job
+
+    def submit(self, kind, params, priority='normal'):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, params, priority, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), PRIORITIES[priority], now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as db:
+            return self._job(db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def get_many(self, job_ids):
+        if not job_ids:
+            return []
+        marks = ','.join('?' * len(job_ids))
+        with self._connect() as db:
+            rows = db.execute(f"SELECT * FROM jobs WHERE id IN ({marks})", list(job_ids)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def claim(self, owner, max_priority=None):
+        """Atomically move the most urgent queued job to running, leased to owner, and return it"""
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            query = "SELECT * FROM jobs WHERE status = 'queued'"
+            args = []
+            if max_priority is not None:
+                query += " AND priority <= ?"
+                args.append(max_priority)
+            row = db.execute(query + " ORDER BY priority, created_at LIMIT 1", args).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?, owner = ?, "
+                           "heartbeat_at = ? WHERE id = ?", (now, now, owner, now, row['id']))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        if row is None:
+            return None
+        job = self._job(row)
+        job.update(status='running', started_at=now, owner=owner, heartbeat_at=now)
+        return job
+
+    def progress(self, job_id, progress, message=None):
+        """Record progress; returns whether cancellation was requested"""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET progress = ?, message = COALESCE(?, message), updated_at = ? WHERE id = ?",
+                       (progress, message, time.time(), job_id))
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def cancel_requested(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def finish(self, job_id, owner, status, result=None, error=None):
+        """Record the outcome, unless the job was given to another process meanwhile"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ?, "
+                "progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END "
+                "WHERE id = ? AND status = 'running' AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, now, status, job_id, owner)
+            )
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, or flag a running one; returns the job"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ? "
+                       "WHERE id = ? AND status = 'queued'", (now, now, job_id))
+            db.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? "
+                       "WHERE id = ? AND status = 'running'", (now, job_id))
+        return self.get(job_id)
+
+    def heartbeat(self, owner):
+        """Renew the lease of every job owner is running"""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?", (time.time(), owner))
+
+    def requeue_abandoned(self, lease=JOBS_LEASE):
+        """Queue jobs again whose process is gone: its pid no longer exists on this host,
+        or it has not renewed the lease for `lease` seconds"""
+        now = time.time()
+        with self._connect() as db:
+            owners = [row['owner'] for row in db.execute("SELECT DISTINCT owner FROM jobs WHERE status = 'running'")]
+            dead = [owner for owner in owners if not owner_alive(owner)]
+            requeue = "UPDATE jobs SET status = 'queued', started_at = NULL, progress = 0, owner = NULL, " \
+                      "heartbeat_at = NULL, updated_at = ? WHERE status = 'running' AND "
+            count = db.execute(requeue + "(heartbeat_at IS NULL OR heartbeat_at < ?)", (now, now - lease)).rowcount
+            for owner in dead:
+                count += db.execute(requeue + "owner = ?", (now, owner)).rowcount
+            return count
+
+    def release(self, owner):
+        """Queue again the jobs owner is still running; returns how many"""
+        with self._connect() as db:
+            return db.execute("UPDATE jobs SET status = 'queued', started_at = NULL, progress = 0, owner = NULL, "
+                              "heartbeat_at = NULL, updated_at = ? WHERE status = 'running' AND owner = ?",
+                              (time.time(), owner)).rowcount
+
+    def purge(self, older_than=RETENTION):
+        with self._connect() as db:
+            db.execute(f"DELETE FROM jobs WHERE status IN {TERMINAL_STATES} AND finished_at < ?",
+                       (time.time() - older_than,))
+
+
+def owner_id():
+    """This process as a lease owner: host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner):
+    """False only for an owner on this host whose pid is gone; other hosts go by their lease"""
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobContext:
+    """Handed to a handler: progress reporting and cancellation checks"""
+
+    def __init__(self, store, job):
+        self.store = store
+        self.job = job
+        self._last_write = 0.0
+
+    def progress(self, done, total=1, message=None):
+        """Report done/total; raises JobCancelled if the job was cancelled"""
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL or done >= total:
+            self._last_write = now
+            if self.store.progress(self.job['id'], round(done / total, 4) if total else 0.0, message):
+                raise JobCancelled()
+
+    def check_cancelled(self):
+        if self.store.cancel_requested(self.job['id']):
+            raise JobCancelled()
+
+
+class WorkerPool:
+    """Worker threads claiming jobs from the store; worker 0 serves interactive jobs only"""
+
+    def __init__(self, store, workers=JOBS_WORKERS, poll_interval=1.0, lease=JOBS_LEASE):
+        self.store = store
+        self.workers = max(2, workers)
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = owner_id()
+        self.running = 0  # workers claiming or running a job
+        self._stopping = threading.Event()
+        self._done = threading.Condition()
+        self._wakeup = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            self.requeue()
+            self.store.purge()
+            for index in range(self.workers):
+                max_priority = PRIORITIES['interactive'] if index == 0 else None
+                thread = threading.Thread(target=self._run, args=(max_priority,), name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._renew, name='job-lease', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def requeue(self):
+        requeued = self.store.requeue_abandoned(self.lease)
+        if requeued:
+            print(f"Requeued {requeued} interrupted job(s)")
+
+    def _renew(self):
+        """Renew this process's leases, and take back jobs of processes that died meanwhile"""
+        while True:
+            time.sleep(self.lease / 3)
+            try:
+                self.store.heartbeat(self.owner)
+                self.requeue()
+            except sqlite3.Error as e:
+                print(f"Job lease error: {e}")
+
+    def notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def stop(self, timeout=JOBS_DRAIN_SECONDS):
+        """Claim nothing more, give the running jobs `timeout` seconds and queue the rest again,
+        so the next process runs them instead of waiting out their lease"""
+        self._stopping.set()
+        self.notify()
+        deadline = time.monotonic() + timeout
+        with self._done:
+            while self.running and time.monotonic() < deadline:
+                self._done.wait(deadline - time.monotonic())
+        released = self.store.release(self.owner)
+        if released:
+            print(f"Queued {released} unfinished job(s) again")
+
+    def _run(self, max_priority):
+        while not self._stopping.is_set():
+            with self._done:
+                if self._stopping.is_set():
+                    break
+                self.running += 1
+            try:
+                job = self.store.claim(self.owner, max_priority)
+                if job is not None:
+                    self.execute(job)
+            except sqlite3.Error as e:
+                print(f"Job claim error: {e}")
+                job = None
+            finally:
+                with self._done:
+                    self.running -= 1
+                    self._done.notify_all()
+            if job is None:
+                # Also polls, so jobs queued by other processes are picked up
+                with self._wakeup:
+                    if not self._stopping.is_set():
+                        self._wakeup.wait(self.poll_interval)
+
+    def execute(self, job):
+        JOB_WAIT_SECONDS.observe(job['started_at'] - job['created_at'], priority=str(job['priority']))
+        started = time.perf_counter()
+        handler = HANDLERS.get(job['kind'])
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind '{job['kind']}'")
+            result = handler(job['params'], JobContext(self.store, job))
+            state = 'succeeded'
+            self.store.finish(job['id'], self.owner, state, result=result)
+        except JobCancelled:
+            state = 'cancelled'
+            self.store.finish(job['id'], self.owner, state)
+        except Exception as e:
+            state = 'failed'
+            print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            self.store.finish(job['id'], self.owner, state, error=str(e))
+        JOB_RUN_SECONDS.observe(time.perf_counter() - started, kind=job['kind'])
+        JOBS_FINISHED.inc(kind=job['kind'], state=state)
+
+
+_store = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
+
+
+def start_workers():
+    """Start the worker pool of this process (idempotent)"""
+    global _pool
+    store = get_store()
+    with _lock:
+        if _pool is None:
+            _pool = WorkerPool(store).start()
+        return _pool
+
+
+def stop_workers(timeout=JOBS_DRAIN_SECONDS):
+    """Drain the worker pool of this process, if it runs one"""
+    if _pool is not None:
+        _pool.stop(timeout)
+
+
+def submit(kind, params, priority='normal'):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priority must be one of {', '.join(PRIORITIES)}")
+    job_id = get_store().submit(kind, params, priority)
+    JOBS_SUBMITTED.inc(kind=kind, priority=priority)
+    if _pool is not None:
+        _pool.notify()  # otherwise the process running the workers claims it on its next poll
+    return job_id
+
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a job; returns its id right away"""
+    try:
+        data = request.get_json(silent=True) or {}
+        kind = data.get('kind')
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return jsonify({"success": False, "error": "params must be an object"}), 400
+        job_id = submit(kind, params, data.get('priority', 'normal'))
+        return jsonify({"success": True, "data": {"id": job_id, "status": "queued"}}), 202
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e), "kinds": sorted(HANDLERS)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_store().get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "data": job})
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = get_store().cancel(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "data": job})
@@ -3,11 +3,19 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, Response, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.crypto_simple_deploy import crypto_bp
+from src.routes.crypto_enhanced import crypto_bp, load_analytics, start_scanners, warm_analytics
+import alerts
+import correlation
+import export
+import jobs
+import metrics
+import news
+import profiler
+import userdata
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -17,6 +25,13 @@ CORS(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(crypto_bp, url_prefix='/api')
+app.register_blueprint(profiler.profiler_bp, url_prefix='/api')
+app.register_blueprint(jobs.jobs_bp, url_prefix='/api')
+app.register_blueprint(alerts.alerts_bp, url_prefix='/api')
+app.register_blueprint(export.export_bp, url_prefix='/api')
+app.register_blueprint(correlation.correlation_bp, url_prefix='/api')
+app.register_blueprint(userdata.userdata_bp, url_prefix='/api')
+profiler.init_app(app)
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
@@ -25,6 +40,54 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+# Analytics imports (numpy; pandas and ta with TA_ENGINE=ta): 'background' warms them after startup,
+# 'lazy' waits for the first indicator request, 'eager' loads them now.
+# FAST_START=1 is shorthand for 'lazy' on serverless/edge deploys.
+analytics_warmup = os.environ.get('ANALYTICS_WARMUP', 'lazy' if os.environ.get('FAST_START') == '1' else 'background')
+if analytics_warmup == 'eager':
+    load_analytics()
+
+
+def start_services(primary=True):
+    """Start this process's background threads. serve.py calls it in each worker after the fork;
+    the primary worker alone runs the job workers, the candle store sync and the producers (news,
+    correlation, scanners, order books) whose results the other workers read from the shared cache"""
+    if analytics_warmup == 'background':
+        warm_analytics()
+
+    # Resume jobs interrupted by the last shutdown
+    if primary:
+        jobs.start_workers()
+
+    # The producers must run somewhere for the other workers to read them;
+    # a lazy single process starts each one on its first request instead
+    if primary and (analytics_warmup != 'lazy' or os.environ.get('SHARED_CACHE')):
+        news.start_store()
+        correlation.start_tracker()
+        start_scanners()
+        import candle_store  # numpy: imported here rather than with the app
+        import orderbook
+        orderbook.start_books()
+        candle_store.start_sync()
+
+
+def stop_services():
+    """Finish or hand back this process's jobs and write out what it has queued;
+    serve.py calls it before a worker exits"""
+    jobs.stop_workers()
+    userdata.flush_pending()
+
+
+# serve.py imports the app in its master process and starts the services in the workers;
+# under `python main.py` the reloader's parent process only watches files and starts nothing
+reloader_parent = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+if os.environ.get('SERVE_PREFORK') != '1' and not reloader_parent:
+    start_services()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -43,4 +106,5 @@ def serve(path):
 
 
 if __name__ == '__main__':
+    # Development server (reloader and debugger); `python serve.py` serves production traffic
     app.run(host='0.0.0.0', port=5001, debug=True)
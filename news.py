@@ -0,0 +1,413 @@
+"""Crypto news ingestion with cached, batched headline sentiment.
+
+A NewsStore polls RSS/Atom feeds and, when CRYPTOPANIC_TOKEN is set, the
+CryptoPanic posts API in a background thread. Headlines are deduplicated by
+a hash of their normalized text, and only headlines never seen before are
+scored, in one batch per refresh; scores are kept per hash so nothing is
+scored twice. Readers (/news/<symbol> and the AI prediction) only touch the
+in-memory snapshot and never wait on a feed. Under serve.py only the primary
+worker polls (start_store); it publishes the snapshot to the shared cache and
+the other workers' stores read it from there.
+
+NEWS_FEEDS is a comma-separated list of feed URLs or local file paths, e.g.
+NEWS_FEEDS=fixtures/news_feed.xml for offline development and tests.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import metrics
+import shared_cache
+import upstream
+
+DEFAULT_FEEDS = (
+    "https://www.coindesk.com/arc/outboundfeeds/rss/",
+    "https://cointelegraph.com/rss"
+)
+NEWS_FEEDS = [f.strip() for f in os.environ.get('NEWS_FEEDS', ','.join(DEFAULT_FEEDS)).split(',') if f.strip()]
+
+CRYPTOPANIC_URL = "https://cryptopanic.com/api/v1/posts/"
+CRYPTOPANIC_TOKEN = os.environ.get('CRYPTOPANIC_TOKEN')
+
+NEWS_REFRESH_SECONDS = float(os.environ.get('NEWS_REFRESH_SECONDS', '300'))
+
+# Headlines older than this are dropped and ignored by the aggregate
+NEWS_MAX_AGE_HOURS = 48
+# Weight of a headline in the aggregate halves every this many hours
+SENTIMENT_HALF_LIFE_HOURS = 6
+MAX_ITEMS = 1000
+
+NEWS_ITEMS = metrics.gauge('news_items', 'Headlines held by the news store')
+NEWS_SCORED = metrics.counter('news_headlines_scored_total', 'Headlines passed to the sentiment scorer')
+NEWS_REFRESH_DURATION = metrics.histogram('news_refresh_seconds', 'Duration of a news feed refresh')
+
+# Quote assets stripped from trading pairs (BTCUSDT -> BTC)
+QUOTE_ASSETS = ('USDT', 'BUSD', 'USDC', 'FDUSD', 'USD')
+
+# Words marking a headline as being about a symbol; tickers that are also
+# common English words (dot, link, uni, atom) are left out
+SYMBOL_ALIASES = {
+    'BTC': ('bitcoin', 'btc'),
+    'ETH': ('ethereum', 'eth', 'ether'),
+    'BNB': ('bnb', 'binance'),
+    'SOL': ('solana', 'sol'),
+    'ADA': ('cardano', 'ada'),
+    'DOGE': ('dogecoin', 'doge'),
+    'DOT': ('polkadot',),
+    'LINK': ('chainlink',),
+    'LTC': ('litecoin', 'ltc'),
+    'UNI': ('uniswap',),
+    'AVAX': ('avalanche', 'avax'),
+    'MATIC': ('polygon', 'matic'),
+    'SHIB': ('shiba', 'shib'),
+    'TRX': ('tron', 'trx'),
+    'ATOM': ('cosmos',),
+    'XRP': ('xrp', 'ripple')
+}
+
+# Finance-flavoured sentiment lexicon, weights in [-3, 3]
+LEXICON = {
+    'surge': 2.5, 'surges': 2.5, 'soar': 2.5, 'soars': 2.5, 'rally': 2.0, 'rallies': 2.0,
+    'jump': 1.5, 'jumps': 1.5, 'gain': 1.5, 'gains': 1.5, 'rise': 1.0, 'rises': 1.0,
+    'record': 1.5, 'high': 1.0, 'highs': 1.0, 'bull': 2.0, 'bullish': 2.0, 'breakout': 2.0,
+    'approve': 2.0, 'approves': 2.0, 'approved': 2.0, 'approval': 2.0, 'adoption': 1.5,
+    'partnership': 1.5, 'launch': 1.0, 'launches': 1.0, 'upgrade': 1.5, 'inflows': 1.5,
+    'recover': 1.5, 'recovers': 1.5, 'rebound': 1.5, 'rebounds': 1.5, 'buy': 1.0, 'accumulate': 1.5,
+    'plunge': -2.5, 'plunges': -2.5, 'crash': -3.0, 'crashes': -3.0, 'tumble': -2.0, 'tumbles': -2.0,
+    'drop': -1.5, 'drops': -1.5, 'fall': -1.5, 'falls': -1.5, 'slump': -2.0, 'slumps': -2.0,
+    'low': -1.0, 'lows': -1.0, 'bear': -2.0, 'bearish': -2.0, 'sell': -1.0, 'selloff': -2.0,
+    'hack': -3.0, 'hacked': -3.0, 'exploit': -3.0, 'exploited': -3.0, 'scam': -3.0, 'fraud': -3.0,
+    'lawsuit': -2.0, 'sues': -2.0, 'ban': -2.5, 'bans': -2.5, 'banned': -2.5, 'reject': -2.0,
+    'rejects': -2.0, 'rejected': -2.0, 'liquidation': -1.5, 'liquidations': -1.5, 'outflows': -1.5,
+    'fear': -1.5, 'warning': -1.5, 'warns': -1.5, 'delay': -1.0, 'delays': -1.0, 'probe': -1.5,
+    'investigation': -1.5, 'crackdown': -2.5, 'bankruptcy': -3.0, 'insolvent': -3.0, 'losses': -1.5
+}
+NEGATIONS = {'not', 'no', 'never', "isn't", "doesn't", "won't", 'without'}
+
+# Terms that make a headline market-moving regardless of its tone
+HIGH_IMPACT_TERMS = {
+    'sec', 'etf', 'hack', 'hacked', 'exploit', 'ban', 'bans', 'banned', 'lawsuit', 'fed',
+    'bankruptcy', 'insolvent', 'listing', 'delisting', 'halving', 'crackdown'
+}
+IMPACT_WEIGHTS = {'high': 3.0, 'medium': 2.0, 'low': 1.0}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def headline_hash(title):
+    """Hash of a headline with case, punctuation and spacing normalized away"""
+    return hashlib.sha1(' '.join(tokenize(title)).encode('utf-8')).hexdigest()
+
+
+def base_symbol(symbol):
+    symbol = symbol.upper()
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)]
+    return symbol
+
+
+def score_batch(titles):
+    """Lexicon sentiment in [-1, 1] for each title"""
+    scores = []
+    for title in titles:
+        tokens = tokenize(title)
+        total = 0.0
+        for index, token in enumerate(tokens):
+            weight = LEXICON.get(token)
+            if weight is None:
+                continue
+            if index and tokens[index - 1] in NEGATIONS:
+                weight = -weight * 0.75
+            total += weight
+        # Same normalization as VADER's compound score
+        scores.append(total / math.sqrt(total * total + 15) if total else 0.0)
+    return scores
+
+
+def sentiment_label(score):
+    if score >= 0.15:
+        return 'positive'
+    if score <= -0.15:
+        return 'negative'
+    return 'neutral'
+
+
+def impact_rating(tokens, score):
+    if HIGH_IMPACT_TERMS.intersection(tokens) or abs(score) >= 0.6:
+        return 'high'
+    if abs(score) >= 0.3:
+        return 'medium'
+    return 'low'
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()  # RSS
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00')).timestamp()  # Atom, CryptoPanic
+    except ValueError:
+        return None
+
+
+def parse_feed(content, source):
+    """Entries of an RSS 2.0 or Atom document as dicts"""
+    root = ET.fromstring(content)
+    entries = []
+    for item in root.iter():
+        tag = item.tag.rsplit('}', 1)[-1]
+        if tag not in ('item', 'entry'):
+            continue
+        fields = {child.tag.rsplit('}', 1)[-1]: child for child in item}
+        title = (fields['title'].text or '').strip() if 'title' in fields else ''
+        if not title:
+            continue
+        link = fields.get('link')
+        url = None
+        if link is not None:
+            url = (link.text or '').strip() or link.get('href')
+        published = None
+        for name in ('pubDate', 'published', 'updated'):
+            if name in fields:
+                published = _parse_time(fields[name].text)
+                break
+        entries.append({'title': title, 'url': url, 'source': source,
+                        'published_at': published, 'currencies': ()})
+    return entries
+
+
+def parse_cryptopanic(data):
+    """Entries of a CryptoPanic posts API response"""
+    entries = []
+    for post in data.get('results', []):
+        title = (post.get('title') or '').strip()
+        if not title:
+            continue
+        source = (post.get('source') or {}).get('title') or 'CryptoPanic'
+        entries.append({
+            'title': title,
+            'url': post.get('url'),
+            'source': source,
+            'published_at': _parse_time(post.get('published_at')),
+            'currencies': tuple(c.get('code', '').upper() for c in post.get('currencies') or ())
+        })
+    return entries
+
+
+def encode_items(items):
+    return json.dumps([dict(item, _tokens=sorted(item['_tokens'])) for item in items]).encode('utf-8')
+
+
+def decode_items(data):
+    return [dict(item, _tokens=set(item['_tokens'])) for item in json.loads(data)]
+
+
+class NewsStore:
+    """Deduplicated, scored headlines refreshed in the background, or read from the shared cache
+    when this store is not started"""
+
+    def __init__(self, feeds=None, cryptopanic_token=CRYPTOPANIC_TOKEN,
+                 refresh_seconds=NEWS_REFRESH_SECONDS, scorer=score_batch, cache_size=20000):
+        self.feeds = list(NEWS_FEEDS if feeds is None else feeds)
+        self.cryptopanic_token = cryptopanic_token
+        self.refresh_seconds = refresh_seconds
+        self.scorer = scorer
+        self.cache_size = cache_size
+        self._scores = OrderedDict()  # headline hash -> score, survives item expiry
+        self._items = {}  # headline hash -> item
+        self._snapshot = None  # items sorted newest first, swapped atomically
+        self._lock = threading.Lock()
+        self._thread = None
+        self.last_error = None
+        self._updated_at = None
+        self.shared = shared_cache.Published('news', 'items', decode_items)
+
+    @property
+    def ready(self):
+        return self.snapshot() is not None
+
+    @property
+    def updated_at(self):
+        if self._thread is None and self.shared.stored_at is not None:
+            return self.shared.stored_at
+        return self._updated_at
+
+    def snapshot(self):
+        """Items newest first: this store's own, or the published ones if it does not refresh"""
+        if self._thread is None:
+            published = self.shared.latest()
+            if published is not None:
+                return published
+        return self._snapshot
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='news-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"News refresh error: {e}")
+            time.sleep(self.refresh_seconds)
+
+    def fetch_entries(self):
+        entries = []
+        for feed in self.feeds:
+            try:
+                if feed.startswith(('http://', 'https://')):
+                    response = upstream.get(feed, timeout=10)
+                    if response.status_code != 200:
+                        continue
+                    content = response.content
+                else:
+                    with open(feed, 'rb') as f:
+                        content = f.read()
+                entries.extend(parse_feed(content, feed))
+            except Exception as e:
+                print(f"News feed error ({feed}): {e}")
+        if self.cryptopanic_token:
+            try:
+                response = upstream.get(CRYPTOPANIC_URL, params={'auth_token': self.cryptopanic_token,
+                                                                 'public': 'true'}, timeout=10)
+                if response.status_code == 200:
+                    entries.extend(parse_cryptopanic(response.json()))
+            except Exception as e:
+                print(f"CryptoPanic error: {e}")
+        return entries
+
+    def score(self, titles_by_hash):
+        """Scores for {hash: title}, running the scorer once over the uncached titles"""
+        with self._lock:
+            scores = {h: self._scores[h] for h in titles_by_hash if h in self._scores}
+        missing = [h for h in titles_by_hash if h not in scores]
+        metrics.CACHE_LOOKUPS.inc(len(scores), cache='news_sentiment', result='hit')
+        metrics.CACHE_LOOKUPS.inc(len(missing), cache='news_sentiment', result='miss')
+        if missing:
+            NEWS_SCORED.inc(len(missing))
+            fresh = self.scorer([titles_by_hash[h] for h in missing])
+            scores.update(zip(missing, fresh))
+            with self._lock:
+                for h in missing:
+                    self._scores[h] = scores[h]
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def ingest(self, entries, now=None):
+        """Add entries, skipping headlines already held, and rebuild the snapshot"""
+        now = now or time.time()
+        new = {}
+        for entry in entries:
+            h = headline_hash(entry['title'])
+            if h in self._items or h in new:
+                continue
+            new[h] = entry
+        scores = self.score({h: entry['title'] for h, entry in new.items()}) if new else {}
+
+        for h, entry in new.items():
+            tokens = set(tokenize(entry['title']))
+            score = scores[h]
+            self._items[h] = dict(
+                entry,
+                id=h,
+                published_at=entry['published_at'] or now,
+                sentiment=sentiment_label(score),
+                sentiment_score=round(score, 4),
+                impact=impact_rating(tokens, score),
+                _tokens=tokens
+            )
+
+        cutoff = now - NEWS_MAX_AGE_HOURS * 3600
+        items = sorted((item for item in self._items.values() if item['published_at'] >= cutoff),
+                       key=lambda item: item['published_at'], reverse=True)[:MAX_ITEMS]
+        self._items = {item['id']: item for item in items}
+        self._snapshot = items
+        self._updated_at = now
+        NEWS_ITEMS.set(len(items))
+        # Outlives a couple of failed refreshes, not the producing process
+        self.shared.publish(encode_items(items), 3 * self.refresh_seconds, 'application/json', stored_at=now)
+        return len(new)
+
+    def refresh(self):
+        with NEWS_REFRESH_DURATION.time():
+            return self.ingest(self.fetch_entries())
+
+    @staticmethod
+    def _matches(item, symbol):
+        if symbol in item['currencies']:
+            return True
+        aliases = SYMBOL_ALIASES.get(symbol, (symbol.lower(),))
+        return not item['_tokens'].isdisjoint(aliases)
+
+    def headlines(self, symbol, limit=20):
+        """Newest headlines about a symbol (BTC or BTCUSDT)"""
+        symbol = base_symbol(symbol)
+        results = []
+        for item in self.snapshot() or ():
+            if self._matches(item, symbol):
+                results.append({k: v for k, v in item.items() if not k.startswith('_')})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def sentiment(self, symbol, now=None):
+        """Recency- and impact-weighted sentiment for a symbol, or None without headlines"""
+        symbol = base_symbol(symbol)
+        now = now or time.time()
+        total = weights = 0.0
+        count = 0
+        for item in self.snapshot() or ():
+            if not self._matches(item, symbol):
+                continue
+            age_hours = max(0.0, now - item['published_at']) / 3600
+            weight = IMPACT_WEIGHTS[item['impact']] * 0.5 ** (age_hours / SENTIMENT_HALF_LIFE_HOURS)
+            total += weight * item['sentiment_score']
+            weights += weight
+            count += 1
+        if not count:
+            return None
+        score = total / weights
+        return {'score': round(score, 4), 'label': sentiment_label(score), 'headlines': count}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Shared news store: refreshing in the process that runs start_store, reading the published
+    snapshot elsewhere (refreshing on first use when there is no shared cache)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = NewsStore()
+            if shared_cache.get_cache() is None:
+                _store.start()
+        return _store
+
+
+def start_store():
+    """Poll the feeds in this process and publish the headlines to the other workers"""
+    return get_store().start()
@@ -0,0 +1,638 @@
+"""Local order books kept in sync from depth snapshots and diff updates.
+
+Each side of a book is a pair of sorted NumPy arrays (price key, size) plus
+cumulative size and notional, so fills, depth and wall queries are a
+searchsorted or a slice instead of a walk over a dict. Bids are keyed by
+negative price so both sides are ascending with the best level first. A
+diff builds new arrays and swaps them in with one attribute assignment;
+readers in Flask threads never lock and always see a whole side.
+
+Books follow the Binance procedure: open the diff stream, buffer it, fetch
+a REST snapshot, drop events at or below its lastUpdateId and from then on
+require each event to start right after the previous one. A gap means
+events were lost and the book is rebuilt from a new snapshot on the same
+stream; repeated refetches back off so a flapping stream cannot hammer the
+REST endpoint.
+
+ORDERBOOK_FEED selects the source: 'binance' (default) or 'simulated', a
+local random-walk feed with the same message shapes for offline
+development and tests.
+
+Under serve.py only the primary worker keeps books (start_books). The other
+workers put the symbols they are asked for in the shared cache; the primary
+watches them and publishes their books there every PUBLISH_INTERVAL.
+"""
+import asyncio
+import io
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+import metrics
+import shared_cache
+import upstream
+
+BINANCE_DEPTH_URL = "https://api.binance.com/api/v3/depth"
+BINANCE_EXCHANGE_INFO_URL = "https://api.binance.com/api/v3/exchangeInfo"
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/ws"
+
+ORDERBOOK_FEED = os.environ.get('ORDERBOOK_FEED', 'binance')
+SNAPSHOT_LIMIT = 1000
+# Levels kept per side; diffs far from the touch beyond this are trimmed
+MAX_LEVELS = 5000
+# Books nobody queried for this long are closed
+ORDERBOOK_IDLE_SECONDS = float(os.environ.get('ORDERBOOK_IDLE_SECONDS', '600'))
+MAX_BOOKS = int(os.environ.get('ORDERBOOK_MAX_BOOKS', '20'))
+# Pauses between snapshot refetches and reconnects double from SYNC_RETRY up to SYNC_RETRY_MAX (seconds)
+SYNC_RETRY = 1.0
+SYNC_RETRY_MAX = 30.0
+# The list of symbols a book may be kept for is refetched after this (seconds)
+LISTING_TTL = 3600
+# The primary worker publishes the books other workers asked for this often (seconds)
+PUBLISH_INTERVAL = 1.0
+# A published book older than this is no longer served (seconds)
+PUBLISHED_TTL = 10.0
+# Workers renew their request for a book this often while they are asked for it (seconds)
+REQUEST_RENEW = 60.0
+
+# Walls: price buckets of WALL_BUCKET_PCT holding WALL_MULTIPLE times the median bucket
+WALL_BUCKET_PCT = 0.05
+WALL_MULTIPLE = 4.0
+WALL_RANGE_PCT = 5.0
+
+ORDERBOOK_UPDATES = metrics.counter('orderbook_updates_total', 'Depth diff events by result', ('result',))
+ORDERBOOK_RESYNCS = metrics.counter('orderbook_resyncs_total', 'Order books rebuilt from a snapshot', ('reason',))
+ORDERBOOK_APPLY_SECONDS = metrics.histogram('orderbook_apply_seconds', 'Time to apply one depth diff',
+                                            buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+ORDERBOOKS = metrics.gauge('orderbooks', 'Order books being kept in sync')
+
+
+class UnknownSymbol(ValueError):
+    """The feed does not list the symbol, so no book is kept for it"""
+
+
+class BookGap(Exception):
+    """Diff events were missed; the book must be rebuilt from a snapshot"""
+
+
+class BookSide:
+    """One immutable side of a book; apply() returns a new side"""
+
+    __slots__ = ('sign', 'keys', 'sizes', 'cum_size', 'cum_notional')
+
+    def __init__(self, sign, keys=None, sizes=None):
+        self.sign = sign  # 1.0 for asks, -1.0 for bids
+        self.keys = np.empty(0) if keys is None else keys
+        self.sizes = np.empty(0) if sizes is None else sizes
+        prices = self.keys * sign
+        self.cum_size = np.cumsum(self.sizes)
+        self.cum_notional = np.cumsum(self.sizes * prices)
+
+    @classmethod
+    def from_levels(cls, sign, levels):
+        """Side from [[price, size], ...] as sent by Binance (strings)"""
+        keys, sizes = _levels(sign, levels)
+        keep = sizes > 0
+        return cls(sign, keys[keep][:MAX_LEVELS], sizes[keep][:MAX_LEVELS])
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def prices(self):
+        return self.keys * self.sign
+
+    def apply(self, levels):
+        """New side with the [[price, size], ...] diff applied; size 0 removes a level"""
+        if not levels:
+            return self
+        keys, sizes = _levels(self.sign, levels)
+        position = np.searchsorted(self.keys, keys)
+        found = position < len(self.keys)
+        found[found] = self.keys[position[found]] == keys[found]
+        new_sizes = self.sizes.copy()
+        new_sizes[position[found]] = sizes[found]
+        insert = ~found & (sizes > 0)
+        new_keys = np.insert(self.keys, position[insert], keys[insert])
+        new_sizes = np.insert(new_sizes, position[insert], sizes[insert])
+        keep = new_sizes > 0
+        if not keep.all():
+            new_keys, new_sizes = new_keys[keep], new_sizes[keep]
+        return BookSide(self.sign, new_keys[:MAX_LEVELS], new_sizes[:MAX_LEVELS])
+
+    def best(self):
+        if not len(self.keys):
+            return None
+        return float(self.keys[0] * self.sign), float(self.sizes[0])
+
+    def fill(self, quantity):
+        """Average price and reach of a market order of `quantity` against this side"""
+        if quantity <= 0 or not len(self.keys):
+            return None
+        index = int(np.searchsorted(self.cum_size, quantity))
+        filled = min(quantity, float(self.cum_size[-1]))
+        if index >= len(self.keys):
+            notional = float(self.cum_notional[-1])
+            index = len(self.keys) - 1
+        else:
+            before_size = float(self.cum_size[index - 1]) if index else 0.0
+            before_notional = float(self.cum_notional[index - 1]) if index else 0.0
+            notional = before_notional + (quantity - before_size) * float(self.keys[index] * self.sign)
+        return {
+            'average_price': notional / filled,
+            'worst_price': float(self.keys[index] * self.sign),
+            'filled': filled,
+            'complete': filled >= quantity,
+            'levels': index + 1
+        }
+
+    def depth_within(self, reference, pct):
+        """Size and notional resting within pct of reference"""
+        bound = reference * (1 + pct / 100.0 * self.sign) * self.sign
+        index = int(np.searchsorted(self.keys, bound, side='right'))
+        if not index:
+            return 0.0, 0.0
+        return float(self.cum_size[index - 1]), float(self.cum_notional[index - 1])
+
+    def buckets(self, reference, bucket_pct, range_pct):
+        """Size per price bucket of bucket_pct moving away from reference: (bucket prices, sizes)"""
+        bound = reference * (1 + range_pct / 100.0 * self.sign) * self.sign
+        end = int(np.searchsorted(self.keys, bound, side='right'))
+        if not end:
+            return np.empty(0), np.empty(0)
+        step = reference * bucket_pct / 100.0
+        distance = self.keys[:end] - reference * self.sign
+        index = np.maximum(distance // step, 0).astype(np.int64)
+        sizes = np.bincount(index, weights=self.sizes[:end])
+        prices = (reference * self.sign + (np.arange(len(sizes)) + 0.5) * step) * self.sign
+        return prices, sizes
+
+    def walls(self, reference, bucket_pct=WALL_BUCKET_PCT, multiple=WALL_MULTIPLE, range_pct=WALL_RANGE_PCT, limit=3):
+        """Buckets holding `multiple` times the median bucket size, nearest first"""
+        prices, sizes = self.buckets(reference, bucket_pct, range_pct)
+        occupied = sizes > 0
+        if occupied.sum() < 3:
+            return []
+        threshold = multiple * float(np.median(sizes[occupied]))
+        walls = []
+        for index in np.flatnonzero(sizes >= threshold)[:limit]:
+            price = float(prices[index])
+            walls.append({
+                'price': price,
+                'size': float(sizes[index]),
+                'notional': float(sizes[index]) * price,
+                'distance_pct': abs(price - reference) / reference * 100
+            })
+        return walls
+
+
+def _levels(sign, levels):
+    """Sorted unique (keys, sizes) from [[price, size], ...]; the last size per price wins"""
+    array = np.asarray(levels, dtype=np.float64).reshape(-1, 2)
+    keys = array[:, 0] * sign
+    order = np.argsort(keys, kind='stable')
+    keys, sizes = keys[order], array[order, 1]
+    last = np.append(keys[1:] != keys[:-1], True)
+    return keys[last], sizes[last]
+
+
+class OrderBook:
+    """Bids and asks of one symbol at last_update_id"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol.upper()
+        self.bids = BookSide(-1.0)
+        self.asks = BookSide(1.0)
+        self.last_update_id = None
+        self.updated_at = None
+
+    @property
+    def synced(self):
+        return self.last_update_id is not None
+
+    def load_snapshot(self, snapshot):
+        """Reset from a /depth snapshot ({'lastUpdateId', 'bids', 'asks'})"""
+        self.bids = BookSide.from_levels(-1.0, snapshot['bids'])
+        self.asks = BookSide.from_levels(1.0, snapshot['asks'])
+        self.last_update_id = int(snapshot['lastUpdateId'])
+        self.updated_at = time.time()
+
+    def apply_diff(self, event):
+        """Apply a depthUpdate event (U, u, b, a); False if it predates the book, BookGap on a gap"""
+        if event['u'] <= self.last_update_id:
+            ORDERBOOK_UPDATES.inc(result='stale')
+            return False
+        if event['U'] > self.last_update_id + 1:
+            ORDERBOOK_UPDATES.inc(result='gap')
+            raise BookGap(f"{self.symbol}: expected update {self.last_update_id + 1}, got {event['U']}")
+        started = time.perf_counter()
+        self.bids = self.bids.apply(event['b'])
+        self.asks = self.asks.apply(event['a'])
+        self.last_update_id = event['u']
+        self.updated_at = time.time()
+        ORDERBOOK_APPLY_SECONDS.observe(time.perf_counter() - started)
+        ORDERBOOK_UPDATES.inc(result='applied')
+        return True
+
+    def encode(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, bid_keys=self.bids.keys, bid_sizes=self.bids.sizes, ask_keys=self.asks.keys,
+                 ask_sizes=self.asks.sizes, state=np.array([self.last_update_id, self.updated_at], dtype=np.float64))
+        return buffer.getvalue()
+
+    @classmethod
+    def decode(cls, symbol, data):
+        book = cls(symbol)
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            book.bids = BookSide(-1.0, arrays['bid_keys'], arrays['bid_sizes'])
+            book.asks = BookSide(1.0, arrays['ask_keys'], arrays['ask_sizes'])
+            last_update_id, book.updated_at = arrays['state']
+        book.last_update_id = int(last_update_id)
+        return book
+
+    def age(self):
+        return time.time() - self.updated_at if self.updated_at else None
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def slippage(self, side, quantity):
+        """Cost of a market order: side 'buy' walks the asks, 'sell' the bids"""
+        mid = self.mid()
+        fill = (self.asks if side == 'buy' else self.bids).fill(quantity)
+        if fill is None or mid is None:
+            return None
+        fill['slippage_pct'] = abs(fill['average_price'] - mid) / mid * 100
+        return fill
+
+    def walls(self, **kwargs):
+        """Nearest liquidity walls: bid walls as support, ask walls as resistance"""
+        mid = self.mid()
+        if mid is None:
+            return {'support': [], 'resistance': []}
+        return {'support': self.bids.walls(mid, **kwargs), 'resistance': self.asks.walls(mid, **kwargs)}
+
+    def summary(self, depth_pct=1.0):
+        bid, ask = self.bids.best(), self.asks.best()
+        mid = self.mid()
+        bid_depth = self.bids.depth_within(mid, depth_pct) if mid else (0.0, 0.0)
+        ask_depth = self.asks.depth_within(mid, depth_pct) if mid else (0.0, 0.0)
+        return {
+            'symbol': self.symbol,
+            'best_bid': bid[0] if bid else None,
+            'best_ask': ask[0] if ask else None,
+            'mid': mid,
+            'spread_pct': (ask[0] - bid[0]) / mid * 100 if mid else None,
+            f'bid_depth_{depth_pct:g}pct': bid_depth[1],
+            f'ask_depth_{depth_pct:g}pct': ask_depth[1],
+            'levels': {'bids': len(self.bids), 'asks': len(self.asks)},
+            'last_update_id': self.last_update_id,
+            'age': self.age()
+        }
+
+
+class BinanceDepthSource:
+    """REST snapshots and the @depth@100ms diff stream of Binance"""
+
+    def __init__(self):
+        self.symbols = None  # symbols trading on Binance, from exchangeInfo
+        self.symbols_at = 0.0
+        self._lock = threading.Lock()
+
+    def listed(self, symbol):
+        """Whether Binance trades symbol"""
+        with self._lock:
+            if self.symbols is None or time.monotonic() - self.symbols_at > LISTING_TTL:
+                response = upstream.get(BINANCE_EXCHANGE_INFO_URL, timeout=10)
+                if response.status_code == 200:
+                    self.symbols = {s['symbol'] for s in response.json().get('symbols', [])
+                                    if s.get('status') == 'TRADING'}
+                    if not response.stale:
+                        self.symbols_at = time.monotonic()
+                elif self.symbols is None:
+                    raise RuntimeError(f"symbol list unavailable ({response.status_code})")
+        return symbol in self.symbols
+
+    def snapshot(self, symbol):
+        response = upstream.get(BINANCE_DEPTH_URL, params={'symbol': symbol, 'limit': SNAPSHOT_LIMIT}, timeout=10)
+        if response.status_code != 200 or response.stale:
+            raise RuntimeError(f"depth snapshot for {symbol} unavailable ({response.status_code})")
+        return response.json()
+
+    async def stream(self, symbol):
+        import websockets
+        async with websockets.connect(f"{BINANCE_STREAM_URL}/{symbol.lower()}@depth@100ms") as connection:
+            async for message in connection:
+                yield json.loads(message)
+
+
+class SimulatedDepthSource:
+    """Local stand-in for Binance: a random-walk book emitting snapshots and consistent diffs"""
+
+    def __init__(self, price=30000.0, tick=5.0, levels=400, interval=0.1, seed=None):
+        self.price = price
+        self.tick = tick
+        self.levels = levels
+        self.interval = interval
+        self.seed = seed
+        self.books = {}  # symbol -> [last update id, {price: size} bids, {price: size} asks, mid, rng]
+        self._lock = threading.Lock()
+
+    def listed(self, symbol):
+        return True
+
+    def _state(self, symbol):
+        if symbol not in self.books:
+            rng = random.Random(f"{self.seed}:{symbol}")
+            mid = self.price
+            bids, asks = {}, {}
+            for level in range(1, self.levels + 1):
+                bids[round(mid - level * self.tick, 8)] = self._size(rng, mid - level * self.tick)
+                asks[round(mid + level * self.tick, 8)] = self._size(rng, mid + level * self.tick)
+            self.books[symbol] = [1, bids, asks, mid, rng]
+        return self.books[symbol]
+
+    def _size(self, rng, price):
+        # Every 50th tick is a wall, so support and resistance show up in tests
+        return rng.uniform(0.1, 2.0) * (20 if round(price / self.tick) % 50 == 0 else 1)
+
+    def snapshot(self, symbol):
+        with self._lock:
+            update_id, bids, asks, _, _ = self._state(symbol)
+            return {
+                'lastUpdateId': update_id,
+                'bids': [[f"{p:.8f}", f"{s:.8f}"] for p, s in sorted(bids.items(), reverse=True)],
+                'asks': [[f"{p:.8f}", f"{s:.8f}"] for p, s in sorted(asks.items())]
+            }
+
+    def next_event(self, symbol, changes=10):
+        """Mutate the book and return the diff event for it"""
+        with self._lock:
+            state = self._state(symbol)
+            update_id, bids, asks, mid, rng = state
+            mid = round(mid + rng.choice((-1, 0, 1)) * self.tick, 8)
+            diff_bids, diff_asks = {}, {}
+            # Levels crossed by the moved mid are taken out
+            for price in [p for p in bids if p >= mid]:
+                del bids[price]
+                diff_bids[price] = 0.0
+            for price in [p for p in asks if p <= mid]:
+                del asks[price]
+                diff_asks[price] = 0.0
+            for _ in range(changes):
+                level = rng.randint(1, self.levels)
+                side, diff, price = (bids, diff_bids, round(mid - level * self.tick, 8)) if rng.random() < 0.5 \
+                    else (asks, diff_asks, round(mid + level * self.tick, 8))
+                size = 0.0 if rng.random() < 0.2 else self._size(rng, price)
+                if size:
+                    side[price] = size
+                else:
+                    side.pop(price, None)
+                diff[price] = size
+            # One update id per changed level, as on Binance
+            state[0] = update_id + max(1, len(diff_bids) + len(diff_asks))
+            state[3] = mid
+            return {
+                'e': 'depthUpdate', 's': symbol, 'U': update_id + 1, 'u': state[0],
+                'b': [[f"{p:.8f}", f"{s:.8f}"] for p, s in diff_bids.items()],
+                'a': [[f"{p:.8f}", f"{s:.8f}"] for p, s in diff_asks.items()]
+            }
+
+    async def stream(self, symbol):
+        while True:
+            await asyncio.sleep(self.interval)
+            yield self.next_event(symbol)
+
+
+class BookManager:
+    """Keeps books of watched symbols in sync on an event loop in a daemon thread; with publish=True
+    it also keeps the books other workers request and publishes them to the shared cache"""
+
+    def __init__(self, source, publish=False):
+        self.source = source
+        self.publish = publish
+        self.books = {}  # symbol -> synced OrderBook
+        self.ready = {}  # symbol -> threading.Event set once the first snapshot is loaded
+        self.last_used = {}
+        self.tasks = {}
+        self.synced_at = {}  # symbol -> when its book last came in sync
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._loop is None:
+            started = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._loop.call_soon(started.set)
+                self._loop.create_task(self._expire_idle())
+                if self.publish:
+                    self._loop.create_task(self._serve_workers())
+                self._loop.run_forever()
+
+            threading.Thread(target=run, name='orderbooks', daemon=True).start()
+            started.wait()
+        return self
+
+    def watch(self, symbol):
+        """Start keeping a book for symbol (no-op if already watched); UnknownSymbol if the feed
+        does not list it, so junk symbols never take one of the MAX_BOOKS slots"""
+        symbol = symbol.upper()
+        if symbol not in self.tasks and not self.source.listed(symbol):
+            raise UnknownSymbol(f"{symbol} is not listed")
+        with self._lock:
+            self.last_used[symbol] = time.time()
+            if symbol in self.tasks:
+                return
+            if len(self.tasks) >= MAX_BOOKS:
+                raise RuntimeError(f"Order book limit of {MAX_BOOKS} symbols reached")
+            self.start()
+            self.ready[symbol] = threading.Event()
+            self.tasks[symbol] = asyncio.run_coroutine_threadsafe(self._maintain(symbol), self._loop)
+
+    def get(self, symbol, wait=0.0):
+        """The synced book of symbol, watching it first; None if not synced within `wait` seconds"""
+        symbol = symbol.upper()
+        self.watch(symbol)
+        if wait:
+            self.ready[symbol].wait(wait)
+        return self.books.get(symbol)
+
+    async def _maintain(self, symbol):
+        delay = SYNC_RETRY
+        while True:
+            started = time.time()
+            try:
+                await self._sync(symbol)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ORDERBOOK_RESYNCS.inc(reason='error')
+                print(f"Order book error for {symbol}: {e}")
+            if self.synced_at.get(symbol, 0.0) > started:
+                delay = SYNC_RETRY  # the stream had been in sync: reconnect promptly
+            await asyncio.sleep(delay)
+            delay = min(SYNC_RETRY_MAX, delay * 2)
+
+    async def _snapshot(self, symbol, delay):
+        await asyncio.sleep(delay)
+        return await asyncio.to_thread(self.source.snapshot, symbol)
+
+    async def _sync(self, symbol):
+        """Follow the stream of symbol; gaps refetch the snapshot (with backoff) on the same stream"""
+        book = OrderBook(symbol)
+        buffered = []
+        snapshot = None
+        delay = 0.0
+        try:
+            async for event in self.source.stream(symbol):
+                if book.synced:
+                    try:
+                        book.apply_diff(event)
+                        continue
+                    except BookGap as e:
+                        ORDERBOOK_RESYNCS.inc(reason='gap')
+                        print(f"Order book resync: {e}")
+                        book = OrderBook(symbol)
+                        buffered = []
+                        snapshot = None
+                # Buffer from the first event, then fetch the snapshot that must cover it
+                buffered.append(event)
+                if snapshot is None:
+                    snapshot = asyncio.ensure_future(self._snapshot(symbol, delay))
+                    delay = min(SYNC_RETRY_MAX, max(SYNC_RETRY, delay * 2))
+                if not snapshot.done():
+                    continue
+                book.load_snapshot(snapshot.result())
+                snapshot = None
+                if buffered[0]['U'] > book.last_update_id + 1:
+                    ORDERBOOK_RESYNCS.inc(reason='stale_snapshot')
+                    print(f"Order book resync: {symbol} snapshot {book.last_update_id} predates the stream")
+                    book = OrderBook(symbol)
+                    continue
+                for pending in buffered:
+                    book.apply_diff(pending)
+                buffered = []
+                delay = 0.0
+                self.books[symbol] = book
+                self.synced_at[symbol] = time.time()
+                self.ready[symbol].set()
+        finally:
+            if snapshot is not None:
+                snapshot.cancel()
+
+    async def _serve_workers(self):
+        published = {}  # symbol -> (last_update_id, when) of its published book
+        while True:
+            await asyncio.sleep(PUBLISH_INTERVAL)
+            cache = shared_cache.get_cache()
+            if cache is None:
+                continue
+            requested = await asyncio.to_thread(cache.keys, 'orderbook_watch')
+            for symbol in requested:
+                try:
+                    # watch() may fetch the symbol list: not on the loop
+                    await asyncio.to_thread(self.watch, symbol)
+                    book = self.books.get(symbol)
+                    last_id, at = published.get(symbol, (None, 0.0))
+                    if book is not None and (book.last_update_id != last_id or time.time() - at > PUBLISHED_TTL / 2):
+                        published[symbol] = (book.last_update_id, time.time())
+                        await asyncio.to_thread(cache.set, 'orderbook', symbol, 200, 'application/x-npz',
+                                                book.encode(), PUBLISHED_TTL)
+                except Exception as e:
+                    print(f"Order book publishing error for {symbol}: {e}")
+            for symbol in set(published) - set(requested):
+                del published[symbol]
+
+    async def _expire_idle(self):
+        while True:
+            await asyncio.sleep(60)
+            now = time.time()
+            with self._lock:
+                for symbol, used in list(self.last_used.items()):
+                    if now - used > ORDERBOOK_IDLE_SECONDS:
+                        self.tasks.pop(symbol).cancel()
+                        self.books.pop(symbol, None)
+                        self.ready.pop(symbol, None)
+                        self.synced_at.pop(symbol, None)
+                        del self.last_used[symbol]
+
+
+class SharedBooks:
+    """Books kept by the primary worker: requested and read through the shared cache"""
+
+    def __init__(self, source):
+        self.source = source
+        self.books = {}  # symbol -> Published book
+        self.requested = {}  # symbol -> when the request was last renewed
+        self._lock = threading.Lock()
+
+    def watch(self, symbol):
+        """Ask the primary worker to keep a book for symbol; UnknownSymbol if the feed does not list it"""
+        symbol = symbol.upper()
+        if symbol not in self.books and not self.source.listed(symbol):
+            raise UnknownSymbol(f"{symbol} is not listed")
+        now = time.time()
+        with self._lock:
+            if symbol not in self.books:
+                self.books[symbol] = shared_cache.Published(
+                    'orderbook', symbol, lambda data: OrderBook.decode(symbol, data), interval=PUBLISH_INTERVAL / 4)
+            renew = now - self.requested.get(symbol, 0.0) >= REQUEST_RENEW
+            if renew:
+                self.requested[symbol] = now
+        if renew:
+            shared_cache.get_cache().set('orderbook_watch', symbol, 200, None, b'', ORDERBOOK_IDLE_SECONDS)
+
+    def get(self, symbol, wait=0.0):
+        """The last published book of symbol, requesting it first; None if none arrives within `wait` seconds"""
+        symbol = symbol.upper()
+        self.watch(symbol)
+        published = self.books[symbol]
+        deadline = time.monotonic() + wait
+        book = published.latest()
+        while book is None and time.monotonic() < deadline:
+            time.sleep(published.interval)
+            book = published.latest()
+        return book
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def _source():
+    return SimulatedDepthSource() if ORDERBOOK_FEED == 'simulated' else BinanceDepthSource()
+
+
+def get_books():
+    """Process-wide books for ORDERBOOK_FEED: kept here, or by the primary worker when this
+    process has a shared cache and does not run start_books"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                if shared_cache.get_cache() is not None:
+                    _manager = SharedBooks(_source())
+                else:
+                    _manager = BookManager(_source())
+                    ORDERBOOKS.set_function(lambda: len(_manager.books))
+    return _manager
+
+
+def start_books():
+    """Keep the books of this process and of the other workers' requests here (one process per host)"""
+    global _manager
+    with _manager_lock:
+        if not isinstance(_manager, BookManager):
+            _manager = BookManager(_source(), publish=True).start()
+            ORDERBOOKS.set_function(lambda: len(_manager.books))
+    return _manager
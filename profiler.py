@@ -0,0 +1,230 @@
+"""Sampling profiler for hot-path analysis without restarting the server.
+
+Per request: send header ``X-Profile: <PROFILE_TOKEN>`` (or ``?profile=<token>``)
+to run that request under a sampler. Add ``profile_format=collapsed`` to get
+the stacks back instead of the normal body; otherwise they are written to
+PROFILE_DIR and the file name is returned in the ``X-Profile-File`` header.
+
+Continuous: a low-rate sampler aggregates the stacks of every in-flight
+request over a rolling window, served by ``/api/profile/continuous``.
+
+Stacks use the collapsed format understood by flamegraph.pl, speedscope and
+inferno: one ``root;caller;leaf count`` line per distinct stack.
+"""
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import Blueprint, Response, g, jsonify, request
+
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+
+REQUEST_INTERVAL = 0.001      # 1 kHz while a single request is profiled
+CONTINUOUS_INTERVAL = 0.02    # 50 Hz across all requests
+CONTINUOUS_WINDOW = 60        # seconds per aggregation window
+
+profiler_bp = Blueprint('profiler', __name__)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Root-first ';'-joined labels of a frame and its callers"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels)
+
+
+def format_collapsed(counts):
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class StackSampler:
+    """Samples the stacks of a set of threads from a background thread"""
+
+    def __init__(self, thread_ids, interval=REQUEST_INTERVAL):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id in list(self.thread_ids):
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.counts[collapse_stack(frame)] += 1
+                self.samples += 1
+
+
+class ContinuousProfiler:
+    """Aggregates hot stacks of all in-flight requests per time window"""
+
+    def __init__(self, interval=CONTINUOUS_INTERVAL, window=CONTINUOUS_WINDOW):
+        self.interval = interval
+        self.window = window
+        self.active_threads = set()
+        self.sampler = None
+        self.previous = None
+        self.window_started = None
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def running(self):
+        return self.sampler is not None
+
+    def start(self):
+        with self._lock:
+            if self.sampler is not None:
+                return
+            self._generation += 1
+            self.window_started = time.time()
+            self.sampler = StackSampler(self.active_threads, self.interval).start()
+            threading.Thread(target=self._rotate_loop, args=(self._generation,), daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            sampler, self.sampler = self.sampler, None
+        if sampler is not None:
+            self._finish_window(sampler)
+
+    def _rotate_loop(self, generation):
+        while True:
+            time.sleep(self.window)
+            with self._lock:
+                sampler = self.sampler
+                if sampler is None or generation != self._generation:
+                    return
+                self.sampler = StackSampler(self.active_threads, self.interval).start()
+            self._finish_window(sampler)
+
+    def _finish_window(self, sampler):
+        counts = sampler.stop()
+        self.previous = {
+            'started': self.window_started,
+            'ended': time.time(),
+            'samples': sampler.samples,
+            'counts': counts
+        }
+        self.window_started = time.time()
+
+    def snapshot(self, current=False):
+        """Last completed window, or the one in progress when current is set"""
+        sampler = self.sampler
+        if current and sampler is not None:
+            return {
+                'started': self.window_started,
+                'ended': time.time(),
+                'samples': sampler.samples,
+                'counts': Counter(sampler.counts)
+            }
+        return self.previous
+
+
+continuous = ContinuousProfiler()
+
+
+def is_authorized(value):
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value, PROFILE_TOKEN)
+
+
+def requested_token():
+    return request.headers.get('X-Profile') or request.args.get('profile')
+
+
+def store_profile(counts):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'request'}-{uuid.uuid4().hex[:8]}.collapsed"
+    with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+        f.write(format_collapsed(counts))
+    return name
+
+
+def before_request():
+    thread_id = threading.get_ident()
+    continuous.active_threads.add(thread_id)
+    if request.blueprint != profiler_bp.name and is_authorized(requested_token()):
+        g.profile_sampler = StackSampler({thread_id}).start()
+
+
+def after_request(response):
+    sampler = g.pop('profile_sampler', None)
+    if sampler is None:
+        return response
+    counts = sampler.stop()
+    if request.args.get('profile_format') == 'collapsed' or not PROFILE_DIR:
+        response = Response(format_collapsed(counts), mimetype='text/plain')
+    else:
+        response.headers['X-Profile-File'] = store_profile(counts)
+    response.headers['X-Profile-Samples'] = str(sampler.samples)
+    response.headers['X-Profile-Duration'] = f"{sampler.duration:.6f}"
+    return response
+
+
+def teardown_request(exc):
+    continuous.active_threads.discard(threading.get_ident())
+    sampler = g.pop('profile_sampler', None)
+    if sampler is not None:
+        sampler.stop()
+
+
+def init_app(app):
+    """Install the per-request hooks and start continuous sampling if configured"""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    if os.environ.get('PROFILE_CONTINUOUS') == '1':
+        continuous.start()
+
+
+@profiler_bp.route('/profile/continuous', methods=['GET', 'POST', 'DELETE'])
+def continuous_profile():
+    """Start (POST), stop (DELETE) or dump (GET) continuous sampling"""
+    if not is_authorized(requested_token()):
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+
+    if request.method == 'POST':
+        continuous.start()
+        return jsonify({"success": True, "data": {"running": True, "window": continuous.window}})
+    if request.method == 'DELETE':
+        continuous.stop()
+        return jsonify({"success": True, "data": {"running": False}})
+
+    window = continuous.snapshot(current=request.args.get('current') == '1')
+    if window is None:
+        return jsonify({"success": False, "error": "No samples collected yet"}), 404
+    response = Response(format_collapsed(window['counts']), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(window['samples'])
+    response.headers['X-Profile-Window'] = f"{window['started']:.3f}-{window['ended']:.3f}"
+    return response
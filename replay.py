@@ -0,0 +1,73 @@
+"""Replay buffers so reconnecting WebSocket clients receive only what they missed.
+
+The publishing node stamps every market message with ``epoch`` (random per
+publisher start), a global ``seq`` and ``prev_seq``, the seq of the previous
+message on the same topic. Every node keeps the last N encoded messages of
+each topic. A client that reconnects with ``resume_from=<seq>&epoch=<epoch>``
+gets the messages after that seq from these buffers; it only needs a full
+snapshot when the epoch changed or a topic's buffer no longer reaches back
+to its seq, which prev_seq lets a node decide exactly.
+"""
+import uuid
+from collections import deque
+
+
+class Sequencer:
+    """Stamps outgoing messages on the publishing node"""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.last_by_topic = {}
+
+    def stamp(self, topic, message):
+        self.seq += 1
+        message['epoch'] = self.epoch
+        message['seq'] = self.seq
+        message['prev_seq'] = self.last_by_topic.get(topic, 0)
+        self.last_by_topic[topic] = self.seq
+        return message
+
+
+class ReplayBuffer:
+    """Bounded per-topic history of encoded messages"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.epoch = None
+        self.last_seq = 0
+        self.topics = {}  # topic -> deque of (seq, prev_seq, encoded)
+
+    def append(self, topic, message, encoded):
+        """Remember a message; returns False for duplicates and stale replays"""
+        epoch, seq, prev_seq = message.get('epoch'), message.get('seq'), message.get('prev_seq', 0)
+        if seq is None:
+            return True  # unsequenced: relay, but it cannot be replayed
+        if epoch != self.epoch:
+            # The publisher restarted; nothing from the old epoch can be resumed
+            self.epoch = epoch
+            self.topics.clear()
+            self.last_seq = 0
+        history = self.topics.setdefault(topic, deque(maxlen=self.size))
+        if history and seq <= history[-1][0]:
+            return False
+        if history and prev_seq != history[-1][0]:
+            history.clear()  # messages of this topic were missed; keep only what is contiguous
+        history.append((seq, prev_seq, encoded))
+        self.last_seq = max(self.last_seq, seq)
+        return True
+
+    def since(self, seq, epoch):
+        """Encoded messages after seq in order, or None when a full snapshot is needed"""
+        if epoch != self.epoch or seq > self.last_seq:
+            return None
+        missed = []
+        for history in self.topics.values():
+            if not history:
+                continue
+            oldest_seq, oldest_prev, _ = history[0]
+            if oldest_seq > seq and oldest_prev > seq:
+                return None  # a message of this topic after seq was evicted or never seen
+            missed.extend(entry for entry in history if entry[0] > seq)
+        missed.sort(key=lambda entry: entry[0])
+        return [encoded for _, _, encoded in missed]
@@ -0,0 +1,144 @@
+"""Pre-serialized JSON responses with cached compressed variants.
+
+Hot routes serialize once into an EncodedBody. Its gzip and brotli
+variants are produced on first demand and kept alongside, so a body shared
+through the coalescing cache is compressed at most once per encoding.
+orjson is used when installed, and upstream JSON that needs no
+transformation is wrapped into the response envelope as raw bytes.
+"""
+import gzip
+import json
+import threading
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+JSON_MIMETYPE = 'application/json'
+
+
+def dumps(data):
+    """Serialize to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+class EncodedBody:
+    """Identity bytes plus lazily built, cached compressed variants"""
+
+    def __init__(self, data, content_type=JSON_MIMETYPE):
+        self.data = data
+        self.content_type = content_type
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        if encoding == 'identity':
+            return self.data
+        body = self._variants.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._variants.get(encoding)
+                if body is None:
+                    if encoding == 'br':
+                        body = brotli.compress(self.data, quality=BROTLI_QUALITY)
+                    else:
+                        body = gzip.compress(self.data, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._variants[encoding] = body
+        return body
+
+
+def negotiate_encoding(body):
+    """Best encoding the client accepts for this body"""
+    if len(body.data) < MIN_COMPRESS_SIZE:
+        return 'identity'
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def encoded_response(body, status=200, headers=None):
+    """Response for an EncodedBody, compressed per Accept-Encoding"""
+    encoding = negotiate_encoding(body)
+    response = Response(body.variant(encoding), status=status, content_type=body.content_type)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def json_body(data, status=200):
+    """Uncompressed fast-encoded response for views wrapped by @coalesced"""
+    return Response(dumps(data), status=status, content_type=JSON_MIMETYPE)
+
+
+def json_response(data, status=200):
+    """Serialize data with the fast encoder into a (possibly compressed) response"""
+    return encoded_response(EncodedBody(dumps(data)), status)
+
+
+def stale_fields(response):
+    """Envelope fields flagging a stale upstream copy (see upstream.UpstreamResponse)"""
+    if not response.stale:
+        return {}
+    return {'stale': True, 'data_age': round(response.age, 1)}
+
+
+def raw_envelope(raw_data, extra=None):
+    """Wrap already-encoded upstream JSON as {"success": true, "data": <raw>, ...extra}"""
+    parts = [b'{"success":true,"data":', raw_data]
+    for key, value in (extra or {}).items():
+        parts.append(b',' + dumps(key) + b':' + dumps(value))
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+def project(data, fields):
+    """Keep only the given dotted field paths, e.g. ['id', 'market_data.current_price.usd']"""
+    result = {}
+    # Deepest paths first so a shallower path selecting a whole parent wins
+    for path in sorted(fields, key=lambda f: f.count('.'), reverse=True):
+        keys = [key for key in path.split('.') if key]
+        value = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            if not keys:
+                continue
+            target = result
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return result
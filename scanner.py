@@ -0,0 +1,301 @@
+"""Market-wide indicator scanner over Binance USDT pairs.
+
+A MarketScanner keeps the latest /technical-analysis indicators of every
+trading USDT pair for one interval as columnar NumPy arrays, refreshed in
+the background. Queries are filter expressions over those columns, e.g.
+``rsi < 30 and macd_cross == 1``, evaluated as vectorized masks, so a
+query over every pair takes milliseconds and never touches Binance.
+
+Only the SCANNER_INTERVALS are scanned: each costs a klines request per
+pair every refresh. One process refreshes them (start_scanners, called by
+main.start_services in the primary worker) and publishes the columns to
+the shared cache; the other workers' scanners only read them from there.
+Without a shared cache a scanner starts refreshing on first use.
+"""
+import ast
+import io
+import operator
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, reduce
+
+import numpy as np
+
+import indicators
+import shared_cache
+
+BINANCE_INTERVALS = ('1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '8h', '12h', '1d', '3d', '1w', '1M')
+SCANNER_INTERVALS = tuple(i for i in os.environ.get('SCANNER_INTERVALS', '15m,1h').split(',') if i in BINANCE_INTERVALS)
+# Published columns outlive a few missed refreshes, not a producer that is gone (seconds)
+SHARED_STATE_TTL = 900
+
+# Fields available to filters and sorting: everything technical_indicators()
+# returns plus macd_cross (1 bullish / -1 bearish cross on the last candle)
+SCAN_FIELDS = (
+    'rsi', 'macd', 'macd_signal', 'macd_hist', 'macd_cross', 'bb_upper', 'bb_middle', 'bb_lower',
+    'ema_12', 'ema_26', 'sma_20', 'sma_50', 'volume_sma', 'stoch_k', 'stoch_d', 'vwap', 'atr',
+    'current_price'
+) + tuple(f'ema_{window}' for window in indicators.EMA_WINDOWS)
+
+MAX_PAGE_SIZE = 500
+
+
+class ScanError(ValueError):
+    """Invalid filter expression or query parameter"""
+
+
+_COMPARISONS = {
+    ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt,
+    ast.GtE: operator.ge, ast.Eq: operator.eq, ast.NotEq: operator.ne
+}
+_ARITHMETIC = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+
+@lru_cache(maxsize=256)
+def compile_filter(expression):
+    """Parse a filter expression into a function of the column dict.
+
+    Supports field names, numbers, + - * /, comparisons (chained too),
+    and/or/not and parentheses. Anything else is rejected.
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ScanError(f"Invalid filter expression: {e.msg}")
+    return _compile(tree.body)
+
+
+def _compile(node):
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(value) for value in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        # Pairwise, so a scalar operand (`rsi < 30 and 1`) broadcasts against the columns
+        return lambda columns: reduce(combine, [part(columns) for part in parts])
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile(node.operand)
+        if isinstance(node.op, ast.Not):
+            return lambda columns: np.logical_not(operand(columns))
+        if isinstance(node.op, ast.USub):
+            return lambda columns: -operand(columns)
+    if isinstance(node, ast.Compare):
+        left = _compile(node.left)
+        steps = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in _COMPARISONS:
+                raise ScanError("Unsupported comparison operator")
+            steps.append((_COMPARISONS[type(op)], _compile(comparator)))
+
+        def compare(columns):
+            current = left(columns)
+            mask = None
+            for function, right in steps:
+                value = right(columns)
+                with np.errstate(invalid='ignore'):
+                    result = function(current, value)
+                mask = result if mask is None else mask & result
+                current = value
+            return mask
+        return compare
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+        function = _ARITHMETIC[type(node.op)]
+        left, right = _compile(node.left), _compile(node.right)
+
+        def arithmetic(columns):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return function(left(columns), right(columns))
+        return arithmetic
+    if isinstance(node, ast.Name):
+        if node.id not in SCAN_FIELDS:
+            raise ScanError(f"Unknown field '{node.id}'")
+        name = node.id
+        return lambda columns: columns[name]
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = float(node.value)
+        return lambda columns: value
+    raise ScanError("Unsupported syntax in filter expression")
+
+
+def symbol_indicators(klines):
+    """Indicator row for one symbol, or None when there are too few candles"""
+    data = indicators.parse_klines(klines)
+    if len(data['close']) < indicators.MIN_CANDLES:
+        return None
+    row = indicators.technical_indicators(data)
+    line, signal, _ = indicators.macd(data['close'])
+    before, after = line[-2] - signal[-2], line[-1] - signal[-1]
+    row['macd_cross'] = 1.0 if before <= 0 < after else -1.0 if before >= 0 > after else 0.0
+    return row
+
+
+def encode_state(symbols, columns):
+    buffer = io.BytesIO()
+    np.savez(buffer, symbols=symbols, **columns)
+    return buffer.getvalue()
+
+
+def decode_state(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        return arrays['symbols'], {field: arrays[field] for field in SCAN_FIELDS}
+
+
+class MarketScanner:
+    """Columnar indicator state for every trading USDT pair on one interval.
+
+    A scanner started with start() refreshes the columns itself and publishes
+    them to the shared cache; one that is never started reads them from there.
+    """
+
+    def __init__(self, interval, fetch, base_url, limit=200, refresh_seconds=60, workers=8):
+        self.interval = interval
+        self.fetch = fetch
+        self.base_url = base_url
+        self.limit = limit
+        self.refresh_seconds = refresh_seconds
+        self.workers = workers
+        # (symbols array, {field: float64 array}, updated_at) swapped atomically
+        self._state = None
+        self._thread = None
+        self.last_error = None
+        self.last_refresh_seconds = None
+        self.shared = shared_cache.Published('scanner', interval, decode_state)
+
+    @property
+    def ready(self):
+        return self.state() is not None
+
+    def state(self):
+        """(symbols, columns, updated_at): this scanner's own, or the published ones if it does not refresh"""
+        if self._thread is not None:
+            return self._state
+        published = self.shared.latest()
+        return published + (self.shared.stored_at,) if published is not None else None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'scanner-{self.interval}', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Scanner refresh error ({self.interval}): {e}")
+            time.sleep(self.refresh_seconds)
+
+    def usdt_symbols(self):
+        response = self.fetch(f"{self.base_url}/exchangeInfo", timeout=10)
+        if response.status_code != 200:
+            raise RuntimeError(f"exchangeInfo returned {response.status_code}")
+        return sorted(
+            s['symbol'] for s in response.json().get('symbols', [])
+            if s.get('quoteAsset') == 'USDT' and s.get('status') == 'TRADING'
+        )
+
+    def _symbol_row(self, symbol):
+        params = {'symbol': symbol, 'interval': self.interval, 'limit': self.limit}
+        try:
+            response = self.fetch(f"{self.base_url}/klines", params=params, timeout=10)
+            if response.status_code != 200:
+                return None
+            return symbol_indicators(response.json())
+        except Exception:
+            return None
+
+    def refresh(self):
+        """Recompute indicators for every USDT pair and swap in the new columns"""
+        started = time.perf_counter()
+        symbols = self.usdt_symbols()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            rows = list(pool.map(self._symbol_row, symbols))
+        kept = [(symbol, row) for symbol, row in zip(symbols, rows) if row is not None]
+        columns = {
+            field: np.array([row.get(field, np.nan) for _, row in kept], dtype=np.float64)
+            for field in SCAN_FIELDS
+        }
+        symbols = np.array([symbol for symbol, _ in kept])
+        updated_at = time.time()
+        self._state = (symbols, columns, updated_at)
+        self.last_refresh_seconds = time.perf_counter() - started
+        self.shared.publish(encode_state(symbols, columns), SHARED_STATE_TTL, 'application/x-npz', stored_at=updated_at)
+
+    def query(self, expression=None, sort=None, page=1, page_size=50, fields=None):
+        """Filter, sort and page the current columns"""
+        state = self.state()
+        if state is None:
+            raise ScanError("Scanner is still warming up")
+        symbols, columns, updated_at = state
+
+        if expression:
+            mask = np.asarray(compile_filter(expression)(columns), dtype=bool)
+            if mask.ndim == 0:
+                mask = np.full(len(symbols), bool(mask))
+            matches = np.flatnonzero(mask)
+        else:
+            matches = np.arange(len(symbols))
+
+        if sort:
+            descending = sort.startswith('-')
+            key = sort.lstrip('+-')
+            if key not in SCAN_FIELDS:
+                raise ScanError(f"Unknown sort field '{key}'")
+            values = columns[key][matches]
+            values = np.where(np.isnan(values), np.inf if not descending else -np.inf, values)
+            order = np.argsort(-values if descending else values, kind='stable')
+            matches = matches[order]
+
+        fields = [f for f in (fields or SCAN_FIELDS) if f in SCAN_FIELDS]
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        page = max(1, int(page))
+        selected = matches[(page - 1) * page_size:page * page_size]
+
+        results = []
+        for index in selected:
+            row = {'symbol': str(symbols[index])}
+            for field in fields:
+                value = columns[field][index]
+                row[field] = None if np.isnan(value) else float(value)
+            results.append(row)
+
+        return {
+            'interval': self.interval,
+            'updated_at': updated_at,
+            'universe': int(len(symbols)),
+            'total': int(len(matches)),
+            'page': page,
+            'page_size': page_size,
+            'results': results
+        }
+
+
+_scanners = {}
+_scanners_lock = threading.Lock()
+
+
+def get_scanner(interval, fetch, base_url, **kwargs):
+    """Shared scanner for one of SCANNER_INTERVALS: the refreshing one in the process running
+    start_scanners, else one reading the shared cache (refreshing here when there is none)"""
+    if interval not in SCANNER_INTERVALS:
+        raise ScanError(f"Unsupported interval '{interval}', scanned intervals: {', '.join(SCANNER_INTERVALS)}")
+    with _scanners_lock:
+        scanner = _scanners.get(interval)
+        if scanner is None:
+            scanner = _scanners[interval] = MarketScanner(interval, fetch, base_url, **kwargs)
+            if shared_cache.get_cache() is None:
+                scanner.start()
+        return scanner
+
+
+def start_scanners(fetch, base_url, **kwargs):
+    """Refresh every SCANNER_INTERVALS scanner in this process (one process per host)"""
+    with _scanners_lock:
+        for interval in SCANNER_INTERVALS:
+            scanner = _scanners.get(interval)
+            if scanner is None:
+                scanner = _scanners[interval] = MarketScanner(interval, fetch, base_url, **kwargs)
+            scanner.start()
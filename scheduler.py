@@ -0,0 +1,201 @@
+"""Periodic task scheduler for market data refreshes.
+
+Each task has its own loop and one of two triggers:
+
+* fixed rate: due every ``interval`` seconds measured from the previous due
+  time, so a slow run does not push every later run back;
+* candle aligned: due ``offset`` seconds after every multiple of
+  ``interval`` since the epoch, i.e. just after each candle closes.
+
+A run never overlaps the previous run of the same task; due times that pass
+while a run is still going are skipped and counted. Optional jitter spreads
+tasks of many nodes apart. Blocking callables run in a worker thread. How
+late each run started against its due time is recorded per task.
+
+The scheduler lives on an asyncio loop (the WebSocket server's) or on a
+private loop in a daemon thread via start_in_thread() for Flask processes.
+"""
+import asyncio
+import inspect
+import random
+import threading
+import time
+
+import metrics
+
+SCHEDULER_LATENESS = metrics.histogram('scheduler_lateness_seconds', 'How late scheduled runs started', ('task',),
+                                       buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+SCHEDULER_DURATION = metrics.histogram('scheduler_run_seconds', 'Duration of scheduled runs', ('task',))
+SCHEDULER_RUNS = metrics.counter('scheduler_runs_total', 'Scheduled runs by result', ('task', 'result'))
+
+# Binance interval names in seconds, for candle-aligned tasks
+INTERVAL_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, '2h': 7200, '4h': 14400,
+    '6h': 21600, '8h': 28800, '12h': 43200, '1d': 86400, '3d': 259200, '1w': 604800
+}
+
+
+class ScheduledTask:
+    """One periodic task and its run statistics"""
+
+    def __init__(self, name, function, interval, aligned=False, offset=0.0, jitter=0.0,
+                 run_at_start=True, blocking=None):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.aligned = aligned
+        self.offset = offset
+        self.jitter = jitter
+        self.run_at_start = run_at_start
+        # Plain functions are assumed to block (HTTP calls) and go to a thread
+        self.blocking = not inspect.iscoroutinefunction(function) if blocking is None else blocking
+        self.running = False
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0
+        self.next_due = None
+        self.last_started = None
+        self.last_duration = None
+        self.last_lateness = None
+        self.last_error = None
+
+    def first_due(self, now):
+        if self.aligned:
+            return self.next_aligned(now)
+        return now if self.run_at_start else now + self.interval
+
+    def next_aligned(self, now):
+        boundary = (now - self.offset) // self.interval * self.interval + self.offset
+        return boundary + self.interval if boundary <= now else boundary
+
+    def following_due(self, due, now):
+        """Next due time after a run that was due at `due` finished at `now`"""
+        if self.aligned:
+            following = self.next_aligned(max(now, due))
+            missed = int((following - due) // self.interval) - 1
+        else:
+            following = due + self.interval
+            missed = 0
+            if following <= now:
+                missed = int((now - following) // self.interval) + 1
+                following += missed * self.interval
+        self.skipped += max(0, missed)
+        if missed > 0:
+            SCHEDULER_RUNS.inc(missed, task=self.name, result='skipped')
+        return following
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'aligned': self.aligned,
+            'running': self.running,
+            'runs': self.runs,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'next_due': self.next_due,
+            'last_started': self.last_started,
+            'last_duration': self.last_duration,
+            'last_lateness': self.last_lateness,
+            'last_error': self.last_error
+        }
+
+
+class Scheduler:
+    def __init__(self):
+        self.tasks = {}
+        self._handles = []
+        self._loop = None
+        self._thread = None
+
+    def every(self, name, function, interval, jitter=0.0, run_at_start=True, blocking=None):
+        """Fixed-rate task"""
+        return self._add(ScheduledTask(name, function, interval, jitter=jitter,
+                                       run_at_start=run_at_start, blocking=blocking))
+
+    def on_candle_close(self, name, function, interval, offset=2.0, jitter=0.0, blocking=None):
+        """Task run `offset` seconds after every close of an `interval` candle ('1h' or seconds)"""
+        seconds = INTERVAL_SECONDS[interval] if isinstance(interval, str) else interval
+        return self._add(ScheduledTask(name, function, seconds, aligned=True, offset=offset,
+                                       jitter=jitter, blocking=blocking))
+
+    def _add(self, task):
+        if task.name in self.tasks:
+            raise ValueError(f"Task '{task.name}' is already scheduled")
+        self.tasks[task.name] = task
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, task)
+        return task
+
+    def start(self):
+        """Start every task on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        for task in self.tasks.values():
+            self._spawn(task)
+        return self
+
+    def start_in_thread(self):
+        """Run the scheduler on its own event loop in a daemon thread"""
+        if self._thread is None:
+            started = threading.Event()
+
+            def run():
+                async def main():
+                    self.start()
+                    started.set()
+                    await asyncio.Event().wait()
+                asyncio.run(main())
+
+            self._thread = threading.Thread(target=run, name='scheduler', daemon=True)
+            self._thread.start()
+            started.wait()
+        return self
+
+    def _spawn(self, task):
+        self._handles.append(asyncio.ensure_future(self._task_loop(task)))
+
+    def stop(self):
+        for handle in self._handles:
+            handle.cancel()
+        self._handles = []
+
+    async def _task_loop(self, task):
+        due = task.first_due(time.time())
+        while True:
+            jitter = random.uniform(0, task.jitter) if task.jitter else 0.0
+            task.next_due = due + jitter
+            delay = task.next_due - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._run_once(task, task.next_due)
+            due = task.following_due(due, time.time())
+
+    async def _run_once(self, task, due):
+        started = time.time()
+        task.last_lateness = max(0.0, started - due)
+        task.last_started = started
+        task.running = True
+        SCHEDULER_LATENESS.observe(task.last_lateness, task=task.name)
+        perf_started = time.perf_counter()
+        try:
+            if task.blocking:
+                await asyncio.to_thread(task.function)
+            else:
+                await task.function()
+            task.runs += 1
+            SCHEDULER_RUNS.inc(task=task.name, result='ok')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            task.errors += 1
+            task.last_error = str(e)
+            SCHEDULER_RUNS.inc(task=task.name, result='error')
+            print(f"Scheduled task {task.name} failed: {e}")
+        finally:
+            task.running = False
+            task.last_duration = time.perf_counter() - perf_started
+            SCHEDULER_DURATION.observe(task.last_duration, task=task.name)
+
+    def status(self):
+        return {name: task.status() for name, task in self.tasks.items()}
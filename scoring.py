@@ -0,0 +1,429 @@
+"""Prediction scorers for /ai-prediction: the hand-written rules and a tree model.
+
+A scorer turns prediction inputs ({'indicators', 'fear_greed',
+'news_sentiment'}) into {'prediction', 'confidence', 'explanation',
+'signal_breakdown'}. SCORER picks one per process:
+
+* 'rules' (default): the weighted indicator, Fear & Greed and news rules;
+* 'model': a gradient-boosted tree model over scale-free indicator
+  features, trained offline from the candle store by train_model.py;
+* 'ensemble': model and rule probabilities averaged.
+
+The rules still run under the model scorers so the signal breakdown and
+explanations stay the same; the breakdown then also carries the model's
+class probabilities. The model is loaded once per process from
+MODEL_PATH and evaluated with vectorised tree traversal; concurrent
+requests are collected into micro-batches of up to MAX_BATCH rows or
+BATCH_WAIT seconds so that many symbols cost one model call.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+
+SCORER = os.environ.get('SCORER', 'rules')
+MODEL_PATH = os.environ.get('MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'prediction_gbt.npz'))
+
+MAX_BATCH = 64
+BATCH_WAIT = 0.005
+
+# Model output classes, in probability column order
+CLASSES = ('SHORT', 'HOLD', 'LONG')
+
+# Indicator values the features are computed from
+FEATURE_INPUTS = ('rsi', 'stoch_k', 'stoch_d', 'macd', 'macd_signal', 'bb_upper', 'bb_middle', 'bb_lower',
+                  'sma_20', 'sma_50', 'ema_12', 'ema_26', 'atr', 'vwap', 'current_price')
+
+FEATURES = ('rsi', 'stoch_k', 'stoch_d', 'macd_pct', 'macd_hist_pct', 'bb_position', 'bb_width_pct',
+            'sma20_gap', 'sma50_gap', 'sma_trend', 'ema_trend', 'atr_pct', 'vwap_gap')
+
+SCORING_BATCH = metrics.histogram('scoring_batch_size', 'Rows per model call', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 512))
+SCORING_SECONDS = metrics.histogram('scoring_model_seconds', 'Duration of one model call',
+                                    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+
+
+def features(values):
+    """Feature matrix from indicator values: scalars (one row) or equal-length arrays (one row per candle)"""
+    def get(name, default=np.nan):
+        value = values.get(name)
+        return np.asarray(default if value is None else value, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price = get('current_price')
+        macd_line, macd_signal = get('macd', 0.0), get('macd_signal', 0.0)
+        bb_upper, bb_middle, bb_lower = get('bb_upper'), get('bb_middle'), get('bb_lower')
+        sma_20, sma_50 = get('sma_20'), get('sma_50')
+        columns = [
+            get('rsi'),
+            get('stoch_k'),
+            get('stoch_d'),
+            macd_line / price * 100,
+            (macd_line - macd_signal) / price * 100,
+            (price - bb_lower) / (bb_upper - bb_lower),
+            (bb_upper - bb_lower) / bb_middle * 100,
+            (price / sma_20 - 1) * 100,
+            (price / sma_50 - 1) * 100,
+            (sma_20 / sma_50 - 1) * 100,
+            (get('ema_12') / get('ema_26') - 1) * 100,
+            get('atr') / price * 100,
+            (price / get('vwap') - 1) * 100
+        ]
+    matrix = np.column_stack(np.broadcast_arrays(*columns))
+    matrix[~np.isfinite(matrix)] = np.nan
+    return matrix
+
+
+def batch_features(rows):
+    """Feature matrix of many indicator dicts in one vectorised pass"""
+    columns = {}
+    for name in FEATURE_INPUTS:
+        values = [row.get(name) for row in rows]
+        columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return features(columns)
+
+
+def rule_score(indicators, fear_greed=None, news_sentiment=None):
+    """The weighted indicator, Fear & Greed and news rules"""
+    signals = []
+    confidence_factors = []
+    explanations = []
+
+    # RSI Analysis (30% weight)
+    rsi = indicators.get('rsi', 50)
+    if rsi < 30:
+        signals.append('LONG')
+        confidence_factors.append(0.3)
+        explanations.append(f"RSI ({rsi:.1f}) indicates oversold conditions")
+    elif rsi > 70:
+        signals.append('SHORT')
+        confidence_factors.append(0.3)
+        explanations.append(f"RSI ({rsi:.1f}) indicates overbought conditions")
+    elif rsi < 45:
+        signals.append('LONG')
+        confidence_factors.append(0.15)
+        explanations.append(f"RSI ({rsi:.1f}) shows bearish momentum weakening")
+    elif rsi > 55:
+        signals.append('SHORT')
+        confidence_factors.append(0.15)
+        explanations.append(f"RSI ({rsi:.1f}) shows bullish momentum weakening")
+    else:
+        signals.append('HOLD')
+        confidence_factors.append(0.1)
+
+    # MACD Analysis (25% weight)
+    macd = indicators.get('macd', 0)
+    macd_signal = indicators.get('macd_signal', 0)
+    if macd and macd_signal:
+        if macd > macd_signal and macd > 0:
+            signals.append('LONG')
+            confidence_factors.append(0.25)
+            explanations.append("MACD is above signal line in positive territory (strong bullish)")
+        elif macd > macd_signal:
+            signals.append('LONG')
+            confidence_factors.append(0.15)
+            explanations.append("MACD is above signal line (bullish)")
+        elif macd < macd_signal and macd < 0:
+            signals.append('SHORT')
+            confidence_factors.append(0.25)
+            explanations.append("MACD is below signal line in negative territory (strong bearish)")
+        else:
+            signals.append('SHORT')
+            confidence_factors.append(0.15)
+            explanations.append("MACD is below signal line (bearish)")
+
+    # Bollinger Bands Analysis (20% weight)
+    current_price = indicators.get('current_price', 0)
+    bb_upper = indicators.get('bb_upper', 0)
+    bb_lower = indicators.get('bb_lower', 0)
+    bb_middle = indicators.get('bb_middle', 0)
+
+    if current_price and bb_upper and bb_lower and bb_middle:
+        if current_price <= bb_lower:
+            signals.append('LONG')
+            confidence_factors.append(0.2)
+            explanations.append("Price at lower Bollinger Band (oversold)")
+        elif current_price >= bb_upper:
+            signals.append('SHORT')
+            confidence_factors.append(0.2)
+            explanations.append("Price at upper Bollinger Band (overbought)")
+        elif current_price < bb_middle:
+            signals.append('LONG')
+            confidence_factors.append(0.1)
+            explanations.append("Price below Bollinger Band middle line")
+        else:
+            signals.append('SHORT')
+            confidence_factors.append(0.1)
+            explanations.append("Price above Bollinger Band middle line")
+
+    # Moving Average Analysis (15% weight)
+    sma_20 = indicators.get('sma_20', 0)
+    sma_50 = indicators.get('sma_50', 0)
+    ema_12 = indicators.get('ema_12', 0)
+    ema_26 = indicators.get('ema_26', 0)
+
+    if current_price and sma_20 and sma_50:
+        if current_price > sma_20 > sma_50:
+            signals.append('LONG')
+            confidence_factors.append(0.15)
+            explanations.append("Price above both SMA20 and SMA50 (uptrend)")
+        elif current_price < sma_20 < sma_50:
+            signals.append('SHORT')
+            confidence_factors.append(0.15)
+            explanations.append("Price below both SMA20 and SMA50 (downtrend)")
+
+    if ema_12 and ema_26:
+        if ema_12 > ema_26:
+            signals.append('LONG')
+            confidence_factors.append(0.1)
+        else:
+            signals.append('SHORT')
+            confidence_factors.append(0.1)
+
+    # Fear & Greed Analysis (10% weight)
+    if fear_greed is None:
+        pass
+    elif fear_greed < 25:  # Extreme Fear
+        signals.append('LONG')
+        confidence_factors.append(0.1)
+        explanations.append(f"Fear & Greed Index ({fear_greed}) shows extreme fear - contrarian buy signal")
+    elif fear_greed > 75:  # Extreme Greed
+        signals.append('SHORT')
+        confidence_factors.append(0.1)
+        explanations.append(f"Fear & Greed Index ({fear_greed}) shows extreme greed - contrarian sell signal")
+    elif fear_greed < 40:
+        signals.append('LONG')
+        confidence_factors.append(0.05)
+        explanations.append(f"Fear & Greed Index ({fear_greed}) shows fear")
+    elif fear_greed > 60:
+        signals.append('SHORT')
+        confidence_factors.append(0.05)
+        explanations.append(f"Fear & Greed Index ({fear_greed}) shows greed")
+
+    # News Sentiment Analysis (10% weight)
+    if news_sentiment is not None:
+        news_score = news_sentiment['score']
+        if news_score >= 0.3:
+            signals.append('LONG')
+            confidence_factors.append(0.1)
+            explanations.append(f"News sentiment is strongly positive ({news_sentiment['headlines']} headlines)")
+        elif news_score <= -0.3:
+            signals.append('SHORT')
+            confidence_factors.append(0.1)
+            explanations.append(f"News sentiment is strongly negative ({news_sentiment['headlines']} headlines)")
+        elif news_score >= 0.15:
+            signals.append('LONG')
+            confidence_factors.append(0.05)
+        elif news_score <= -0.15:
+            signals.append('SHORT')
+            confidence_factors.append(0.05)
+
+    # Calculate final prediction
+    long_count = signals.count('LONG')
+    short_count = signals.count('SHORT')
+    hold_count = signals.count('HOLD')
+
+    if long_count > short_count and long_count > hold_count:
+        prediction = 'LONG'
+        signal_strength = long_count
+    elif short_count > long_count and short_count > hold_count:
+        prediction = 'SHORT'
+        signal_strength = short_count
+    else:
+        prediction = 'HOLD'
+        signal_strength = hold_count
+
+    # Calculate confidence score (0-100)
+    total_signals = len(signals)
+    if total_signals > 0:
+        base_confidence = (signal_strength / total_signals) * 100
+        weight_bonus = sum(confidence_factors) * 50  # Bonus based on signal weights
+        confidence = min(95, max(25, base_confidence + weight_bonus))
+    else:
+        confidence = 50
+
+    return {
+        'prediction': prediction,
+        'confidence': round(confidence, 1),
+        'explanation': '. '.join(explanations[:3]) if explanations else "Analysis based on multiple technical indicators",
+        'signal_breakdown': {
+            'long_signals': long_count,
+            'short_signals': short_count,
+            'hold_signals': hold_count,
+            'total_weight': sum(confidence_factors)
+        }
+    }
+
+
+class TreeModel:
+    """Gradient-boosted trees stored as complete binary trees of one depth.
+
+    Tree m (class m % n_classes) splits node i on feature[m, i] > threshold[m, i]
+    (children 2i+1, 2i+2; NaN goes left) and leaf j adds value[m, j] to the raw
+    score of its class. Probabilities are the softmax of init + the leaf sums.
+    """
+
+    def __init__(self, feature, threshold, value, init, feature_names, classes, meta=None):
+        self.feature = np.ascontiguousarray(feature, dtype=np.int64)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.init = np.asarray(init, dtype=np.float64)
+        self.feature_names = tuple(feature_names)
+        self.classes = tuple(classes)
+        self.meta = meta or {}
+        self.depth = int(np.log2(self.value.shape[1]))
+        self.columns = np.arange(len(self.feature))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['feature'], data['threshold'], data['value'], data['init'],
+                       [str(name) for name in data['feature_names']], [str(name) for name in data['classes']],
+                       json.loads(str(data['meta'])))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez_compressed(path, feature=self.feature, threshold=self.threshold, value=self.value, init=self.init,
+                            feature_names=np.array(self.feature_names), classes=np.array(self.classes),
+                            meta=np.array(json.dumps(self.meta)))
+
+    def raw_scores(self, X):
+        rows = len(X)
+        node = np.zeros((rows, len(self.feature)), dtype=np.int64)
+        row_index = np.arange(rows)[:, None]
+        for _ in range(self.depth):
+            split = self.feature[self.columns, node]
+            node = 2 * node + 1 + (X[row_index, split] > self.threshold[self.columns, node])
+        leaves = self.value[self.columns, node - (2 ** self.depth - 1)]
+        return self.init + leaves.reshape(rows, -1, len(self.classes)).sum(axis=1)
+
+    def predict_proba(self, X):
+        raw = self.raw_scores(np.asarray(X, dtype=np.float64))
+        raw -= raw.max(axis=1, keepdims=True)
+        exp = np.exp(raw)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class RuleScorer:
+    name = 'rules'
+    batched = False
+
+    def score(self, rows):
+        return [rule_score(row['indicators'], row.get('fear_greed'), row.get('news_sentiment')) for row in rows]
+
+
+class ModelScorer:
+    """Tree model probabilities, blended with the rules' vote by model_weight"""
+
+    batched = True
+
+    def __init__(self, model, model_weight=1.0):
+        self.model = model
+        self.model_weight = model_weight
+        self.name = 'model' if model_weight >= 1.0 else 'ensemble'
+        self.order = [model.classes.index(name) for name in CLASSES]
+
+    def score(self, rows):
+        started = time.perf_counter()
+        X = batch_features([row['indicators'] for row in rows])
+        probabilities = self.model.predict_proba(X)[:, self.order]
+        SCORING_SECONDS.observe(time.perf_counter() - started)
+        SCORING_BATCH.observe(len(rows))
+        results = []
+        for row, model_p in zip(rows, probabilities):
+            result = rule_score(row['indicators'], row.get('fear_greed'), row.get('news_sentiment'))
+            # The rules' vote as probabilities: its confidence on its call, the rest shared
+            rule_p = np.full(len(CLASSES), (1 - result['confidence'] / 100) / (len(CLASSES) - 1))
+            rule_p[CLASSES.index(result['prediction'])] = result['confidence'] / 100
+            p = self.model_weight * model_p + (1 - self.model_weight) * rule_p
+            best = int(np.argmax(p))
+            result['prediction'] = CLASSES[best]
+            result['confidence'] = round(float(p[best]) * 100, 1)
+            result['signal_breakdown']['model_probabilities'] = {
+                name.lower(): round(float(value), 4) for name, value in zip(CLASSES, model_p)
+            }
+            results.append(result)
+        return results
+
+
+class MicroBatcher:
+    """Collects single-row score() calls from many threads into batched calls"""
+
+    def __init__(self, scorer, max_batch=MAX_BATCH, max_wait=BATCH_WAIT):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.pending = queue.Queue()
+        threading.Thread(target=self._run, name='scoring-batcher', daemon=True).start()
+
+    def submit(self, row):
+        future = Future()
+        self.pending.put((row, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                results = self.scorer.score([row for row, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+_scorer = None
+_batcher = None
+_scorer_lock = threading.Lock()
+
+
+def get_scorer():
+    """The SCORER of this process; the model is loaded on first use"""
+    global _scorer, _batcher
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                scorer = RuleScorer()
+                if SCORER in ('model', 'ensemble'):
+                    try:
+                        model = TreeModel.load(MODEL_PATH)
+                        scorer = ModelScorer(model, 1.0 if SCORER == 'model' else 0.5)
+                        _batcher = MicroBatcher(scorer)
+                    except (OSError, KeyError, ValueError) as e:
+                        print(f"Prediction model unavailable ({e}), using the rules")
+                elif SCORER != 'rules':
+                    print(f"Unknown SCORER '{SCORER}', using the rules")
+                _scorer = scorer
+    return _scorer
+
+
+def predict(row):
+    """Score one row; with a model, concurrent calls share micro-batches"""
+    scorer = get_scorer()
+    if _batcher is not None:
+        return _batcher.submit(row)
+    return scorer.score([row])[0]
+
+
+def predict_many(rows):
+    """Score many rows in batches of MAX_BATCH"""
+    scorer = get_scorer()
+    results = []
+    for start in range(0, len(rows), MAX_BATCH):
+        results.extend(scorer.score(rows[start:start + MAX_BATCH]))
+    return results
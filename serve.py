@@ -0,0 +1,256 @@
+"""Pre-fork production server for the Flask app.
+
+    python serve.py        # SERVE_WORKERS processes (one per core by default) on SERVE_PORT
+
+The master process imports main once (with ANALYTICS_WARMUP=eager by
+default, so numpy and the indicator engine, and pandas and ta with
+TA_ENGINE=ta, are loaded before the fork), moves everything it allocated
+out of the garbage collector's reach with gc.freeze() and forks the
+workers. The imported modules then stay in memory pages the workers share
+copy-on-write instead of each worker importing its own copy. Workers serve
+the master's listening socket with werkzeug's threaded server.
+
+Workers share upstream answers and hot responses through the shared cache
+(SHARED_CACHE, a SQLite file on /dev/shm) and read prices from the market
+snapshot, so a cache filled by one worker is a hit for all of them.
+
+Signals to the master:
+
+- HUP: graceful reload. New workers are forked from the warm master and
+  the old ones finish their in-flight requests before exiting; the shared
+  cache and the snapshot stay warm. Code changes need a full restart.
+- TERM / INT: graceful shutdown, at most SERVE_GRACEFUL_TIMEOUT seconds.
+
+Worker 0 runs the job workers and the producers (news, correlation,
+scanners, order books) the other workers read through the shared cache. On
+a reload it is replaced only once the old worker 0 has exited; before
+exiting it lets its running jobs finish for JOBS_DRAIN_SECONDS and queues
+the rest again for its successor.
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+SERVE_HOST = os.environ.get('SERVE_HOST', '0.0.0.0')
+SERVE_PORT = int(os.environ.get('SERVE_PORT', '5001'))
+SERVE_WORKERS = int(os.environ.get('SERVE_WORKERS', '0')) or os.cpu_count() or 1
+SERVE_BACKLOG = int(os.environ.get('SERVE_BACKLOG', '2048'))
+# How long a stopping worker may take to finish its requests before it is killed (seconds)
+SERVE_GRACEFUL_TIMEOUT = float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', '30'))
+# Idle keep-alive connections (and stalled clients) are closed after this (seconds)
+KEEPALIVE_TIMEOUT = 10
+# Pause before replacing a worker that died on its own (seconds)
+RESPAWN_DELAY = 1.0
+POLL_INTERVAL = 0.2
+
+
+def default_cache_path():
+    """The shared cache on tmpfs where there is one, else in the temp directory"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else os.environ.get('TMPDIR', '/tmp')
+    return os.path.join(directory, 'tradingapp_cache.db')
+
+
+class RequestHandler(WSGIRequestHandler):
+    timeout = KEEPALIVE_TIMEOUT
+
+
+class WorkerServer(ThreadedWSGIServer):
+    # Request threads are joined on server_close(), so a stopping worker finishes them
+    daemon_threads = False
+
+
+def run_worker(app, listener, slot, post_fork, pre_exit=None):
+    """Serve the shared listening socket until SIGTERM, then finish the requests in flight
+    and run pre_exit (os._exit skips atexit handlers)"""
+    # Ctrl-C reaches the whole process group: the master decides what happens to workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    post_fork(slot)
+    server = WorkerServer(SERVE_HOST, SERVE_PORT, app, handler=RequestHandler, fd=listener.fileno())
+    listener.close()
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, which runs in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Worker {slot} (pid {os.getpid()}) serving")
+    try:
+        server.serve_forever()
+        server.server_close()
+    finally:
+        if pre_exit is not None:
+            pre_exit(slot)
+
+
+class Master:
+    """Owns the listening socket and keeps SERVE_WORKERS forked workers running"""
+
+    def __init__(self, app, post_fork, pre_exit=None, workers=SERVE_WORKERS, host=SERVE_HOST, port=SERVE_PORT):
+        self.app = app
+        self.post_fork = post_fork
+        self.pre_exit = pre_exit
+        self.workers = workers
+        self.address = (host, port)
+        self.listener = None
+        self.slots = {}  # slot -> pid of its current worker
+        self.vacant = {}  # slot -> when to fork its worker
+        self.retiring = {}  # pid -> deadline for the workers told to stop
+        self.waiting = {}  # old pid -> slot forked again once it has exited
+        self.signals = []
+
+    def listen(self):
+        self.listener = socket.create_server(self.address, backlog=SERVE_BACKLOG)
+        # Every worker polls the socket; the ones that lose the race for a connection go back to waiting
+        self.listener.setblocking(False)
+        return self
+
+    def spawn(self, slot):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.listener, slot, self.post_fork, self.pre_exit)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.slots[slot] = pid
+        self.vacant.pop(slot, None)
+        return pid
+
+    def retire(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        self.retiring[pid] = time.monotonic() + SERVE_GRACEFUL_TIMEOUT
+
+    def reload(self):
+        """Fork fresh workers from the warm master and let the old ones drain"""
+        print(f"Reloading {len(self.slots)} workers")
+        for slot, pid in list(self.slots.items()):
+            self.retire(pid)
+            if slot == 0:
+                del self.slots[slot]
+                self.waiting[pid] = slot  # the job workers: one process at a time
+            else:
+                self.spawn(slot)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            if pid in self.waiting:
+                self.spawn(self.waiting.pop(pid))
+                continue
+            for slot, current in list(self.slots.items()):
+                if current == pid:
+                    print(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}")
+                    del self.slots[slot]
+                    self.vacant[slot] = time.monotonic() + RESPAWN_DELAY
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                print(f"Worker pid {pid} did not stop in {SERVE_GRACEFUL_TIMEOUT:.0f}s, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.retiring[pid] = float('inf')
+
+    def stop(self):
+        print("Shutting down")
+        self.vacant.clear()
+        self.waiting.clear()
+        for pid in list(self.slots.values()):
+            self.retire(pid)
+        self.slots.clear()
+        self.listener.close()
+        while self.retiring:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(POLL_INTERVAL)
+
+    def _signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def run(self):
+        if self.listener is None:
+            self.listen()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._signal)
+        print(f"Serving on http://{self.address[0]}:{self.listener.getsockname()[1]} with {self.workers} workers "
+              f"(master pid {os.getpid()})")
+        for slot in range(self.workers):
+            self.spawn(slot)
+        while True:
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.stop()
+                    return
+            self.reap()
+            now = time.monotonic()
+            for slot, due in list(self.vacant.items()):
+                if now >= due:
+                    self.spawn(slot)
+            self.kill_overdue()
+            time.sleep(POLL_INTERVAL)
+
+
+def start_worker(slot):
+    """Per-worker set-up after the fork: no database connection inherited from the master,
+    and the background services, with the job workers and producers in worker 0 only"""
+    import main
+    from src.models.user import db
+    with main.app.app_context():
+        db.engine.dispose(close=False)
+    main.start_services(primary=slot == 0)
+
+
+def stop_worker(slot):
+    import main
+    main.stop_services()
+
+
+def preload():
+    """Import the app in the master and return it"""
+    os.environ['SERVE_PREFORK'] = '1'
+    os.environ.setdefault('ANALYTICS_WARMUP', 'eager')
+    os.environ.setdefault('SHARED_CACHE', default_cache_path())
+    started = time.perf_counter()
+    import main
+    import shared_cache
+    shared_cache.get_cache()  # create the table once, before the workers race for it
+    # Keep the preloaded objects out of the collector's reach: collections in a worker
+    # would otherwise write to their headers and unshare the pages they live in
+    gc.freeze()
+    print(f"Preloaded the app in {time.perf_counter() - started:.2f}s")
+    return main.app
+
+
+if __name__ == '__main__':
+    Master(preload(), start_worker, stop_worker).run()
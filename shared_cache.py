@@ -0,0 +1,149 @@
+"""Response cache shared by the worker processes of one host.
+
+serve.py runs several forked Flask workers; each has its own coalescing
+window and upstream last-good cache, so a body one worker just built is a
+miss for the others. SharedCache keeps encoded bodies in one SQLite file on
+tmpfs (SHARED_CACHE, /dev/shm by default under serve.py) that every worker
+reads and writes:
+
+- coalesced responses (/klines, /coin, /technical-analysis, ...) for their
+  reuse window, so identical requests hit whichever worker they land on;
+- upstream last good answers (tickers, klines, venue listings), so any
+  worker can serve a stale copy or a venue's cached candles;
+- results of the background producers (news, correlation, scanners, order
+  books) that only the primary worker runs, published with Published and
+  read from there by the other workers.
+
+The file outlives the workers, so replacing them on a graceful reload keeps
+the cache warm. An empty SHARED_CACHE (the default outside serve.py)
+disables the tier and every call is a no-op.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+SHARED_CACHE = os.environ.get('SHARED_CACHE', '')
+# Expired rows are deleted every this many writes
+PRUNE_EVERY = 1000
+# How often a reader looks for a newer published value (seconds)
+FOLLOW_INTERVAL = 1.0
+
+SHARED_CACHE_REQUESTS = metrics.counter('shared_cache_total', 'Shared cache lookups by namespace and outcome',
+                                        ('namespace', 'result'))
+
+
+class SharedCache:
+    def __init__(self, path):
+        self.path = path
+        self.writes = 0
+        self._local = threading.local()
+        # Set up on a connection of its own: the master creates the table before forking
+        db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    content_type TEXT,
+                    data BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+        finally:
+            db.close()
+
+    def _connect(self):
+        # One connection per thread and process: a connection must not cross a fork
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA synchronous=OFF")  # a cache: losing it on a crash costs a refetch
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def get(self, namespace, key):
+        """(status, content_type, data, stored_at) of a live entry, or None"""
+        try:
+            row = self._connect().execute(
+                "SELECT status, content_type, data, stored_at FROM entries "
+                "WHERE namespace = ? AND key = ? AND expires_at > ?", (namespace, key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            row = None
+        SHARED_CACHE_REQUESTS.inc(namespace=namespace, result='hit' if row is not None else 'miss')
+        return row
+
+    def keys(self, namespace):
+        """Keys of the live entries of a namespace"""
+        try:
+            rows = self._connect().execute("SELECT key FROM entries WHERE namespace = ? AND expires_at > ?",
+                                           (namespace, time.time())).fetchall()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            rows = []
+        return [row[0] for row in rows]
+
+    def set(self, namespace, key, status, content_type, data, ttl, stored_at=None):
+        stored_at = stored_at or time.time()
+        try:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (namespace, key, status, content_type, bytes(data), stored_at, stored_at + ttl))
+            self.writes += 1
+            if self.writes % PRUNE_EVERY == 0:
+                db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """This process's handle on the shared cache, or None when SHARED_CACHE is unset"""
+    global _cache
+    if _cache is None and SHARED_CACHE:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedCache(SHARED_CACHE)
+    return _cache
+
+
+class Published:
+    """A value one process publishes for the other workers of the host. Readers fetch it at most
+    every `interval` seconds and decode it only when it changed; it expires with its producer."""
+
+    def __init__(self, namespace, key, decode, interval=None):
+        self.namespace = namespace
+        self.key = key
+        self.decode = decode
+        self.interval = FOLLOW_INTERVAL if interval is None else interval
+        self.value = None
+        self.stored_at = None
+        self._checked = 0.0
+
+    def publish(self, data, ttl, content_type='application/octet-stream', stored_at=None):
+        cache = get_cache()
+        if cache is not None:
+            cache.set(self.namespace, self.key, 200, content_type, data, ttl, stored_at=stored_at)
+
+    def latest(self):
+        """The published value, decoded, or None while there is none (or no shared cache)"""
+        now = time.monotonic()
+        if now - self._checked >= self.interval:
+            self._checked = now
+            cache = get_cache()
+            entry = cache.get(self.namespace, self.key) if cache is not None else None
+            if entry is None:
+                self.value = self.stored_at = None
+            elif entry[3] != self.stored_at:
+                self.value, self.stored_at = self.decode(entry[2]), entry[3]
+        return self.value
@@ -0,0 +1,338 @@
+"""Fixed-layout market snapshot shared between processes.
+
+The ingesting WebSocket node writes the latest composite ticker of every
+pair into one NumPy structured array in shared memory (MARKET_SNAPSHOT);
+Flask workers and WebSocket edges on the same host map the same segment and
+read rows in place instead of keeping their own dicts.
+
+Rows never move: a pair gets the next free row on its first write and the
+header's row count is bumped after its symbol is in place, so a reader
+extends its symbol -> row index only when the count grew. One process
+writes (its threads take a lock among themselves); readers take no lock.
+Each row carries a seqlock counter that is odd while the row is being
+written; readers copy the row and retry if the counter was odd or changed
+meanwhile.
+
+The writer holds an exclusive flock on a lock file next to the segment for
+as long as it runs. A second process that would write (another ingester on
+the host) does not get the lock and keeps a private snapshot instead of
+writing into the segment beside the first one; the lock goes away with its
+holder, so a restarted writer takes over.
+
+A restarted writer adopts an existing segment of the same layout, so
+readers keep their mapping and the last prices. A segment of another layout
+is marked retired and replaced; readers notice and map the new one. The
+segment (HEADER_SIZE + 160 bytes per pair) stays in /dev/shm between runs.
+"""
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no writer lock
+    fcntl = None
+
+import metrics
+import venues
+
+# Shared memory segment name; empty keeps the snapshot private to the process
+SNAPSHOT_NAME = os.environ.get('MARKET_SNAPSHOT', 'tradingapp_market')
+SNAPSHOT_CAPACITY = int(os.environ.get('MARKET_SNAPSHOT_CAPACITY', '4096'))
+# Readers outside the ingester ignore rows older than this (seconds)
+SNAPSHOT_MAX_AGE = float(os.environ.get('MARKET_SNAPSHOT_MAX_AGE', '30'))
+# How often a process without the segment tries to map it again (seconds)
+ATTACH_RETRY = 5.0
+READ_RETRIES = 100
+
+VENUE_NAMES = tuple(venues.ADAPTERS)
+
+TICKER_DTYPE = np.dtype([
+    ('seq', '<u8'), ('symbol', 'S16'), ('updated_at', '<f8'),
+    ('price', '<f8'), ('change_percent', '<f8'), ('volume', '<f8'), ('quote_volume', '<f8'),
+    ('high', '<f8'), ('low', '<f8'), ('venue_spread_pct', '<f8'),
+    ('venue_mask', '<u8'), ('venue_price', '<f8', (len(VENUE_NAMES),)),
+    ('venue_quote_volume', '<f8', (len(VENUE_NAMES),))
+])
+TICKER_FIELDS = ('price', 'change_percent', 'volume', 'quote_volume', 'high', 'low', 'venue_spread_pct')
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('layout', '<u8'), ('capacity', '<u8'), ('count', '<u8'), ('retired', '<u8')
+])
+HEADER_SIZE = 64
+MAGIC = b'TAMKT001'
+# Readers built against another row layout or venue list must not map the segment
+LAYOUT = zlib.crc32(repr((TICKER_DTYPE.descr, VENUE_NAMES)).encode())
+
+SNAPSHOT_ROWS = metrics.gauge('market_snapshot_rows', 'Pairs in the market snapshot')
+SNAPSHOT_READ_RETRIES = metrics.counter('market_snapshot_read_retries_total', 'Snapshot row reads retried after a concurrent write')
+
+
+class SnapshotFull(Exception):
+    pass
+
+
+def _segment(name, create=False, size=0):
+    """Map (or create) a segment that outlives this process: no process unlinks it at exit,
+    so a restarted writer finds its readers' segment in place"""
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)  # Python 3.13+
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _claim(name):
+    """Open file holding the writer lock of segment `name`, or None if another process holds it"""
+    if fcntl is None:
+        return None
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    lock = open(os.path.join(directory, f"{name}.writer"), 'a+')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    lock.seek(0)
+    lock.truncate()
+    lock.write(f"{os.getpid()}\n")
+    lock.flush()
+    return lock
+
+
+class MarketSnapshot:
+    def __init__(self, buffer, writable, segment=None, lock=None):
+        self.segment = segment
+        self.writable = writable
+        self.lock = lock  # the writer lock file, held until close()
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buffer)
+        capacity = int(self.header['capacity'])
+        self.rows = np.ndarray((capacity,), dtype=TICKER_DTYPE, buffer=buffer, offset=HEADER_SIZE)
+        # Row bytes: copying these is several times faster than copying a record with subarrays
+        self.raw = np.ndarray((capacity, TICKER_DTYPE.itemsize), dtype=np.uint8, buffer=buffer, offset=HEADER_SIZE)
+        self.index = {}
+        self.indexed = 0
+        self._write_lock = threading.Lock()
+        self._refresh_index()
+
+    @staticmethod
+    def size(capacity):
+        return HEADER_SIZE + capacity * TICKER_DTYPE.itemsize
+
+    @classmethod
+    def _initialise(cls, buffer, capacity):
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buffer)
+        header['magic'], header['layout'], header['capacity'] = MAGIC, LAYOUT, capacity
+        header['count'] = header['retired'] = 0
+
+    @classmethod
+    def private(cls, capacity=SNAPSHOT_CAPACITY):
+        """Snapshot in ordinary process memory (no other process can read it)"""
+        buffer = bytearray(cls.size(capacity))
+        cls._initialise(buffer, capacity)
+        return cls(buffer, writable=True)
+
+    @classmethod
+    def create(cls, name=SNAPSHOT_NAME, capacity=SNAPSHOT_CAPACITY):
+        """The writer's snapshot: adopts a compatible segment left by an earlier writer.
+        While another process holds the segment this is a private snapshot."""
+        if not name:
+            return cls.private(capacity)
+        lock = _claim(name)
+        if lock is None and fcntl is not None:
+            print(f"Market snapshot '{name}' has a writer already; keeping a private snapshot")
+            return cls.private(capacity)
+        try:
+            segment = _segment(name, create=True, size=cls.size(capacity))
+            cls._initialise(segment.buf, capacity)
+        except FileExistsError:
+            segment = _segment(name)
+            header = np.ndarray((), dtype=HEADER_DTYPE, buffer=segment.buf)
+            if header['magic'] != MAGIC or header['layout'] != LAYOUT or header['capacity'] < capacity:
+                header['retired'] = 1
+                del header
+                segment.close()
+                segment.unlink()
+                segment = _segment(name, create=True, size=cls.size(capacity))
+                cls._initialise(segment.buf, capacity)
+            else:
+                del header
+        snapshot = cls(segment.buf, writable=True, segment=segment, lock=lock)
+        SNAPSHOT_ROWS.set_function(lambda: int(snapshot.header['count']))
+        return snapshot
+
+    @classmethod
+    def attach(cls, name=SNAPSHOT_NAME):
+        """Read-only view of the writer's segment; FileNotFoundError if there is none yet"""
+        segment = _segment(name)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=segment.buf)
+        compatible = header['magic'] == MAGIC and header['layout'] == LAYOUT and not header['retired']
+        del header
+        if not compatible:
+            segment.close()
+            raise FileNotFoundError(f"Market snapshot '{name}' has another layout or was retired")
+        return cls(segment.buf, writable=False, segment=segment)
+
+    @property
+    def retired(self):
+        return bool(self.header['retired'])
+
+    def close(self):
+        self.header = self.rows = self.raw = None
+        if self.segment is not None:
+            self.segment.close()
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
+
+    def _refresh_index(self):
+        count = int(self.header['count'])
+        if count > self.indexed:
+            symbols = self.rows['symbol'][self.indexed:count]
+            for offset, symbol in enumerate(symbols):
+                self.index[symbol.decode()] = self.indexed + offset
+            self.indexed = count
+
+    def row_of(self, symbol):
+        row = self.index.get(symbol)
+        if row is None:
+            self._refresh_index()
+            row = self.index.get(symbol)
+        return row
+
+    def write(self, symbol, ticker, updated_at=None):
+        """Store a composite ticker (venues.composite() shape) of a pair; writing process only"""
+        quotes = ticker.get('venues') or {}
+        venue_price = np.full(len(VENUE_NAMES), np.nan)
+        venue_quote_volume = np.full(len(VENUE_NAMES), np.nan)
+        mask = 0
+        for i, name in enumerate(VENUE_NAMES):
+            if name in quotes:
+                mask |= 1 << i
+                venue_price[i] = quotes[name].get('price', np.nan)
+                venue_quote_volume[i] = quotes[name].get('quote_volume', np.nan)
+        with self._write_lock:
+            row = self.row_of(symbol)
+            if row is None:
+                row = self.indexed
+                if row >= len(self.rows):
+                    raise SnapshotFull(f"Market snapshot holds {len(self.rows)} pairs")
+                self.rows['symbol'][row] = symbol.encode()
+                self.header['count'] = row + 1  # publish the row once its symbol is in place
+                self._refresh_index()
+            record = self.rows[row:row + 1]
+            seq = int(record['seq'][0])
+            record['seq'] = seq + 1  # odd: readers retry
+            record['updated_at'] = updated_at if updated_at is not None else time.time()
+            for field in TICKER_FIELDS:
+                record[field] = ticker.get(field, np.nan)
+            record['venue_mask'] = mask
+            record['venue_price'] = venue_price
+            record['venue_quote_volume'] = venue_quote_volume
+            record['seq'] = seq + 2
+
+    def read(self, symbol):
+        """Consistent copy of a pair's row, or None"""
+        row = self.row_of(symbol)
+        if row is None:
+            return None
+        seqs = self.rows['seq']
+        for _ in range(READ_RETRIES):
+            before = int(seqs[row])
+            if not before & 1:
+                data = self.raw[row].tobytes()
+                if int(seqs[row]) == before:
+                    return np.frombuffer(data, dtype=TICKER_DTYPE)[0]
+            SNAPSHOT_READ_RETRIES.inc()
+            time.sleep(0)
+        return None
+
+    def read_all(self):
+        """Consistent copy of every row; rows caught mid-write are read again"""
+        count = int(self.header['count'])
+        records = self.raw[:count].copy().view(TICKER_DTYPE)[:, 0]
+        after = self.rows['seq'][:count]
+        torn = np.flatnonzero((records['seq'] != after) | (records['seq'] & 1 == 1))
+        for row in torn:
+            record = self.read(self.rows['symbol'][row].decode())
+            if record is not None:
+                records[row] = record
+        return records
+
+    def ticker(self, symbol):
+        """A pair's ticker in venues.composite() shape plus symbol and updated_at, or None"""
+        record = self.read(symbol)
+        return ticker_dict(record) if record is not None else None
+
+
+def _values(record):
+    """Row fields as Python values; unpacking once beats reading NumPy scalars field by field"""
+    return dict(zip(TICKER_DTYPE.names, record.item()))
+
+
+def ticker_dict(record):
+    row = _values(record)
+    mask = row['venue_mask']
+    quotes = {name: {'price': float(row['venue_price'][i]), 'quote_volume': float(row['venue_quote_volume'][i])}
+              for i, name in enumerate(VENUE_NAMES) if mask >> i & 1}
+    ticker = {'symbol': row['symbol'].decode(), 'updated_at': row['updated_at'], 'venues': quotes}
+    for field in TICKER_FIELDS:
+        value = row[field]
+        ticker[field] = value if value == value else None
+    return ticker
+
+
+def price_message(record, base):
+    """A row in the shape the WebSocket feed sends for `base` (fetch_price_data)"""
+    row = _values(record)
+    price, change_percent, mask = row['price'], row['change_percent'], row['venue_mask']
+    return {
+        'symbol': base,
+        'price': price,
+        'change': price - price / (1 + change_percent / 100),
+        'changePercent': change_percent,
+        'volume': row['volume'],
+        'high': row['high'],
+        'low': row['low'],
+        'venues': sorted(name for i, name in enumerate(VENUE_NAMES) if mask >> i & 1),
+        'timestamp': datetime.fromtimestamp(row['updated_at']).isoformat()
+    }
+
+
+_reader = None
+_next_attach = 0.0
+_reader_lock = threading.Lock()
+
+
+def get_reader(name=SNAPSHOT_NAME):
+    """This process's read-only view of the shared snapshot, or None while there is no writer"""
+    global _reader, _next_attach
+    reader = _reader
+    if reader is not None and not reader.retired:
+        return reader
+    with _reader_lock:
+        if _reader is not None and _reader.retired:
+            _reader, _next_attach = None, 0.0  # left for the GC: other threads may still be reading it
+        if _reader is None and name and time.monotonic() >= _next_attach:
+            try:
+                _reader = MarketSnapshot.attach(name)
+            except FileNotFoundError:
+                _next_attach = time.monotonic() + ATTACH_RETRY
+        return _reader
+
+
+def fresh_ticker(symbol, max_age=SNAPSHOT_MAX_AGE):
+    """A pair's ticker from the shared snapshot if the ingester wrote it recently"""
+    reader = get_reader()
+    if reader is None:
+        return None
+    ticker = reader.ticker(symbol)
+    if ticker is None or time.time() - ticker['updated_at'] > max_age:
+        return None
+    return ticker
@@ -0,0 +1,45 @@
+"""AlertEngine: the full index is built by fetch(), off the thread that owns it"""
+import threading
+
+import pytest
+
+import alerts
+
+
+@pytest.fixture
+def store(tmp_path):
+    return alerts.AlertStore(str(tmp_path / 'alerts.db'))
+
+
+def test_first_fetch_builds_the_index_in_the_calling_thread(store, monkeypatch):
+    for i in range(5):
+        store.add(alerts.Alert.create('alice', 'BTC', 'price', 'crosses_above', value=100 + i))
+    engine = alerts.AlertEngine(store)
+    loaded_in = []
+    load = alerts.AlertIndex.load
+
+    def tracking_load(index, items):
+        loaded_in.append(threading.current_thread().name)
+        return load(index, items)
+    monkeypatch.setattr(alerts.AlertIndex, 'load', tracking_load)
+
+    worker = threading.Thread(target=lambda: loaded_in.append(engine.fetch()), name='fetcher')
+    worker.start()
+    worker.join()
+    name, changes = loaded_in
+    assert name == 'fetcher'
+    engine.index.values[('BTC', 'tick', 'price')] = 99.0
+    assert engine.apply(changes) == []
+    assert len(engine.index) == 5
+    assert engine.index.values[('BTC', 'tick', 'price')] == 99.0, "values seen meanwhile are kept"
+    assert [a.value for a in engine.update('BTC', 'tick', {'price': 101.5})] == [100, 101]
+
+
+def test_later_fetches_are_incremental(store):
+    engine = alerts.AlertEngine(store)
+    engine.sync()
+    store.add(alerts.Alert.create('alice', 'ETH', 'price', 'above', value=10))
+    full, added, removed, _ = engine.fetch()
+    assert not full and [a.symbol for a in added] == ['ETH']
+    engine.apply((full, added, removed, _))
+    assert len(engine.index) == 1
@@ -0,0 +1,41 @@
+"""Candle store appends and the scheduled sync of stored series"""
+import json
+
+import candle_store
+from upstream import UpstreamResponse
+
+HOUR = 3600000
+
+
+def kline(open_time):
+    return [open_time, '1', '2', '0.5', '1.5', '10', open_time + HOUR - 1, '15', 4, '0', '0', '0']
+
+
+def test_sync_interval_appends_closed_candles_of_stored_series(tmp_path, monkeypatch):
+    store = candle_store.CandleStore(str(tmp_path))
+    now = candle_store.time.time() * 1000
+    latest = int(now - now % HOUR)  # still open
+    store.append('BTCUSDT', '1h', [kline(latest - 5 * HOUR)])
+    store.append('ETHUSDT', '4h', [kline(latest - 20 * HOUR)])
+    requests = []
+
+    def get(url, params=None, timeout=None, stale_on_error=True):
+        requests.append(params)
+        rows = [kline(t) for t in range(params['startTime'], latest + 1, HOUR)]
+        return UpstreamResponse(200, json.dumps(rows).encode(), 'application/json')
+    monkeypatch.setattr(candle_store.upstream, 'get', get)
+
+    store.sync_interval('1h')
+    assert [(p['symbol'], p['interval']) for p in requests] == [('BTCUSDT', '1h')]
+    assert store.count('BTCUSDT', '1h') == 5
+    assert store.last_open_time('BTCUSDT', '1h') == latest - HOUR
+    store.sync_interval('1h')
+    assert store.count('BTCUSDT', '1h') == 5
+
+
+def test_append_skips_stored_and_open_candles(tmp_path):
+    store = candle_store.CandleStore(str(tmp_path))
+    assert store.append('BTCUSDT', '1h', [kline(int(candle_store.time.time() * 1000))]) == 0
+    assert store.series() == []
+    assert store.append('BTCUSDT', '1h', [kline(0), kline(HOUR)]) == 2
+    assert store.append('BTCUSDT', '1h', [kline(HOUR), kline(2 * HOUR)]) == 1
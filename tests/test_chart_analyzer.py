@@ -0,0 +1,52 @@
+"""Chart upload endpoint: error statuses"""
+from concurrent.futures.process import BrokenProcessPool
+
+import flask
+import pytest
+
+import chart_analyzer
+import crypto_enhanced
+
+
+@pytest.fixture
+def client():
+    app = flask.Flask(__name__)
+    app.register_blueprint(crypto_enhanced.crypto_bp, url_prefix='/api')
+    return app.test_client()
+
+
+class FailingAnalyzer:
+    def __init__(self, error):
+        self.error = error
+
+    def analyze(self, path, digest):
+        raise self.error
+
+
+@pytest.mark.parametrize('error, status', [
+    (chart_analyzer.DecoderMissing("Image decoding requires Pillow or OpenCV"), 501),
+    (chart_analyzer.AnalyzerBusy("Chart analyzer is busy, retry shortly"), 503),
+    (BrokenProcessPool("a worker died"), 500),
+    (ValueError("Unsupported or corrupt image"), 400),
+])
+def test_analysis_errors(client, monkeypatch, error, status):
+    monkeypatch.setattr(chart_analyzer, 'get_analyzer', lambda: FailingAnalyzer(error))
+    response = client.post('/api/chart-analyze', data=b'\x89PNG not really')
+    assert response.status_code == status
+    assert response.get_json()['success'] is False
+
+
+def test_missing_decoder_is_its_own_error(tmp_path, monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+
+    def no_decoders(name, *args, **kwargs):
+        if name in ('PIL', 'cv2'):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    monkeypatch.setattr(builtins, '__import__', no_decoders)
+    path = tmp_path / 'chart.png'
+    path.write_bytes(b'\x89PNG')
+    with pytest.raises(chart_analyzer.DecoderMissing) as caught:
+        chart_analyzer.load_pixels(str(path))
+    assert not isinstance(caught.value, RuntimeError)
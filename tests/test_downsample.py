@@ -0,0 +1,72 @@
+"""Chart downsampling from the candle store, assembled from cached blocks"""
+import math
+
+import numpy as np
+import pytest
+
+import candle_store
+import downsample
+
+HOUR = 3600000
+START = 1600000000000 - 1600000000000 % HOUR
+
+
+def klines(first, count):
+    rows = []
+    for i in range(first, first + count):
+        close = 100 + 10 * math.sin(i / 37) + (i % 7)
+        rows.append([START + i * HOUR, str(close - 1), str(close + 2), str(close - 3), str(close), '1',
+                     START + (i + 1) * HOUR - 1, str(close), 3, '0', '0', '0'])
+    return rows
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(downsample, '_cache', downsample.DownsampleCache())
+    monkeypatch.setattr(downsample, 'BLOCK_BUCKETS', 16)
+    store = candle_store.CandleStore(str(tmp_path))
+    store.append('BTCUSDT', '1h', klines(0, 5000))
+    return store
+
+
+def window(lo, hi):
+    return START + lo * HOUR, START + hi * HOUR
+
+
+@pytest.mark.parametrize('lo, hi, width', [(0, 5000, 100), (123, 4321, 50), (1000, 1003, 100), (7, 900, 37)])
+def test_ohlc_blocks_match_one_pass_over_the_range(store, lo, hi, width):
+    result, level, count = downsample.downsample(store, 'BTCUSDT', '1h', width, 'ohlc', *window(lo, hi))
+    candles = store.all('BTCUSDT', '1h')
+    rows, last_open_times = downsample.ohlc(candles, lo, hi, level)
+    assert count == hi - lo
+    assert result == candle_store.to_klines(rows, '1h', last_open_times)
+
+
+@pytest.mark.parametrize('lo, hi, width', [(0, 5000, 100), (123, 4321, 50), (7, 900, 37)])
+def test_line_keeps_one_real_candle_per_bucket(store, lo, hi, width):
+    result, level, _ = downsample.downsample(store, 'BTCUSDT', '1h', width, 'line', *window(lo, hi))
+    candles = store.all('BTCUSDT', '1h')
+    starts = downsample.bucket_starts(lo, hi, level)
+    assert len(result) == len(starts)
+    assert result[0][0] == int(candles['open_time'][lo])
+    times = candles['open_time']
+    for row, bucket_start, bucket_end in zip(result, starts, np.append(starts[1:], hi)):
+        assert times[bucket_start] <= row[0] <= times[bucket_end - 1]
+        assert float(row[4]) == float(candles['close'][np.searchsorted(times, row[0])])
+
+
+def test_panning_reuses_cached_blocks(store):
+    downsample.downsample(store, 'BTCUSDT', '1h', 100, 'ohlc', *window(1000, 4000))
+    cached = len(downsample._cache.entries)
+    downsample.downsample(store, 'BTCUSDT', '1h', 100, 'ohlc', *window(1100, 4100))
+    assert len(downsample._cache.entries) - cached <= 1
+
+
+def test_appended_candles_only_miss_the_newest_block(store):
+    first, level, _ = downsample.downsample(store, 'BTCUSDT', '1h', 100, 'line')
+    cached = set(downsample._cache.entries)
+    store.append('BTCUSDT', '1h', klines(5000, 40))
+    second, _, count = downsample.downsample(store, 'BTCUSDT', '1h', 100, 'line')
+    assert count == 5040
+    assert len(set(downsample._cache.entries) - cached) == 1
+    assert second[:len(first) - 2] == first[:-2]
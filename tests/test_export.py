@@ -0,0 +1,31 @@
+"""Chunked indicator columns of the candle export against a full-history computation"""
+import numpy as np
+import pytest
+
+import export
+import indicators
+
+
+def candles(n=12000):
+    rng = np.random.default_rng(0)
+    close = 60000 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    data = np.zeros(n, dtype=[(name, 'f8') for name in ('open', 'high', 'low', 'close', 'volume', 'quote_volume')]
+                    + [('open_time', 'i8'), ('trades', 'i8')])
+    data['open_time'] = np.arange(n) * 3600000
+    data['close'] = close
+    data['open'] = np.r_[close[0], close[:-1]]
+    data['high'] = close * 1.01
+    data['low'] = close * 0.99
+    data['volume'] = rng.uniform(1, 10, n)
+    return data
+
+
+@pytest.mark.parametrize('name', ['ema_200', 'ema_100', 'macd', 'rsi', 'atr'])
+def test_chunks_match_the_full_history(name):
+    data = candles()
+    full = indicators.indicator_series({field: data[field] for field in ('open', 'high', 'low', 'close', 'volume')})
+    chunked = np.concatenate([columns[name] for columns in export.chunks(data, 0, len(data), (name,), chunk=4000)])
+    finite = np.isfinite(full[name])
+    assert np.array_equal(finite, np.isfinite(chunked))
+    scale = np.maximum(np.abs(full[name][finite]), 1.0)
+    assert np.max(np.abs(chunked[finite] - full[name][finite]) / scale) < 1e-10
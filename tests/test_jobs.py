@@ -0,0 +1,118 @@
+"""Job store leases, priorities and cancellation, and the worker pool draining on shutdown"""
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def store(tmp_path):
+    return jobs.JobStore(str(tmp_path / 'jobs.db'))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def dead_owner():
+    """A lease owner on this host whose process has exited"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}"
+
+
+def test_jobs_of_a_dead_owner_are_queued_again(store):
+    dead, alive = store.submit('a', {}), store.submit('b', {})
+    store.claim(dead_owner())
+    store.claim(jobs.owner_id())
+    assert store.requeue_abandoned() == 1
+    assert (store.get(dead)['status'], store.get(dead)['owner']) == ('queued', None)
+    assert (store.get(alive)['status'], store.get(alive)['owner']) == ('running', jobs.owner_id())
+
+
+def test_jobs_whose_lease_ran_out_are_queued_again(store):
+    renewed, expired = store.submit('a', {}), store.submit('b', {})
+    store.claim('other-host:1')
+    store.claim('other-host:2')
+    time.sleep(0.3)
+    store.heartbeat('other-host:1')
+    assert store.requeue_abandoned(lease=0.2) == 1
+    assert store.get(renewed)['status'] == 'running'
+    assert store.get(expired)['status'] == 'queued'
+
+
+def test_finish_of_a_stale_owner_is_ignored(store):
+    job_id = store.submit('a', {})
+    store.claim('host:1')
+    store.release('host:1')
+    store.claim('host:2')
+    store.finish(job_id, 'host:1', 'failed', error='late')
+    assert (store.get(job_id)['status'], store.get(job_id)['owner']) == ('running', 'host:2')
+    store.finish(job_id, 'host:2', 'succeeded', result={'ok': True})
+    job = store.get(job_id)
+    assert (job['status'], job['result'], job['progress']) == ('succeeded', {'ok': True}, 1)
+
+
+def test_interactive_jobs_run_before_batch_jobs(store):
+    batch = store.submit('a', {}, priority='batch')
+    normal = store.submit('a', {})
+    interactive = store.submit('a', {}, priority='interactive')
+    assert store.claim('host:1', max_priority=jobs.PRIORITIES['interactive'])['id'] == interactive
+    assert store.claim('host:1', max_priority=jobs.PRIORITIES['interactive']) is None
+    assert [store.claim('host:1')['id'] for _ in range(2)] == [normal, batch]
+
+
+def test_cancel_a_queued_job(store):
+    job_id = store.submit('a', {})
+    assert store.cancel(job_id)['status'] == 'cancelled'
+    assert store.claim('host:1') is None
+
+
+def test_cancel_a_running_job_flags_it(store):
+    job_id = store.submit('a', {})
+    store.claim('host:1')
+    job = store.cancel(job_id)
+    assert (job['status'], job['cancel_requested']) == ('running', True)
+    assert store.progress(job_id, 0.5), "the handler sees the request on its next progress report"
+
+
+def test_stop_lets_short_jobs_finish(store, monkeypatch):
+    started = threading.Event()
+
+    def short(params, job):
+        started.set()
+        time.sleep(0.2)
+        return {'ok': True}
+    monkeypatch.setitem(jobs.HANDLERS, 'short', short)
+    pool = jobs.WorkerPool(store, workers=2, poll_interval=0.05).start()
+    job_id = store.submit('short', {})
+    assert started.wait(5)
+    pool.stop(timeout=5)
+    assert store.get(job_id)['status'] == 'succeeded'
+    later = store.submit('short', {})
+    time.sleep(0.2)
+    assert store.get(later)['status'] == 'queued', "a stopped pool claims nothing"
+
+
+def test_stop_hands_back_jobs_that_outlast_the_drain(store, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setitem(jobs.HANDLERS, 'long', lambda params, job: release.wait(5))
+    pool = jobs.WorkerPool(store, workers=2, poll_interval=0.05).start()
+    job_id = store.submit('long', {})
+    wait_for(lambda: store.get(job_id)['status'] == 'running')
+    started = time.monotonic()
+    pool.stop(timeout=0.2)
+    assert time.monotonic() - started < 1
+    job = store.get(job_id)
+    assert (job['status'], job['owner']) == ('queued', None)
+    release.set()
+    time.sleep(0.1)
+    assert store.get(job_id)['status'] == 'queued', "the late finish must not overwrite the requeued job"
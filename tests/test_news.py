@@ -0,0 +1,29 @@
+"""News store: refreshing from a local feed and sharing the snapshot through the shared cache"""
+import os
+
+import pytest
+
+import news
+import shared_cache
+
+FEED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'news_feed.xml')
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = shared_cache.SharedCache(str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(shared_cache, '_cache', cache)
+    return cache
+
+
+def test_readers_share_the_published_headlines(cache):
+    producer = news.NewsStore(feeds=[FEED], scorer=lambda titles: [0.5] * len(titles))
+    reader = news.NewsStore(feeds=[FEED])
+    reader.shared.interval = 0
+    assert not reader.ready
+
+    assert producer.refresh() > 0
+    assert reader.ready
+    assert reader.updated_at == producer.updated_at
+    assert reader.headlines('BTC') == producer.headlines('BTC')
+    assert reader.sentiment('BTC') == producer.sentiment('BTC')
@@ -0,0 +1,98 @@
+"""BookManager against the simulated depth feed"""
+import time
+
+import pytest
+
+import orderbook
+import shared_cache
+
+
+class ListingSource(orderbook.SimulatedDepthSource):
+    def __init__(self, symbols):
+        super().__init__(interval=0.01, seed=1)
+        self.symbols = symbols
+
+    def listed(self, symbol):
+        return symbol in self.symbols
+
+
+def test_unlisted_symbols_take_no_slot():
+    books = orderbook.BookManager(ListingSource({'BTCUSDT'}))
+    for junk in ('AAAUSDT', 'BBBUSDT', 'btcusdtx'):
+        with pytest.raises(orderbook.UnknownSymbol):
+            books.watch(junk)
+    assert books.tasks == {} and books.last_used == {}
+    book = books.get('btcusdt', wait=5)
+    assert book is not None and book.synced
+    assert list(books.tasks) == ['BTCUSDT']
+
+
+class FlakySource(orderbook.SimulatedDepthSource):
+    """Drops the diff after `drop_after` events and answers the first `stale` snapshots from before the stream"""
+
+    def __init__(self, drop_after=None, stale=0):
+        super().__init__(interval=0.005, seed=2)
+        self.drop_after = drop_after
+        self.stale = stale
+        self.sent = 0
+        self.snapshots = 0
+
+    def snapshot(self, symbol):
+        self.snapshots += 1
+        if self.snapshots <= self.stale:
+            return {'lastUpdateId': 0, 'bids': [], 'asks': []}
+        return super().snapshot(symbol)
+
+    def next_event(self, symbol, changes=10):
+        event = super().next_event(symbol, changes)
+        self.sent += 1
+        if self.sent == self.drop_after:
+            event = super().next_event(symbol, changes)
+        return event
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(orderbook, 'SYNC_RETRY', 0.05)
+    monkeypatch.setattr(orderbook, 'SYNC_RETRY_MAX', 0.2)
+
+
+def test_gap_refetches_the_snapshot_on_the_same_stream(fast_retries):
+    source = FlakySource(drop_after=20)
+    books = orderbook.BookManager(source)
+    books.get('BTCUSDT', wait=5)
+    first = books.synced_at['BTCUSDT']
+    deadline = time.time() + 5
+    while books.synced_at['BTCUSDT'] == first and time.time() < deadline:
+        time.sleep(0.01)
+    assert books.synced_at['BTCUSDT'] > first
+    assert source.snapshots == 2
+    assert books.get('BTCUSDT').synced
+
+
+def test_stale_snapshots_are_refetched_with_backoff(fast_retries):
+    source = FlakySource(stale=3)
+    books = orderbook.BookManager(source)
+    started = time.time()
+    assert books.get('BTCUSDT', wait=5) is not None
+    assert source.snapshots == 4
+    assert time.time() - started >= 0.05 + 0.1 + 0.2
+
+
+def test_workers_read_the_books_the_primary_publishes(tmp_path, monkeypatch):
+    cache = shared_cache.SharedCache(str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(shared_cache, '_cache', cache)
+    monkeypatch.setattr(orderbook, 'PUBLISH_INTERVAL', 0.05)
+    source = ListingSource({'BTCUSDT'})
+    primary = orderbook.BookManager(source, publish=True).start()
+    worker = orderbook.SharedBooks(source)
+
+    with pytest.raises(orderbook.UnknownSymbol):
+        worker.get('JUNKUSDT')
+    assert cache.keys('orderbook_watch') == []
+
+    book = worker.get('BTCUSDT', wait=5)
+    assert book is not None and book.synced
+    assert list(primary.tasks) == ['BTCUSDT']
+    assert book.slippage('buy', 1.0) is not None
+    assert book.last_update_id <= primary.books['BTCUSDT'].last_update_id
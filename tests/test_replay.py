@@ -0,0 +1,59 @@
+"""Replay buffers: resuming inside the buffer, evictions, epochs and out-of-order messages"""
+import json
+
+import replay
+
+
+def publish(sequencer, buffer, topic, **fields):
+    message = sequencer.stamp(topic, dict(fields, topic=topic))
+    encoded = json.dumps(message)
+    assert buffer.append(topic, message, encoded)
+    return message, encoded
+
+
+def test_resume_inside_the_buffer():
+    sequencer, buffer = replay.Sequencer(), replay.ReplayBuffer()
+    sent = [publish(sequencer, buffer, topic, n=n) for n, topic in enumerate(['btc', 'eth', 'btc', 'sol', 'eth'])]
+    resume = sent[1][0]['seq']
+    assert buffer.since(resume, sequencer.epoch) == [encoded for _, encoded in sent[2:]]
+    assert buffer.since(sent[-1][0]['seq'], sequencer.epoch) == [], "up to date"
+
+
+def test_evicted_sequence_needs_a_snapshot():
+    sequencer, buffer = replay.Sequencer(), replay.ReplayBuffer(size=2)
+    sent = [publish(sequencer, buffer, 'btc', n=n) for n in range(5)]
+    assert buffer.since(sent[0][0]['seq'], sequencer.epoch) is None
+    assert buffer.since(sent[2][0]['seq'], sequencer.epoch) == [encoded for _, encoded in sent[3:]]
+
+
+def test_new_epoch_after_a_publisher_restart():
+    old, buffer = replay.Sequencer(), replay.ReplayBuffer()
+    first, _ = publish(old, buffer, 'btc', n=0)
+    new = replay.Sequencer()
+    _, encoded = publish(new, buffer, 'btc', n=1)
+    assert buffer.since(first['seq'], old.epoch) is None
+    assert buffer.since(0, new.epoch) == [encoded]
+
+
+def test_sequence_ahead_of_the_buffer_needs_a_snapshot():
+    sequencer, buffer = replay.Sequencer(), replay.ReplayBuffer()
+    message, _ = publish(sequencer, buffer, 'btc', n=0)
+    assert buffer.since(message['seq'] + 10, sequencer.epoch) is None
+
+
+def test_duplicate_and_out_of_order_messages_are_dropped():
+    sequencer, buffer = replay.Sequencer(), replay.ReplayBuffer()
+    first, first_encoded = publish(sequencer, buffer, 'btc', n=0)
+    second, second_encoded = publish(sequencer, buffer, 'btc', n=1)
+    assert not buffer.append('btc', second, second_encoded), "duplicate"
+    assert not buffer.append('btc', first, first_encoded), "out of order"
+    assert buffer.since(0, sequencer.epoch) == [first_encoded, second_encoded]
+
+
+def test_missed_message_on_a_topic_cuts_its_history():
+    sequencer, buffer = replay.Sequencer(), replay.ReplayBuffer()
+    first, _ = publish(sequencer, buffer, 'btc', n=0)
+    sequencer.stamp('btc', {'n': 1})  # published but never reached this node
+    third, encoded = publish(sequencer, buffer, 'btc', n=2)
+    assert buffer.since(first['seq'], sequencer.epoch) is None
+    assert buffer.since(third['seq'] - 1, sequencer.epoch) == [encoded]
@@ -0,0 +1,88 @@
+"""Market scanner: filter compilation, the interval allow-list and sharing the scan through the shared cache"""
+import json
+import math
+
+import numpy as np
+import pytest
+
+import scanner
+import shared_cache
+from upstream import UpstreamResponse
+
+SYMBOLS = ('AAAUSDT', 'BBBUSDT', 'CCCUSDT')
+
+
+def fetch(url, params=None, timeout=None):
+    if url.endswith('/exchangeInfo'):
+        symbols = [{'symbol': s, 'quoteAsset': 'USDT', 'status': 'TRADING'} for s in SYMBOLS]
+        return UpstreamResponse(200, json.dumps({'symbols': symbols}).encode(), 'application/json')
+    step = SYMBOLS.index(params['symbol']) + 1
+    rows = []
+    for i in range(params['limit']):
+        close = 100 + 10 * math.sin(i / (5 * step))
+        rows.append([i * 60000, str(close), str(close + 1), str(close - 1), str(close), '10',
+                     i * 60000 + 59999, str(close * 10), 5, '5', str(close * 5), '0'])
+    return UpstreamResponse(200, json.dumps(rows).encode(), 'application/json')
+
+
+@pytest.fixture(autouse=True)
+def fresh_scanners(monkeypatch):
+    monkeypatch.setattr(scanner, '_scanners', {})
+    monkeypatch.setattr(scanner, 'SCANNER_INTERVALS', ('15m',))
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = shared_cache.SharedCache(str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(shared_cache, '_cache', cache)
+    return cache
+
+
+def test_only_configured_intervals_are_scanned():
+    with pytest.raises(scanner.ScanError):
+        scanner.get_scanner('1m', fetch, 'https://binance.test')
+    assert scanner._scanners == {}
+
+
+def test_readers_share_the_published_scan(cache):
+    reader = scanner.get_scanner('15m', fetch, 'https://binance.test')
+    assert reader._thread is None, "a reader must not refresh on its own"
+    reader.shared.interval = 0
+    assert not reader.ready
+
+    # The primary process refreshes and publishes
+    producer = scanner.MarketScanner('15m', fetch, 'https://binance.test')
+    producer.refresh()
+    assert reader.ready
+    result = reader.query(sort='-rsi')
+    assert result == producer.query(sort='-rsi')
+    assert result['universe'] == len(SYMBOLS)
+
+
+def test_scanner_refreshes_itself_without_a_shared_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, '_cache', None)
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE', '')
+    monkeypatch.setattr(scanner.MarketScanner, 'start', lambda self: setattr(self, '_thread', True) or self)
+    assert scanner.get_scanner('15m', fetch, 'https://binance.test')._thread is True
+
+
+COLUMNS = {'rsi': np.array([20.0, 50.0, np.nan]), 'atr': np.array([1.0, 2.0, 3.0])}
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('rsi < 30', [True, False, False]),
+    ('rsi < 30 and 1', [True, False, False]),
+    ('0 or rsi > 30', [False, True, False]),
+    ('rsi < 30 or atr > 2 and not rsi > 40', [True, False, True]),
+    ('20 <= rsi < 50', [True, False, False]),
+    ('atr * 2 - 1 >= 3', [False, True, True]),
+])
+def test_filter_compilation(expression, expected):
+    mask = np.broadcast_to(scanner.compile_filter(expression)(COLUMNS), (3,))
+    assert mask.tolist() == expected
+
+
+@pytest.mark.parametrize('expression', ['volume_24h > 1', 'rsi ** 2 > 1', '__import__("os")', 'rsi <'])
+def test_invalid_filters_are_scan_errors(expression):
+    with pytest.raises(scanner.ScanError):
+        scanner.compile_filter(expression)
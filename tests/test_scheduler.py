@@ -0,0 +1,60 @@
+"""Due-time arithmetic of scheduled tasks at fixed times"""
+import pytest
+
+import scheduler
+
+HOUR = 3600
+CLOSE = 1700002800  # a multiple of an hour
+
+
+def aligned(offset=2.0):
+    return scheduler.ScheduledTask('candles', lambda: None, HOUR, aligned=True, offset=offset)
+
+
+def fixed(run_at_start=True):
+    return scheduler.ScheduledTask('poll', lambda: None, 10, run_at_start=run_at_start)
+
+
+@pytest.mark.parametrize('now, expected', [
+    (CLOSE - 10, CLOSE + 2),          # before the close
+    (CLOSE + 1, CLOSE + 2),           # after the close, before the offset
+    (CLOSE + 2, CLOSE + HOUR + 2),    # on the boundary: the next one
+    (CLOSE + 2.5, CLOSE + HOUR + 2),  # just after it
+])
+def test_next_aligned(now, expected):
+    assert aligned().next_aligned(now) == expected
+
+
+def test_on_candle_close_takes_interval_names():
+    task = scheduler.Scheduler().on_candle_close('sync', lambda: None, '15m', offset=5)
+    assert (task.interval, task.aligned, task.offset) == (900, True, 5)
+    assert task.first_due(CLOSE + 1) == CLOSE + 5
+
+
+def test_aligned_run_that_finished_in_time():
+    task = aligned()
+    assert task.following_due(CLOSE + 2, CLOSE + 30) == CLOSE + HOUR + 2
+    assert task.skipped == 0
+
+
+def test_aligned_run_that_overran_several_closes():
+    task = aligned()
+    assert task.following_due(CLOSE + 2, CLOSE + 3 * HOUR + 10) == CLOSE + 4 * HOUR + 2
+    assert task.skipped == 3
+
+
+def test_first_due_of_a_fixed_rate_task():
+    assert fixed().first_due(100.0) == 100.0
+    assert fixed(run_at_start=False).first_due(100.0) == 110.0
+
+
+def test_fixed_rate_keeps_its_cadence():
+    task = fixed()
+    assert task.following_due(100.0, 104.0) == 110.0, "measured from the due time, not the finish"
+    assert task.skipped == 0
+
+
+def test_fixed_rate_skips_missed_runs():
+    task = fixed()
+    assert task.following_due(100.0, 135.0) == 140.0
+    assert task.skipped == 3
@@ -0,0 +1,39 @@
+"""Market snapshot: one writer per segment"""
+import os
+
+import pytest
+
+import snapshot
+
+
+@pytest.fixture
+def name():
+    name = f"tradingapp_test_{os.getpid()}"
+    yield name
+    try:
+        snapshot._segment(name).unlink()
+    except FileNotFoundError:
+        pass
+    for directory in ('/dev/shm', snapshot.tempfile.gettempdir()):
+        if os.path.exists(os.path.join(directory, f"{name}.writer")):
+            os.remove(os.path.join(directory, f"{name}.writer"))
+
+
+def test_second_writer_keeps_a_private_snapshot(name):
+    writer = snapshot.MarketSnapshot.create(name, capacity=8)
+    writer.write('BTCUSDT', {'price': 100.0})
+    second = snapshot.MarketSnapshot.create(name, capacity=8)
+    assert second.segment is None
+    second.write('BTCUSDT', {'price': 1.0})
+
+    reader = snapshot.MarketSnapshot.attach(name)
+    assert reader.ticker('BTCUSDT')['price'] == 100.0
+    reader.close()
+    writer.close()
+
+
+def test_writer_lock_is_released_on_close(name):
+    snapshot.MarketSnapshot.create(name, capacity=8).close()
+    writer = snapshot.MarketSnapshot.create(name, capacity=8)
+    assert writer.segment is not None
+    writer.close()
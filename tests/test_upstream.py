@@ -0,0 +1,39 @@
+"""UpstreamClient retries against a stubbed session"""
+import time
+
+import pytest
+import requests
+
+import upstream
+
+
+class SlowSession:
+    """Each GET waits out its timeout (at most `cap` seconds) and fails"""
+
+    def __init__(self, cap=1.0):
+        self.cap = cap
+        self.timeouts = []
+
+    def get(self, url, params=None, timeout=None):
+        self.timeouts.append(timeout)
+        time.sleep(min(timeout, self.cap))
+        raise requests.Timeout('read timed out')
+
+
+def test_retries_share_one_deadline():
+    client = upstream.UpstreamClient(backoff_base=0.05, timeout=0.5)
+    client.session = SlowSession()
+    started = time.monotonic()
+    with pytest.raises(upstream.UpstreamError):
+        client.get('https://example.invalid/api', stale_on_error=False)
+    assert time.monotonic() - started < 0.7
+    assert client.session.timeouts[0] == pytest.approx(0.5, abs=0.01)
+    assert all(t < 0.5 for t in client.session.timeouts[1:])
+
+
+def test_retries_within_the_deadline():
+    client = upstream.UpstreamClient(backoff_base=0.01, timeout=2)
+    client.session = SlowSession(cap=0.05)
+    with pytest.raises(upstream.UpstreamError):
+        client.get('https://example.invalid/api', stale_on_error=False)
+    assert len(client.session.timeouts) == client.max_attempts
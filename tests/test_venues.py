@@ -0,0 +1,207 @@
+"""Venue adapters and the Aggregator against the recorded responses in fixtures/venues"""
+import json
+import os
+import time
+
+import pytest
+
+import venues
+from upstream import UpstreamResponse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'venues')
+
+
+def fixture(venue, name):
+    with open(os.path.join(FIXTURES, venue, f"{name}.json")) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def aggregator():
+    return venues.build(fixtures=FIXTURES)
+
+
+def adapter(name):
+    return venues.ADAPTERS[name](fixtures=FIXTURES)
+
+
+# Ticker parsing: (price, quote volume, 24h change %) of BTCUSDT per venue
+TICKERS = {
+    'binance': (63349.57, 381191443.0011, -2.035),
+    'okx': (63360.97, 148691416.7043, (63360.97 - 64677.28) / 64677.28 * 100),
+    'bybit': (63339.43, 106716519.5804, -2.04),
+    'coinbase': (63379.34, 2707.77135 * 63379.34, (63379.34 - 64696.04) / 64696.04 * 100),
+}
+
+
+@pytest.mark.parametrize('name', sorted(TICKERS))
+def test_ticker_parsing(name):
+    ticker = adapter(name).ticker('BTC', 'USDT')
+    price, quote_volume, change_percent = TICKERS[name]
+    assert ticker['price'] == pytest.approx(price)
+    assert ticker['quote_volume'] == pytest.approx(quote_volume)
+    assert ticker['change_percent'] == pytest.approx(change_percent)
+    assert ticker['low'] <= ticker['price'] <= ticker['high']
+
+
+@pytest.mark.parametrize('name', sorted(TICKERS))
+def test_klines_parsing(name):
+    response = adapter(name).klines('BTC', 'USDT', '1h', 5)
+    assert response.status_code == 200
+    rows = response.json()
+    if name == 'binance':
+        rows = rows[-5:]  # Binance applies the limit itself; the fixture is the full recorded answer
+    assert len(rows) == 5
+    open_times = [row[0] for row in rows]
+    assert open_times == sorted(open_times), "oldest first"
+    for row in rows:
+        assert len(row) == 12
+        assert row[6] == row[0] + 3600000 - 1
+        open_price, high, low, close = (float(v) for v in row[1:5])
+        assert low <= min(open_price, close) <= max(open_price, close) <= high
+
+
+def test_klines_parsing_keeps_the_newest_candle():
+    rows = adapter('okx').klines('BTC', 'USDT', '1h', 1).json()
+    newest = fixture('okx', 'klines_BTCUSDT_1h')['data'][0]
+    assert rows[0][0] == int(newest[0])
+    assert rows[0][4] == newest[4]
+
+
+def test_binance_klines_pass_through_untouched():
+    response = adapter('binance').klines('BTC', 'USDT', '1h', 1000)
+    assert response.json() == fixture('binance', 'klines_BTCUSDT_1h')
+
+
+@pytest.mark.parametrize('name, expected', [('binance', 'SOL'), ('okx', 'SOL'), ('bybit', 'MNT'), ('coinbase', 'SOL')])
+def test_listing(name, expected):
+    listed = adapter(name).listed('USDT')
+    assert 'BTC' in listed and expected in listed
+
+
+def test_composite_weights_prices_by_quote_volume(aggregator):
+    ticker = aggregator.ticker('BTCUSDT')
+    assert set(ticker['venues']) == set(TICKERS)
+    total = sum(quote_volume for _, quote_volume, _ in TICKERS.values())
+    price = sum(p * quote_volume for p, quote_volume, _ in TICKERS.values()) / total
+    change = sum(c * quote_volume for _, quote_volume, c in TICKERS.values()) / total
+    assert ticker['price'] == pytest.approx(price)
+    assert ticker['change_percent'] == pytest.approx(change)
+    assert ticker['quote_volume'] == pytest.approx(total)
+    # high and low come from the deepest venue
+    assert ticker['high'] == pytest.approx(65609.53)
+    prices = [p for p, _, _ in TICKERS.values()]
+    assert ticker['venue_spread_pct'] == pytest.approx((max(prices) - min(prices)) / price * 100)
+
+
+def test_composite_leaves_out_outliers():
+    quotes = [
+        {'venue': 'a', 'price': 100.0, 'quote_volume': 10.0, 'volume': 1, 'change_percent': 1.0, 'high': 101, 'low': 99},
+        {'venue': 'b', 'price': 101.0, 'quote_volume': 10.0, 'volume': 1, 'change_percent': 1.0, 'high': 102, 'low': 99},
+        {'venue': 'c', 'price': 150.0, 'quote_volume': 1000.0, 'volume': 1, 'change_percent': 1.0, 'high': 151, 'low': 99},
+    ]
+    ticker = venues.composite(quotes)
+    assert set(ticker['venues']) == {'a', 'b'}
+    assert ticker['price'] == pytest.approx(100.5)
+
+
+def test_ticker_of_a_pair_some_venues_do_not_list(aggregator):
+    ticker = aggregator.ticker('MNTUSDT')
+    assert set(ticker['venues']) == {'okx', 'bybit'}
+    assert aggregator.health['binance'].healthy, "not listed is not a failure"
+
+
+def test_klines_fail_over_to_the_venue_listing_the_pair(aggregator):
+    venue, response = aggregator.klines('MNTUSDT', '1h', 10)
+    assert venue == 'bybit'
+    assert response.status_code == 200
+    assert ('binance', 'klines', ('MNT', 'USDT', '1h')) in aggregator.not_listed
+
+
+def test_klines_of_an_unlisted_pair(aggregator):
+    venue, response = aggregator.klines('NOPEUSDT', '1h', 10)
+    assert venue is None
+    assert response.status_code == 400
+
+
+def test_unsupported_interval_does_not_hide_the_pair(aggregator):
+    aggregator.klines('BTCUSDT', '8h', 10)
+    venue, response = aggregator.klines('BTCUSDT', '1h', 10)
+    assert venue == 'binance'
+    assert response.status_code == 200
+
+
+def test_interval_no_venue_has():
+    aggregator = venues.build(['okx', 'coinbase'], fixtures=FIXTURES)
+    venue, response = aggregator.klines('BTCUSDT', '8h', 10)
+    assert (venue, response.status_code) == (None, 400)
+    assert aggregator.not_listed == {}
+    assert aggregator.klines('BTCUSDT', '1h', 10)[1].status_code == 200
+
+
+def test_klines_fail_over_after_an_error(aggregator, monkeypatch):
+    def broken(*args, **kwargs):
+        raise ConnectionError('reset by peer')
+    monkeypatch.setattr(aggregator.venues[0], 'klines', broken)
+    venue, response = aggregator.klines('BTCUSDT', '1h', 10)
+    assert venue == 'okx'
+    assert response.status_code == 200
+    assert aggregator.health['binance'].failures == 1
+
+
+def test_hedge_asks_the_next_venue_when_the_first_is_slow(aggregator, monkeypatch):
+    monkeypatch.setattr(venues, 'HEDGE_DELAY', 0.05)
+    binance = aggregator.venues[0]
+    answer = binance.klines
+
+    def slow(*args, **kwargs):
+        time.sleep(1)
+        return answer(*args, **kwargs)
+    monkeypatch.setattr(binance, 'klines', slow)
+    started = time.monotonic()
+    venue, response = aggregator.klines('BTCUSDT', '1h', 10)
+    assert venue == 'okx'
+    assert response.status_code == 200
+    assert time.monotonic() - started < 0.5
+
+
+def test_klines_fall_back_to_the_last_good_answer(aggregator, monkeypatch):
+    cached = UpstreamResponse(200, b'[[1, "1", "1", "1", "1", "1", 2, "1", 0, "0", "0", "0"]]', 'application/json')
+    for venue in aggregator.venues:
+        monkeypatch.setattr(venue, 'fetch', lambda *args, **kwargs: UpstreamResponse(503, b'{}'))
+        monkeypatch.setattr(venue, 'cached', lambda url, params=None: cached if 'binance' in url else None)
+    venue, response = aggregator.klines('BTCUSDT', '1h', 10)
+    assert venue == 'binance'
+    assert response.stale
+
+
+@pytest.mark.parametrize('name', sorted(TICKERS))
+def test_unknown_symbol_is_the_venue_specific_error(name):
+    venue = adapter(name)
+    assert venue.unknown_symbol(UpstreamResponse(*venue.UNKNOWN_SYMBOL, 'application/json'))
+    assert not venue.unknown_symbol(UpstreamResponse(400, b'{"code": -1100, "msg": "Illegal characters"}'))
+    assert not venue.unknown_symbol(UpstreamResponse(404, b'<html>Not Found</html>'))
+
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 1), ('5', 5), (100000, venues.MAX_KLINES)])
+def test_kline_limit_is_clamped(limit, expected):
+    assert venues.kline_limit(limit) == expected
+
+
+def test_non_numeric_limit_is_rejected_before_any_venue(aggregator):
+    with pytest.raises(ValueError):
+        aggregator.klines('BTCUSDT', '1h', 'abc')
+    assert aggregator.not_listed == {}
+
+
+def test_a_rejected_request_does_not_hide_the_pair(aggregator, monkeypatch):
+    binance = aggregator.venues[0]
+    answer = binance.fetch
+    monkeypatch.setattr(binance, 'fetch', lambda *args, **kwargs: UpstreamResponse(
+        400, b'{"code": -1100, "msg": "Illegal characters found in parameter \'limit\'"}', 'application/json'))
+    venue, response = aggregator.klines('BTCUSDT', '1h', -1)
+    assert (venue, response.status_code) == ('okx', 200)
+    assert aggregator.not_listed == {}
+    monkeypatch.setattr(binance, 'fetch', answer)
+    venue, response = aggregator.klines('BTCUSDT', '1h', 100)
+    assert (venue, response.status_code) == ('binance', 200)
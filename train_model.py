@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Train the /ai-prediction tree model from the local candle store.
+
+Every stored candle of the given symbols becomes a row of scoring.FEATURES
+computed with the same indicator kernels as the live path. It is labelled
+LONG or SHORT when the close `--horizon` candles later moved by more than
+`--threshold` ATRs, HOLD otherwise. The model is multiclass gradient
+boosting with histogram splits and depth-limited trees, written in NumPy so
+neither training nor serving needs an ML framework. The last
+`--validation` share of each symbol's history is held out and reported.
+
+    python candle_store.py sync BTCUSDT ETHUSDT SOLUSDT --interval 1h --days 730
+    python train_model.py BTCUSDT ETHUSDT SOLUSDT --interval 1h
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+import candle_store
+import indicators
+import scoring
+
+WARMUP = 50  # candles before the slowest feature (SMA 50) is defined
+
+
+def dataset(store, symbol, interval, horizon, threshold):
+    """(features, labels) of one stored series, oldest first"""
+    candles = store.all(symbol, interval)
+    data = {name: np.asarray(candles[name], dtype=np.float64) for name in ('open', 'high', 'low', 'close', 'volume')}
+    X = scoring.features(indicators.indicator_series(data))
+    close, atr = data['close'], indicators.atr(data['high'], data['low'], data['close'])
+    future = np.full(len(close), np.nan)
+    future[:-horizon] = close[horizon:] - close[:-horizon]
+    move = future / (threshold * atr)
+    labels = np.full(len(close), scoring.CLASSES.index('HOLD'))
+    labels[move > 1] = scoring.CLASSES.index('LONG')
+    labels[move < -1] = scoring.CLASSES.index('SHORT')
+    usable = np.arange(len(close)) >= WARMUP
+    usable &= np.isfinite(move)
+    return X[usable], labels[usable]
+
+
+def bin_edges(X, bins):
+    """Quantile split candidates per feature"""
+    edges = []
+    for column in X.T:
+        finite = column[np.isfinite(column)]
+        quantiles = np.quantile(finite, np.linspace(0, 1, bins + 1)[1:-1]) if len(finite) else np.empty(0)
+        edges.append(np.unique(quantiles))
+    return edges
+
+
+def binned(X, edges):
+    """Bin index per value: the number of edges strictly below it; NaN -> 0 (goes left, as in serving)"""
+    out = np.zeros(X.shape, dtype=np.int32)
+    for f, feature_edges in enumerate(edges):
+        column = np.where(np.isnan(X[:, f]), -np.inf, X[:, f])
+        out[:, f] = np.searchsorted(feature_edges, column, side='left')
+    return out
+
+
+def fit_tree(B, edges, gradient, hessian, depth, l2, min_hessian):
+    """One depth-limited regression tree on binned features (Newton leaf values)"""
+    internal = 2 ** depth - 1
+    feature = np.zeros(internal, dtype=np.int64)
+    threshold = np.full(internal, np.inf)  # inf: everything goes left
+    node = np.zeros(len(B), dtype=np.int64)
+    n_bins = max(len(e) for e in edges) + 1
+    for level in range(depth):
+        first = 2 ** level - 1
+        width = 2 ** level
+        local = node - first
+        G = np.bincount(local, weights=gradient, minlength=width)
+        H = np.bincount(local, weights=hessian, minlength=width)
+        best_gain = np.zeros(width)
+        for f in range(B.shape[1]):
+            key = local * n_bins + B[:, f]
+            g = np.bincount(key, weights=gradient, minlength=width * n_bins).reshape(width, n_bins).cumsum(axis=1)
+            h = np.bincount(key, weights=hessian, minlength=width * n_bins).reshape(width, n_bins).cumsum(axis=1)
+            g, h = g[:, :len(edges[f])], h[:, :len(edges[f])]  # left side: bins 0..b
+            right_g, right_h = G[:, None] - g, H[:, None] - h
+            gain = g ** 2 / (h + l2) + right_g ** 2 / (right_h + l2) - (G ** 2 / (H + l2))[:, None]
+            gain[(h < min_hessian) | (right_h < min_hessian)] = 0
+            if not gain.size:
+                continue
+            split = gain.argmax(axis=1)
+            value = gain[np.arange(width), split]
+            better = value > best_gain
+            best_gain[better] = value[better]
+            feature[first:first + width][better] = f
+            threshold[first:first + width][better] = edges[f][split[better]]
+        # Route rows to the children with the same comparison serving uses
+        bins = B[np.arange(len(B)), feature[node]]
+        cut = np.array([np.searchsorted(edges[feature[n]], threshold[n], side='left') if np.isfinite(threshold[n])
+                        else n_bins for n in range(first, first + width)])
+        node = 2 * node + 1 + (bins > cut[local])
+    leaf = node - internal
+    G = np.bincount(leaf, weights=gradient, minlength=internal + 1)
+    H = np.bincount(leaf, weights=hessian, minlength=internal + 1)
+    return feature, threshold, -G / (H + l2)
+
+
+def train(X, y, rounds, depth, learning_rate, bins, l2=1.0, min_hessian=1.0):
+    classes = len(scoring.CLASSES)
+    edges = bin_edges(X, bins)
+    B = binned(X, edges)
+    prior = np.bincount(y, minlength=classes) / len(y)
+    init = np.log(np.maximum(prior, 1e-6))
+    raw = np.tile(init, (len(y), 1))
+    target = np.eye(classes)[y]
+    trees = []
+    for _ in range(rounds):
+        p = np.exp(raw - raw.max(axis=1, keepdims=True))
+        p /= p.sum(axis=1, keepdims=True)
+        for k in range(classes):
+            gradient = p[:, k] - target[:, k]
+            hessian = np.maximum(p[:, k] * (1 - p[:, k]), 1e-6)
+            feature, threshold, values = fit_tree(B, edges, gradient, hessian, depth, l2, min_hessian)
+            values *= learning_rate
+            trees.append((feature, threshold, values))
+            model = scoring.TreeModel([feature], [threshold], [values], np.zeros(1), scoring.FEATURES, ['k'])
+            raw[:, k] += model.raw_scores(X)[:, 0]
+    return scoring.TreeModel(
+        np.array([t[0] for t in trees]), np.array([t[1] for t in trees]), np.array([t[2] for t in trees]),
+        init, scoring.FEATURES, scoring.CLASSES
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the prediction tree model from stored candles")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--interval', default='1h')
+    parser.add_argument('--horizon', type=int, default=4, help="candles ahead the label looks")
+    parser.add_argument('--threshold', type=float, default=1.0, help="move in ATRs that counts as LONG/SHORT")
+    parser.add_argument('--rounds', type=int, default=60)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--bins', type=int, default=64)
+    parser.add_argument('--validation', type=float, default=0.2)
+    parser.add_argument('--output', default=scoring.MODEL_PATH)
+    args = parser.parse_args()
+
+    store = candle_store.get_store()
+    train_parts, test_parts = [], []
+    for symbol in args.symbols:
+        X, y = dataset(store, symbol, args.interval, args.horizon, args.threshold)
+        if len(y) < 500:
+            raise SystemExit(f"{symbol} {args.interval}: only {len(y)} usable candles, sync more history first")
+        cut = int(len(y) * (1 - args.validation))
+        train_parts.append((X[:cut], y[:cut]))
+        test_parts.append((X[cut:], y[cut:]))
+    X_train = np.vstack([p[0] for p in train_parts])
+    y_train = np.concatenate([p[1] for p in train_parts])
+    X_test = np.vstack([p[0] for p in test_parts])
+    y_test = np.concatenate([p[1] for p in test_parts])
+
+    started = time.perf_counter()
+    model = train(X_train, y_train, args.rounds, args.depth, args.learning_rate, args.bins)
+    elapsed = time.perf_counter() - started
+    predicted = model.predict_proba(X_test).argmax(axis=1)
+    baseline = np.bincount(y_train, minlength=len(scoring.CLASSES)).argmax()
+    model.meta = {
+        'trained_at': datetime.now().isoformat(),
+        'symbols': [s.upper() for s in args.symbols],
+        'interval': args.interval,
+        'horizon': args.horizon,
+        'threshold_atr': args.threshold,
+        'rounds': args.rounds,
+        'depth': args.depth,
+        'train_rows': int(len(y_train)),
+        'validation_rows': int(len(y_test)),
+        'validation_accuracy': round(float((predicted == y_test).mean()), 4),
+        'majority_baseline': round(float((y_test == baseline).mean()), 4)
+    }
+    model.save(args.output)
+    print(json.dumps(dict(model.meta, train_seconds=round(elapsed, 1), output=args.output), indent=2))
+
+
+if __name__ == '__main__':
+    main()
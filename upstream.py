@@ -0,0 +1,227 @@
+"""Shared HTTP client for upstream APIs (Binance, CoinGecko, Alternative.me).
+
+Every GET goes through bounded exponential-backoff retries (3 attempts by
+default) and a per-host circuit breaker. The timeout is one deadline for
+the whole call: each attempt gets what is left of it and no retry starts
+once its backoff would run past it. The last good response per URL is
+kept so that, when an upstream is failing or its breaker is open, callers
+get that value flagged as stale instead of a fabricated sample or a full
+timeout. UpstreamError is raised only when nothing good was ever cached.
+Under serve.py the last good responses also go to the shared cache, so a
+worker serves what any other worker fetched.
+"""
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlparse
+
+import requests
+
+import metrics
+import shared_cache
+
+# Statuses worth retrying; other 4xx answers are returned to the caller as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CIRCUIT_STATE = metrics.gauge('upstream_circuit_open', 'Whether the circuit breaker for a host is open', ('host',))
+RETRIES = metrics.counter('upstream_retries_total', 'Upstream retries by host', ('host',))
+STALE_SERVED = metrics.counter('upstream_stale_served_total', 'Stale cached responses served by host', ('host',))
+
+
+class UpstreamError(Exception):
+    """The upstream failed and no cached response is available"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after a cool-down"""
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.probing = True  # let exactly one request test the host
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+        CIRCUIT_STATE.set(0, host=self.host)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+                CIRCUIT_STATE.set(1, host=self.host)
+
+
+class UpstreamResponse:
+    """The subset of requests.Response the routes use, plus staleness"""
+
+    def __init__(self, status_code, content, content_type=None, stale=False, fetched_at=None):
+        self.status_code = status_code
+        self.content = content
+        self.content_type = content_type
+        self.stale = stale
+        self.fetched_at = fetched_at or time.time()
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def as_stale(self):
+        return UpstreamResponse(self.status_code, self.content, self.content_type, True, self.fetched_at)
+
+
+class UpstreamClient:
+    def __init__(self, max_attempts=3, backoff_base=0.2, backoff_max=2.0, timeout=10,
+                 failure_threshold=5, reset_timeout=30, stale_ttl=3600, cache_size=2048):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stale_ttl = stale_ttl
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        self._breakers = {}
+        self._last_good = OrderedDict()
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    @staticmethod
+    def cache_key(url, params):
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted((k, str(v)) for k, v in params.items()))}"
+
+    def last_good(self, key):
+        with self._lock:
+            entry = self._last_good.get(key)
+            if entry is not None:
+                self._last_good.move_to_end(key)
+        cache = shared_cache.get_cache()
+        if cache is not None:
+            shared = cache.get('upstream', key)
+            if shared is not None and (entry is None or shared[3] > entry.fetched_at):
+                status, content_type, content, fetched_at = shared
+                entry = UpstreamResponse(status, content, content_type, fetched_at=fetched_at)
+        return entry
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._last_good[key] = response
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.cache_size:
+                self._last_good.popitem(last=False)
+        cache = shared_cache.get_cache()
+        if cache is not None:
+            cache.set('upstream', key, response.status_code, response.content_type, response.content,
+                      self.stale_ttl, stored_at=response.fetched_at)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, delay)  # full jitter
+
+    def get(self, url, params=None, timeout=None, stale_on_error=True):
+        """GET with retries and circuit breaking within `timeout` seconds overall;
+        serves the last good response on failure"""
+        host = urlparse(url).netloc
+        breaker = self.breaker(host)
+        key = self.cache_key(url, params)
+        deadline = time.monotonic() + (timeout or self.timeout)
+        error = None
+
+        for attempt in range(self.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                error = error or f"{host} timed out"
+                break
+            if not breaker.allow():
+                error = f"circuit open for {host}"
+                break
+            started = time.perf_counter()
+            status = 'error'
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=remaining)
+                status = str(response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    result = UpstreamResponse(response.status_code, response.content,
+                                              response.headers.get('Content-Type'))
+                    if response.status_code == 200:
+                        self._remember(key, result)
+                    return result
+                error = f"{host} returned {response.status_code}"
+                header = response.headers.get('Retry-After')
+                if header and header.isdigit():
+                    retry_after = int(header)
+            except requests.RequestException as e:
+                error = f"{host} request failed: {e}"
+            finally:
+                metrics.record_upstream(url, status, started)
+            breaker.record_failure()
+            if attempt + 1 < self.max_attempts:
+                pause = self._backoff(attempt, retry_after)
+                if time.monotonic() + pause >= deadline:
+                    break
+                RETRIES.inc(host=host)
+                time.sleep(pause)
+
+        if stale_on_error:
+            cached = self.last_good(key)
+            if cached is not None and cached.age <= self.stale_ttl:
+                STALE_SERVED.inc(host=host)
+                metrics.record_cache('upstream_last_good', True)
+                return cached.as_stale()
+            metrics.record_cache('upstream_last_good', False)
+        raise UpstreamError(error or f"{host} unavailable")
+
+
+# Process-wide client shared by the blueprints and the WebSocket server
+client = UpstreamClient()
+
+
+def get(url, params=None, timeout=None, stale_on_error=True):
+    return client.get(url, params=params, timeout=timeout, stale_on_error=stale_on_error)
@@ -0,0 +1,485 @@
+"""Per-user watchlists, saved positions and alert preferences.
+
+Rows live in SQLite next to the SQLAlchemy user table (USERDATA_DB, the
+app database by default) and are keyed by user id; like the alert store,
+every call opens its own connection so the WebSocket node reads them
+without a Flask app context.
+
+The API answers from a per-process cache of each user's data and applies
+changes to it immediately. A cached user is read again once their row in
+user_data_changes moved, so a change another worker process committed is
+seen on the next request. The matching SQL goes to a WriteBatcher, which
+commits everything queued in one transaction every USERDATA_FLUSH_INTERVAL
+(or once USERDATA_MAX_BATCH statements are waiting) and records which users
+changed, so rapid watchlist edits cost one commit. A batch that fails to
+commit goes back to the head of the queue and is retried; whatever is
+queued is flushed when the process exits (flush_pending).
+
+The WebSocket node keeps an InterestIndex (symbol -> users watching it) of
+the users connected to it. Users are added when they identify, their
+symbols are diffed in when their change marker moves, and they are dropped
+when their last connection closes; the index is never rebuilt. Identifying
+takes only the user id: there is no authentication on either side yet, so
+it selects what a connection is sent and is not access control.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+
+USERDATA_DB = os.environ.get('USERDATA_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'app.db'))
+USERDATA_FLUSH_INTERVAL = float(os.environ.get('USERDATA_FLUSH_INTERVAL', '0.25'))
+USERDATA_MAX_BATCH = int(os.environ.get('USERDATA_MAX_BATCH', '500'))
+MAX_WATCHLIST = 200
+MAX_POSITIONS = 500
+POSITION_SIDES = ('long', 'short')
+DEFAULT_PREFERENCES = {'push': True, 'muted_symbols': []}
+
+USERDATA_BATCH_SIZE = metrics.histogram('userdata_batch_statements', 'Statements committed per user data batch',
+                                        buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+INTERESTED_USERS = metrics.gauge('ws_interested_users', 'Users in the WebSocket symbol interest index')
+
+userdata_bp = Blueprint('userdata', __name__)
+
+
+class UserDataError(ValueError):
+    pass
+
+
+def clean_symbol(symbol):
+    symbol = str(symbol or '').strip().upper()
+    if symbol.endswith('USDT') and len(symbol) > 4:
+        symbol = symbol[:-4]  # the WebSocket feed is keyed by base asset
+    if not symbol or not symbol.isalnum() or len(symbol) > 16:
+        raise UserDataError(f"Invalid symbol '{symbol}'")
+    return symbol
+
+
+class UserDataStore:
+    """User data tables in SQLite; every call uses its own connection"""
+
+    def __init__(self, path=USERDATA_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS watchlist_items (
+                    user_id INTEGER NOT NULL,
+                    symbol TEXT NOT NULL,
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, symbol)
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS positions (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    symbol TEXT NOT NULL,
+                    side TEXT NOT NULL,
+                    quantity REAL NOT NULL,
+                    entry_price REAL NOT NULL,
+                    note TEXT,
+                    opened_at REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS positions_user ON positions (user_id)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS alert_preferences (
+                    user_id INTEGER PRIMARY KEY,
+                    preferences TEXT NOT NULL
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS user_data_changes (
+                    user_id INTEGER PRIMARY KEY,
+                    updated_at REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS user_data_changes_updated ON user_data_changes (updated_at)")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def load(self, user_id):
+        """{'watchlist', 'positions', 'preferences'} of a user"""
+        with self._connect() as db:
+            watchlist = [row['symbol'] for row in db.execute(
+                "SELECT symbol FROM watchlist_items WHERE user_id = ? ORDER BY added_at", (user_id,))]
+            positions = [dict(row) for row in db.execute(
+                "SELECT id, symbol, side, quantity, entry_price, note, opened_at FROM positions "
+                "WHERE user_id = ? ORDER BY opened_at", (user_id,))]
+            row = db.execute("SELECT preferences FROM alert_preferences WHERE user_id = ?", (user_id,)).fetchone()
+        preferences = dict(DEFAULT_PREFERENCES, **json.loads(row['preferences'])) if row else dict(DEFAULT_PREFERENCES)
+        return {'watchlist': watchlist, 'positions': positions, 'preferences': preferences}
+
+    def write(self, statements, user_ids):
+        """Run queued (sql, params) statements in one transaction and mark the users changed"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    db.execute(sql, params)
+                db.executemany("INSERT INTO user_data_changes (user_id, updated_at) VALUES (?, ?) "
+                               "ON CONFLICT (user_id) DO UPDATE SET updated_at = excluded.updated_at",
+                               [(user_id, now) for user_id in user_ids])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def marker(self, user_id):
+        """When the user's data was last committed (0 if never)"""
+        with self._connect() as db:
+            row = db.execute("SELECT updated_at FROM user_data_changes WHERE user_id = ?", (user_id,)).fetchone()
+        return row['updated_at'] if row else 0.0
+
+    def changed_since(self, since):
+        """(user ids changed after `since`, cursor)"""
+        with self._connect() as db:
+            rows = db.execute("SELECT user_id, updated_at FROM user_data_changes WHERE updated_at > ?",
+                              (since,)).fetchall()
+        return [row['user_id'] for row in rows], max([since] + [row['updated_at'] for row in rows])
+
+    def watched_symbols(self, limit):
+        """Symbols on any watchlist or position, most watched first"""
+        with self._connect() as db:
+            return [row['symbol'] for row in db.execute(
+                "SELECT symbol, COUNT(*) AS watchers FROM (SELECT symbol, user_id FROM watchlist_items "
+                "UNION SELECT symbol, user_id FROM positions) GROUP BY symbol ORDER BY watchers DESC LIMIT ?",
+                (limit,))]
+
+
+class WriteBatcher:
+    """Queues statements and commits them in batches from a background thread"""
+
+    def __init__(self, store, interval=USERDATA_FLUSH_INTERVAL, max_batch=USERDATA_MAX_BATCH):
+        self.store = store
+        self.interval = interval
+        self.max_batch = max_batch
+        self.statements = []
+        self.users = set()
+        self.flushing = set()  # users of the batch being committed
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='userdata-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, user_id, sql, params):
+        with self._lock:
+            self.statements.append((sql, params))
+            self.users.add(user_id)
+            if len(self.statements) >= self.max_batch:
+                self._wake.set()
+
+    def pending(self, user_id):
+        """Whether the user has changes that are not committed yet"""
+        with self._lock:
+            return user_id in self.users or user_id in self.flushing
+
+    def flush(self):
+        with self._lock:
+            statements, users = self.statements, self.users
+            self.statements, self.users = [], set()
+            self.flushing = users
+        try:
+            if statements:
+                self.store.write(statements, users)
+                USERDATA_BATCH_SIZE.observe(len(statements))
+        except Exception:
+            # Acknowledged changes: put them back ahead of anything queued meanwhile and retry
+            with self._lock:
+                self.statements = statements + self.statements
+                self.users |= users
+            raise
+        finally:
+            with self._lock:
+                self.flushing = set()
+
+    def close(self, attempts=3):
+        """Flush what is queued before the process exits"""
+        for attempt in range(attempts):
+            try:
+                self.flush()
+                return True
+            except Exception as e:
+                print(f"Error writing user data on shutdown: {e}")
+                time.sleep(self.interval)
+        print(f"Lost {len(self.statements)} queued user data change(s)")
+        return False
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing user data: {e}")
+
+
+class UserDataService:
+    """Cached per-user data for the API; changes are applied in memory and written in batches"""
+
+    def __init__(self, store, batcher):
+        self.store = store
+        self.batcher = batcher
+        self.cache = {}  # user_id -> (change marker when loaded, data)
+        self._lock = threading.Lock()
+        self._edit = threading.RLock()  # read-modify-write of cached data
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self.cache.get(user_id)
+        if cached is not None and self.batcher.pending(user_id):
+            return cached[1]  # ahead of the database until the batch is committed
+        # Read before loading: a commit in between makes the next call load again
+        marker = self.store.marker(user_id)
+        if cached is not None and cached[0] == marker:
+            return cached[1]
+        data = self.store.load(user_id)
+        with self._lock:
+            self.cache[user_id] = (marker, data)
+        return data
+
+    def _change(self, user_id, sql, params):
+        self.batcher.add(user_id, sql, params)
+
+    def add_symbol(self, user_id, symbol):
+        with self._edit:
+            symbol = clean_symbol(symbol)
+            watchlist = self.get(user_id)['watchlist']
+            if symbol not in watchlist:
+                if len(watchlist) >= MAX_WATCHLIST:
+                    raise UserDataError(f"At most {MAX_WATCHLIST} symbols per watchlist")
+                watchlist.append(symbol)
+                self._change(user_id, "INSERT OR IGNORE INTO watchlist_items (user_id, symbol, added_at) VALUES (?, ?, ?)",
+                             (user_id, symbol, time.time()))
+            return watchlist
+
+    def remove_symbol(self, user_id, symbol):
+        with self._edit:
+            symbol = clean_symbol(symbol)
+            watchlist = self.get(user_id)['watchlist']
+            if symbol not in watchlist:
+                return False
+            watchlist.remove(symbol)
+            self._change(user_id, "DELETE FROM watchlist_items WHERE user_id = ? AND symbol = ?", (user_id, symbol))
+            return True
+
+    def add_position(self, user_id, symbol, side, quantity, entry_price, note=None):
+        with self._edit:
+            symbol = clean_symbol(symbol)
+            if side not in POSITION_SIDES:
+                raise UserDataError(f"side must be one of {', '.join(POSITION_SIDES)}")
+            quantity, entry_price = float(quantity), float(entry_price)
+            if quantity <= 0 or entry_price <= 0:
+                raise UserDataError("quantity and entry_price must be positive")
+            positions = self.get(user_id)['positions']
+            if len(positions) >= MAX_POSITIONS:
+                raise UserDataError(f"At most {MAX_POSITIONS} saved positions")
+            position = {'id': uuid.uuid4().hex, 'symbol': symbol, 'side': side, 'quantity': quantity,
+                        'entry_price': entry_price, 'note': note, 'opened_at': time.time()}
+            positions.append(position)
+            self._change(user_id, "INSERT INTO positions (id, user_id, symbol, side, quantity, entry_price, note, opened_at) "
+                                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (position['id'], user_id, symbol, side, quantity, entry_price, note, position['opened_at']))
+            return position
+
+    def remove_position(self, user_id, position_id):
+        with self._edit:
+            positions = self.get(user_id)['positions']
+            for position in positions:
+                if position['id'] == position_id:
+                    positions.remove(position)
+                    self._change(user_id, "DELETE FROM positions WHERE id = ? AND user_id = ?", (position_id, user_id))
+                    return True
+            return False
+
+    def set_preferences(self, user_id, changes):
+        with self._edit:
+            preferences = self.get(user_id)['preferences']
+            unknown = [key for key in changes if key not in DEFAULT_PREFERENCES]
+            if unknown:
+                raise UserDataError(f"Unknown preferences: {', '.join(unknown)}")
+            patch = {}
+            if 'push' in changes:
+                patch['push'] = bool(changes['push'])
+            if 'muted_symbols' in changes:
+                patch['muted_symbols'] = sorted({clean_symbol(s) for s in changes['muted_symbols'] or []})
+            preferences.update(patch)
+            # Only the changed keys are written: keys another process set meanwhile are kept
+            self._change(user_id, "INSERT INTO alert_preferences (user_id, preferences) VALUES (?, ?) "
+                                  "ON CONFLICT (user_id) DO UPDATE SET preferences = json_patch(preferences, excluded.preferences)",
+                         (user_id, json.dumps(patch)))
+            return preferences
+
+
+def interests(data):
+    """Symbols a user wants pushed: their watchlist and the symbols of their positions"""
+    return set(data['watchlist']) | {position['symbol'] for position in data['positions']}
+
+
+class InterestIndex:
+    """symbol -> users interested in it, for the users connected to one WebSocket node"""
+
+    def __init__(self):
+        self.users_by_symbol = {}
+        self.symbols_by_user = {}
+        self.preferences = {}
+        INTERESTED_USERS.set_function(lambda: len(self.symbols_by_user))
+
+    def set_user(self, user_id, data):
+        """Add a user or apply the difference to their previous symbols"""
+        new = interests(data)
+        old = self.symbols_by_user.get(user_id, set())
+        for symbol in old - new:
+            users = self.users_by_symbol[symbol]
+            users.discard(user_id)
+            if not users:
+                del self.users_by_symbol[symbol]
+        for symbol in new - old:
+            self.users_by_symbol.setdefault(symbol, set()).add(user_id)
+        self.symbols_by_user[user_id] = new
+        self.preferences[user_id] = data['preferences']
+
+    def drop_user(self, user_id):
+        self.set_user(user_id, {'watchlist': [], 'positions': [], 'preferences': DEFAULT_PREFERENCES})
+        del self.symbols_by_user[user_id]
+        del self.preferences[user_id]
+
+    def symbols(self):
+        return set(self.users_by_symbol)
+
+    def split(self, symbols):
+        """user -> the subset of `symbols` they follow"""
+        by_user = {}
+        for symbol in symbols:
+            for user_id in self.users_by_symbol.get(symbol, ()):
+                by_user.setdefault(user_id, []).append(symbol)
+        return by_user
+
+    def wants_alert(self, user_id, symbol):
+        preferences = self.preferences.get(user_id, DEFAULT_PREFERENCES)
+        return preferences['push'] and clean_symbol(symbol) not in preferences['muted_symbols']
+
+
+_store = None
+_service = None
+_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = UserDataStore()
+        return _store
+
+
+def get_service():
+    global _service
+    store = get_store()
+    with _lock:
+        if _service is None:
+            _service = UserDataService(store, WriteBatcher(store).start())
+            atexit.register(flush_pending)
+        return _service
+
+
+def flush_pending():
+    """Commit queued changes now; for shutdown paths that skip atexit (os._exit)"""
+    if _service is not None:
+        _service.batcher.close()
+
+
+def user_exists(user_id):
+    from src.models.user import db, User  # the SQLAlchemy model main.py registers
+    return db.session.get(User, user_id) is not None
+
+
+def user_route(view):
+    """Resolve <user_id> to a known user and map user data errors to 4xx"""
+    @wraps(view)
+    def wrapper(user_id, **kwargs):
+        try:
+            if not user_exists(user_id):
+                return jsonify({"success": False, "error": "User not found"}), 404
+            return view(user_id, **kwargs)
+        except (UserDataError, TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+    return wrapper
+
+
+@userdata_bp.route('/users/<int:user_id>/watchlist', methods=['GET'])
+@user_route
+def get_watchlist(user_id):
+    return jsonify({"success": True, "data": list(get_service().get(user_id)['watchlist'])})
+
+
+@userdata_bp.route('/users/<int:user_id>/watchlist', methods=['POST'])
+@user_route
+def add_to_watchlist(user_id):
+    """{"symbol": "SOL"}"""
+    symbol = (request.get_json(silent=True) or {}).get('symbol')
+    return jsonify({"success": True, "data": list(get_service().add_symbol(user_id, symbol))}), 201
+
+
+@userdata_bp.route('/users/<int:user_id>/watchlist/<symbol>', methods=['DELETE'])
+@user_route
+def remove_from_watchlist(user_id, symbol):
+    if not get_service().remove_symbol(user_id, symbol):
+        return jsonify({"success": False, "error": "Symbol not on the watchlist"}), 404
+    return jsonify({"success": True})
+
+
+@userdata_bp.route('/users/<int:user_id>/positions', methods=['GET'])
+@user_route
+def get_positions(user_id):
+    return jsonify({"success": True, "data": list(get_service().get(user_id)['positions'])})
+
+
+@userdata_bp.route('/users/<int:user_id>/positions', methods=['POST'])
+@user_route
+def add_position(user_id):
+    """{"symbol", "side": "long"|"short", "quantity", "entry_price", "note"}"""
+    data = request.get_json(silent=True) or {}
+    position = get_service().add_position(user_id, data.get('symbol'), data.get('side'), data.get('quantity'),
+                                          data.get('entry_price'), data.get('note'))
+    return jsonify({"success": True, "data": position}), 201
+
+
+@userdata_bp.route('/users/<int:user_id>/positions/<position_id>', methods=['DELETE'])
+@user_route
+def remove_position(user_id, position_id):
+    if not get_service().remove_position(user_id, position_id):
+        return jsonify({"success": False, "error": "Position not found"}), 404
+    return jsonify({"success": True})
+
+
+@userdata_bp.route('/users/<int:user_id>/alert-preferences', methods=['GET'])
+@user_route
+def get_alert_preferences(user_id):
+    return jsonify({"success": True, "data": dict(get_service().get(user_id)['preferences'])})
+
+
+@userdata_bp.route('/users/<int:user_id>/alert-preferences', methods=['PUT'])
+@user_route
+def set_alert_preferences(user_id):
+    """{"push": false, "muted_symbols": ["DOGE"]}"""
+    preferences = get_service().set_preferences(user_id, request.get_json(silent=True) or {})
+    return jsonify({"success": True, "data": preferences})
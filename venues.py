@@ -0,0 +1,620 @@
+"""Market data from several exchanges behind one venue adapter interface.
+
+Each Venue adapter turns its exchange's public REST API into the same three
+calls: ticker(base, quote), klines(base, quote, interval, limit) in the
+Binance kline layout the indicator engine parses, and listed(quote). The
+Aggregator queries them through a thread pool:
+
+* composite tickers ask every healthy venue at once and weight prices by
+  24h quote volume, using whatever arrived within COMPOSITE_GRACE seconds
+  of the first answer, so a slow venue never holds the price back;
+* klines come from one venue at a time, in VENUES order, with a hedge: if
+  the current venue has not answered within HEDGE_DELAY seconds the next
+  one is asked too and the first good answer wins.
+
+A venue that fails VENUE_FAILURES times in a row is skipped for
+VENUE_COOLDOWN seconds. A venue's own "unknown symbol" error is not a
+failure; it is remembered per pair (and interval, for klines) for
+LISTING_TTL seconds. Other 4xx answers are failures and are never
+remembered, so a malformed request cannot hide a pair. An interval a venue
+has no candles for is skipped without a request, and limit is clamped to
+1..MAX_KLINES before any venue is asked.
+
+VENUES lists the enabled adapters (default binance,okx,bybit,coinbase).
+VENUE_FIXTURES points the adapters at recorded responses instead of the
+network, e.g. VENUE_FIXTURES=fixtures/venues.
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import upstream
+from upstream import UpstreamError, UpstreamResponse
+
+VENUES = [v.strip() for v in os.environ.get('VENUES', 'binance,okx,bybit,coinbase').split(',') if v.strip()]
+VENUE_FIXTURES = os.environ.get('VENUE_FIXTURES')
+
+VENUE_TIMEOUT = 5
+COMPOSITE_GRACE = 0.15
+HEDGE_DELAY = 0.4
+VENUE_FAILURES = 3
+VENUE_COOLDOWN = 30
+# Venue prices further than this from the median are left out of the composite
+MAX_DEVIATION_PCT = 5.0
+LISTING_TTL = 3600
+# Most candles one klines call returns (Binance's cap; venues with a lower one clamp further)
+MAX_KLINES = 1000
+
+# Quote assets recognised when splitting a pair such as BTCUSDT
+QUOTE_ASSETS = ('USDT', 'USDC', 'USD')
+
+# 1M candles vary in length; 30 days only sets close_time of rebuilt klines
+INTERVAL_MS = {
+    '1m': 60000, '3m': 180000, '5m': 300000, '15m': 900000, '30m': 1800000, '1h': 3600000,
+    '2h': 7200000, '4h': 14400000, '6h': 21600000, '8h': 28800000, '12h': 43200000, '1d': 86400000,
+    '3d': 259200000, '1w': 604800000, '1M': 2592000000
+}
+
+VENUE_REQUESTS = metrics.counter('venue_requests_total', 'Venue adapter calls by venue, call and result',
+                                 ('venue', 'call', 'result'))
+VENUE_SECONDS = metrics.histogram('venue_request_seconds', 'Venue adapter call duration', ('venue', 'call'))
+COMPOSITE_VENUES = metrics.histogram('composite_venues', 'Venues contributing to a composite ticker',
+                                     buckets=(1, 2, 3, 4, 5, 6))
+
+
+class NotListed(Exception):
+    """The venue does not list the pair"""
+
+
+class UnsupportedInterval(Exception):
+    """The venue has no candles of this interval (for any pair)"""
+
+
+def split_pair(symbol):
+    """BTCUSDT -> ('BTC', 'USDT'); pairs with an unknown quote -> (symbol, '')"""
+    symbol = symbol.upper()
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)], quote
+    return symbol, ''
+
+
+def kline_limit(limit):
+    """A requested candle count as an int in 1..MAX_KLINES; ValueError if it is not a number"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit must be an integer, got {limit!r}")
+    return max(1, min(limit, MAX_KLINES))
+
+
+def error_field(response, name):
+    """A field of a JSON error answer, or None"""
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    return data.get(name) if isinstance(data, dict) else None
+
+
+def kline_row(open_time, open_price, high, low, close, volume, quote_volume, interval_ms):
+    """One candle in the Binance layout (prices as strings)"""
+    return [open_time, str(open_price), str(high), str(low), str(close), str(volume),
+            open_time + interval_ms - 1, str(quote_volume), 0, '0', '0', '0']
+
+
+class Venue:
+    """Adapter base: subclasses build requests and parse answers, this class fetches"""
+
+    name = None
+    BASE_URL = None
+    INTERVALS = {}
+    MAX_KLINES = MAX_KLINES
+    # What the venue answers for a pair it does not list; a missing fixture answers the same
+    UNKNOWN_SYMBOL = (404, b'{}')
+
+    def __init__(self, base_url=None, fixtures=None):
+        self.base_url = base_url or self.BASE_URL
+        self.fixtures = fixtures
+
+    def fetch(self, fixture, url, params=None):
+        """GET from the exchange, or from <fixtures>/<venue>/<fixture>.json"""
+        if self.fixtures:
+            path = os.path.join(self.fixtures, self.name, f"{fixture}.json")
+            if not os.path.exists(path):
+                return UpstreamResponse(*self.UNKNOWN_SYMBOL, 'application/json')
+            with open(path, 'rb') as f:
+                return UpstreamResponse(200, f.read(), 'application/json')
+        return upstream.get(url, params=params, timeout=VENUE_TIMEOUT, stale_on_error=False)
+
+    def cached(self, url, params=None):
+        """Last good upstream answer for a request, if any"""
+        if self.fixtures:
+            return None
+        return upstream.client.last_good(upstream.client.cache_key(url, params))
+
+    def pair(self, base, quote):
+        return f"{base}{self.quote(quote)}"
+
+    def quote(self, quote):
+        if not quote:
+            raise NotListed(f"{self.name} needs a USDT, USDC or USD pair")
+        return quote
+
+    def ticker(self, base, quote='USDT'):
+        """{'price', 'volume', 'quote_volume', 'change_percent', 'high', 'low'} of a pair"""
+        url, params = self.ticker_request(self.pair(base, quote))
+        response = self.fetch(f"ticker_{base}{quote}", url, params)
+        if self.unknown_symbol(response):
+            raise NotListed(f"{self.name}: no ticker for {base}{quote}")
+        if response.status_code != 200:
+            raise RuntimeError(f"{self.name} ticker returned {response.status_code}")
+        return self.parse_ticker(response.json())
+
+    def klines_request_for(self, base, quote, interval, limit):
+        if interval not in self.INTERVALS:
+            raise UnsupportedInterval(f"{self.name} has no {interval} candles")
+        return self.klines_request(self.pair(base, quote), self.INTERVALS[interval],
+                                   min(kline_limit(limit), self.MAX_KLINES))
+
+    def klines(self, base, quote, interval, limit, stale=False):
+        """Klines as an UpstreamResponse whose body is a Binance klines array, oldest first.
+
+        stale=True returns the last good answer without a request (None if there is none).
+        """
+        url, params = self.klines_request_for(base, quote, interval, limit)
+        if stale:
+            response = self.cached(url, params)
+            if response is None:
+                return None
+            response = response.as_stale()
+        else:
+            response = self.fetch(f"klines_{base}{quote}_{interval}", url, params)
+        if self.unknown_symbol(response):
+            raise NotListed(f"{self.name}: no klines for {base}{quote}")
+        if response.status_code != 200:
+            return response
+        rows = self.parse_klines(response.json(), INTERVAL_MS[interval])[-kline_limit(limit):]
+        return UpstreamResponse(200, json.dumps(rows).encode('utf-8'), 'application/json',
+                                response.stale, response.fetched_at)
+
+    def listed(self, quote='USDT'):
+        """Base assets trading against quote"""
+        url, params = self.listing_request()
+        response = self.fetch('symbols', url, params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{self.name} listing returned {response.status_code}")
+        return self.parse_listing(response.json(), quote)
+
+    def unknown_symbol(self, response):
+        """Whether an answer is the venue's error for a pair it does not list"""
+        raise NotImplementedError
+
+    def ticker_request(self, pair):
+        raise NotImplementedError
+
+    def parse_ticker(self, data):
+        raise NotImplementedError
+
+    def klines_request(self, pair, interval, limit):
+        raise NotImplementedError
+
+    def parse_klines(self, data, interval_ms):
+        raise NotImplementedError
+
+    def listing_request(self):
+        raise NotImplementedError
+
+    def parse_listing(self, data, quote):
+        raise NotImplementedError
+
+
+class BinanceVenue(Venue):
+    name = 'binance'
+    BASE_URL = "https://api.binance.com/api/v3"
+    INTERVALS = {interval: interval for interval in INTERVAL_MS}
+    UNKNOWN_SYMBOL = (400, b'{"code": -1121, "msg": "Invalid symbol."}')
+
+    def pair(self, base, quote):
+        return f"{base}{quote}"  # any Binance pair, e.g. ETHBTC
+
+    def unknown_symbol(self, response):
+        return response.status_code == 400 and error_field(response, 'code') == -1121
+
+    def ticker_request(self, pair):
+        return f"{self.base_url}/ticker/24hr", {'symbol': pair}
+
+    def parse_ticker(self, data):
+        return {
+            'price': float(data['lastPrice']),
+            'volume': float(data['volume']),
+            'quote_volume': float(data['quoteVolume']),
+            'change_percent': float(data['priceChangePercent']),
+            'high': float(data['highPrice']),
+            'low': float(data['lowPrice'])
+        }
+
+    def klines(self, base, quote, interval, limit, stale=False):
+        # Binance already answers in the target layout: pass its bytes through untouched
+        url, params = self.klines_request_for(base, quote, interval, limit)
+        if stale:
+            response = self.cached(url, params)
+            return response.as_stale() if response is not None else None
+        response = self.fetch(f"klines_{base}{quote}_{interval}", url, params)
+        if self.unknown_symbol(response):
+            raise NotListed(f"binance: no klines for {base}{quote}")
+        return response
+
+    def klines_request(self, pair, interval, limit):
+        return f"{self.base_url}/klines", {'symbol': pair, 'interval': interval, 'limit': limit}
+
+    def parse_klines(self, data, interval_ms):
+        return data
+
+    def listing_request(self):
+        return f"{self.base_url}/exchangeInfo", None
+
+    def parse_listing(self, data, quote):
+        return {s['baseAsset'] for s in data.get('symbols', [])
+                if s.get('quoteAsset') == quote and s.get('status') == 'TRADING'}
+
+
+class OKXVenue(Venue):
+    name = 'okx'
+    BASE_URL = "https://www.okx.com/api/v5"
+    INTERVALS = {'1m': '1m', '3m': '3m', '5m': '5m', '15m': '15m', '30m': '30m', '1h': '1H', '2h': '2H',
+                 '4h': '4H', '6h': '6Hutc', '12h': '12Hutc', '1d': '1Dutc', '3d': '3Dutc', '1w': '1Wutc',
+                 '1M': '1Mutc'}
+    MAX_KLINES = 300
+    UNKNOWN_SYMBOL = (200, b'{"code": "51001", "msg": "Instrument ID does not exist", "data": []}')
+
+    def pair(self, base, quote):
+        return f"{base}-{self.quote(quote)}"
+
+    def unknown_symbol(self, response):
+        return response.status_code == 200 and error_field(response, 'code') == '51001'
+
+    def ticker_request(self, pair):
+        return f"{self.base_url}/market/ticker", {'instId': pair}
+
+    def parse_ticker(self, data):
+        if data.get('code') != '0' or not data.get('data'):
+            raise RuntimeError(f"okx: {data.get('msg') or 'no ticker'}")
+        ticker = data['data'][0]
+        last, opened = float(ticker['last']), float(ticker['open24h'])
+        return {
+            'price': last,
+            'volume': float(ticker['vol24h']),
+            'quote_volume': float(ticker['volCcy24h']),
+            'change_percent': (last - opened) / opened * 100 if opened else 0.0,
+            'high': float(ticker['high24h']),
+            'low': float(ticker['low24h'])
+        }
+
+    def klines_request(self, pair, interval, limit):
+        return f"{self.base_url}/market/candles", {'instId': pair, 'bar': interval, 'limit': limit}
+
+    def parse_klines(self, data, interval_ms):
+        if data.get('code') != '0':
+            raise RuntimeError(f"okx: {data.get('msg')}")
+        # [ts, open, high, low, close, vol, volCcy, volCcyQuote, confirm], newest first
+        return [kline_row(int(c[0]), c[1], c[2], c[3], c[4], c[5], c[7], interval_ms)
+                for c in reversed(data['data'])]
+
+    def listing_request(self):
+        return f"{self.base_url}/public/instruments", {'instType': 'SPOT'}
+
+    def parse_listing(self, data, quote):
+        return {i['baseCcy'] for i in data.get('data', []) if i.get('quoteCcy') == quote and i.get('state') == 'live'}
+
+
+class BybitVenue(Venue):
+    name = 'bybit'
+    BASE_URL = "https://api.bybit.com/v5"
+    INTERVALS = {'1m': '1', '3m': '3', '5m': '5', '15m': '15', '30m': '30', '1h': '60', '2h': '120',
+                 '4h': '240', '6h': '360', '12h': '720', '1d': 'D', '1w': 'W', '1M': 'M'}
+    UNKNOWN_SYMBOL = (200, b'{"retCode": 10001, "retMsg": "Not supported symbols", "result": {}}')
+
+    def unknown_symbol(self, response):
+        # 10001 is Bybit's generic parameter error: only its symbol variant means not listed
+        return (response.status_code == 200 and error_field(response, 'retCode') == 10001
+                and 'symbol' in str(error_field(response, 'retMsg')).lower())
+
+    def ticker_request(self, pair):
+        return f"{self.base_url}/market/tickers", {'category': 'spot', 'symbol': pair}
+
+    def parse_ticker(self, data):
+        tickers = (data.get('result') or {}).get('list') or []
+        if data.get('retCode') != 0 or not tickers:
+            raise RuntimeError(f"bybit: {data.get('retMsg') or 'no ticker'}")
+        ticker = tickers[0]
+        return {
+            'price': float(ticker['lastPrice']),
+            'volume': float(ticker['volume24h']),
+            'quote_volume': float(ticker['turnover24h']),
+            'change_percent': float(ticker['price24hPcnt']) * 100,
+            'high': float(ticker['highPrice24h']),
+            'low': float(ticker['lowPrice24h'])
+        }
+
+    def klines_request(self, pair, interval, limit):
+        return f"{self.base_url}/market/kline", {'category': 'spot', 'symbol': pair, 'interval': interval, 'limit': limit}
+
+    def parse_klines(self, data, interval_ms):
+        if data.get('retCode') != 0:
+            raise RuntimeError(f"bybit: {data.get('retMsg')}")
+        # [startTime, open, high, low, close, volume, turnover], newest first
+        return [kline_row(int(c[0]), c[1], c[2], c[3], c[4], c[5], c[6], interval_ms)
+                for c in reversed(data['result']['list'])]
+
+    def listing_request(self):
+        return f"{self.base_url}/market/instruments-info", {'category': 'spot'}
+
+    def parse_listing(self, data, quote):
+        return {s['baseCoin'] for s in (data.get('result') or {}).get('list', [])
+                if s.get('quoteCoin') == quote and s.get('status') == 'Trading'}
+
+
+class CoinbaseVenue(Venue):
+    """Coinbase Exchange; USDT pairs are served from the USD books"""
+
+    name = 'coinbase'
+    BASE_URL = "https://api.exchange.coinbase.com"
+    INTERVALS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '6h': 21600, '1d': 86400}
+    MAX_KLINES = 300
+    UNKNOWN_SYMBOL = (404, b'{"message": "NotFound"}')
+
+    def pair(self, base, quote):
+        quote = self.quote(quote)
+        return f"{base}-{'USD' if quote == 'USDT' else quote}"
+
+    def unknown_symbol(self, response):
+        return response.status_code == 404 and error_field(response, 'message') == 'NotFound'
+
+    def ticker_request(self, pair):
+        return f"{self.base_url}/products/{pair}/stats", None
+
+    def parse_ticker(self, data):
+        if 'last' not in data:
+            raise RuntimeError(f"coinbase: {data.get('message') or 'no ticker'}")
+        last, opened, volume = float(data['last']), float(data['open']), float(data['volume'])
+        return {
+            'price': last,
+            'volume': volume,
+            'quote_volume': volume * last,
+            'change_percent': (last - opened) / opened * 100 if opened else 0.0,
+            'high': float(data['high']),
+            'low': float(data['low'])
+        }
+
+    def klines_request(self, pair, interval, limit):
+        # Candles are selected by time range (300 by default); limit is applied after parsing
+        return f"{self.base_url}/products/{pair}/candles", {'granularity': interval}
+
+    def parse_klines(self, data, interval_ms):
+        if not isinstance(data, list):
+            raise RuntimeError(f"coinbase: {data.get('message')}")
+        # [time (s), low, high, open, close, volume], newest first
+        return [kline_row(int(c[0]) * 1000, c[3], c[2], c[1], c[4], c[5], float(c[5]) * float(c[4]), interval_ms)
+                for c in reversed(data)]
+
+    def listing_request(self):
+        return f"{self.base_url}/products", None
+
+    def parse_listing(self, data, quote):
+        quote = 'USD' if quote == 'USDT' else quote
+        return {p['base_currency'] for p in data if p.get('quote_currency') == quote and p.get('status') == 'online'}
+
+
+ADAPTERS = {venue.name: venue for venue in (BinanceVenue, OKXVenue, BybitVenue, CoinbaseVenue)}
+
+
+class VenueHealth:
+    """Consecutive failures and latency of one venue"""
+
+    def __init__(self):
+        self.failures = 0
+        self.down_until = 0.0
+        self.latency = None  # moving average, seconds
+        self.last_error = None
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def success(self, seconds):
+        self.failures = 0
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+
+    def failure(self, error):
+        self.failures += 1
+        self.last_error = str(error)
+        if self.failures >= VENUE_FAILURES:
+            self.down_until = time.monotonic() + VENUE_COOLDOWN
+
+    def status(self):
+        return {
+            'healthy': self.healthy,
+            'failures': self.failures,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'last_error': self.last_error
+        }
+
+
+class Aggregator:
+    """Concurrent queries, composite prices and failover over a list of venues"""
+
+    def __init__(self, venues, max_workers=32):
+        self.venues = list(venues)
+        self.health = {venue.name: VenueHealth() for venue in self.venues}
+        self.not_listed = {}  # (venue, call, pair[, interval]) -> expiry
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='venue')
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        """Healthy venues in configured order, then the ones cooling down"""
+        return sorted(self.venues, key=lambda venue: not self.health[venue.name].healthy)
+
+    @staticmethod
+    def listing_key(venue, call, args):
+        # A pair may have candles of some intervals only: klines answers are remembered per interval
+        return (venue.name, call, args[:3] if call == 'klines' else args[:2])
+
+    def _call(self, venue, call, *args):
+        """Run one adapter call, recording health; None if the venue cannot answer"""
+        key = self.listing_key(venue, call, args)
+        if self.not_listed.get(key, 0) > time.monotonic():
+            return None
+        started = time.perf_counter()
+        try:
+            result = getattr(venue, call)(*args)
+        except UnsupportedInterval:
+            VENUE_REQUESTS.inc(venue=venue.name, call=call, result='unsupported')
+            return None
+        except NotListed:
+            self.not_listed[key] = time.monotonic() + LISTING_TTL
+            VENUE_REQUESTS.inc(venue=venue.name, call=call, result='not_listed')
+            return None
+        except Exception as e:
+            with self._lock:
+                self.health[venue.name].failure(e)
+            VENUE_REQUESTS.inc(venue=venue.name, call=call, result='error')
+            return None
+        elapsed = time.perf_counter() - started
+        VENUE_SECONDS.observe(elapsed, venue=venue.name, call=call)
+        if getattr(result, 'status_code', 200) != 200:
+            with self._lock:
+                self.health[venue.name].failure(f"status {result.status_code}")
+            VENUE_REQUESTS.inc(venue=venue.name, call=call, result='error')
+            return None
+        with self._lock:
+            self.health[venue.name].success(elapsed)
+        VENUE_REQUESTS.inc(venue=venue.name, call=call, result='ok')
+        return result
+
+    def ticker(self, symbol):
+        """Volume-weighted composite 24h ticker of a pair; None if no venue lists it"""
+        base, quote = split_pair(symbol)
+        venues = [venue for venue in self.ranked() if self.health[venue.name].healthy] or self.ranked()
+        futures = {self.pool.submit(self._call, venue, 'ticker', base, quote): venue for venue in venues}
+        pending = set(futures)
+        quotes = []
+        deadline = time.monotonic() + VENUE_TIMEOUT
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    result['venue'] = futures[future].name
+                    if not quotes:
+                        deadline = min(deadline, time.monotonic() + COMPOSITE_GRACE)
+                    quotes.append(result)
+        return composite(quotes)
+
+    def klines(self, symbol, interval='1h', limit=100):
+        """(venue name, UpstreamResponse of Binance-layout klines) from the first venue to answer.
+
+        Raises ValueError for a limit that is not a number and UpstreamError when every venue
+        failed and none has a cached answer.
+        """
+        limit = kline_limit(limit)
+        base, quote = split_pair(symbol)
+        queue = [venue for venue in self.ranked() if interval in venue.INTERVALS]
+        if not queue:
+            return None, UpstreamResponse(400, b'{"code": -1120, "msg": "Invalid interval."}', 'application/json')
+        venues = list(queue)
+        pending = {}
+        deadline = time.monotonic() + VENUE_TIMEOUT
+        while queue or pending:
+            # The next venue is asked after a failure, or as a hedge after HEDGE_DELAY
+            if queue:
+                venue = queue.pop(0)
+                pending[self.pool.submit(self._call, venue, 'klines', base, quote, interval, limit)] = venue
+            timeout = HEDGE_DELAY if queue else max(0.0, deadline - time.monotonic())
+            done, _ = wait(set(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done and not queue:
+                break
+            for future in done:
+                venue = pending.pop(future)
+                response = future.result()
+                if response is not None:
+                    return venue.name, response
+        # Nothing live: fall back to the last good answer of any venue
+        for venue in venues:
+            try:
+                response = venue.klines(base, quote, interval, limit, stale=True)
+            except NotListed:
+                continue
+            if response is not None:
+                return venue.name, response
+        if all(self.not_listed.get((venue.name, 'klines', (base, quote, interval)), 0) > time.monotonic()
+               for venue in venues):
+            return None, UpstreamResponse(400, b'{"msg": "Invalid symbol."}', 'application/json')
+        raise UpstreamError(f"no venue answered klines for {symbol}")
+
+    def listed(self, quote='USDT'):
+        """Union of the base assets every venue lists against quote"""
+        futures = [self.pool.submit(self._call, venue, 'listed', quote) for venue in self.venues]
+        assets = set()
+        for future in futures:
+            assets |= future.result() or set()
+        return assets
+
+    def status(self):
+        return {name: health.status() for name, health in self.health.items()}
+
+
+def composite(quotes):
+    """Combine venue tickers: prices and changes weighted by 24h quote volume"""
+    if not quotes:
+        return None
+    median = statistics.median(q['price'] for q in quotes)
+    quotes = [q for q in quotes if abs(q['price'] - median) / median * 100 <= MAX_DEVIATION_PCT]
+    weights = [max(q['quote_volume'], 0.0) for q in quotes]
+    total = sum(weights)
+    if total <= 0:
+        weights, total = [1.0] * len(quotes), float(len(quotes))
+    price = sum(q['price'] * w for q, w in zip(quotes, weights)) / total
+    deepest = max(quotes, key=lambda q: q['quote_volume'])
+    COMPOSITE_VENUES.observe(len(quotes))
+    return {
+        'price': price,
+        'volume': sum(q['volume'] for q in quotes),
+        'quote_volume': sum(q['quote_volume'] for q in quotes),
+        'change_percent': sum(q['change_percent'] * w for q, w in zip(quotes, weights)) / total,
+        'high': deepest['high'],
+        'low': deepest['low'],
+        'venue_spread_pct': (max(q['price'] for q in quotes) - min(q['price'] for q in quotes)) / price * 100,
+        'venues': {q['venue']: {'price': q['price'], 'quote_volume': q['quote_volume']} for q in quotes}
+    }
+
+
+def build(names=None, fixtures=None, binance_base_url=None):
+    """Aggregator over the named adapters (default VENUES)"""
+    venues = []
+    for name in names or VENUES:
+        if name not in ADAPTERS:
+            raise ValueError(f"Unknown venue '{name}'")
+        base_url = binance_base_url if name == 'binance' else None
+        venues.append(ADAPTERS[name](base_url=base_url, fixtures=fixtures))
+    return Aggregator(venues)
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    """Process-wide Aggregator for VENUES / VENUE_FIXTURES"""
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                _aggregator = build(fixtures=VENUE_FIXTURES)
+    return _aggregator
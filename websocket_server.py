@@ -1,16 +1,114 @@
 import asyncio
 import websockets
 import json
-import requests
 import time
 from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+import os
 import threading
+from functools import partial
+import alerts
+import backplane
+import jobs
+import metrics
+import replay
+import scheduler
+import snapshot
+import upstream
+import userdata
+import venues
+
+# Binance API base URL
+BINANCE_BASE_URL = "https://api.binance.com/api/v3"
+
+# Alternative.me Fear & Greed Index API
+FEAR_GREED_URL = "https://api.alternative.me/fng/"
+
+# Refresh periods of the scheduled market tasks (seconds)
+FEAR_GREED_INTERVAL = 300
+SYMBOL_REGISTRY_INTERVAL = 3600
+# Candle interval after whose close indicators are recomputed; empty disables
+INDICATOR_INTERVAL = os.environ.get('WS_INDICATOR_INTERVAL', '1h')
+INDICATOR_FIELDS = ('rsi', 'macd', 'macd_signal', 'bb_upper', 'bb_middle', 'bb_lower', 'ema_12', 'ema_26',
+                    'sma_20', 'sma_50', 'stoch_k', 'stoch_d', 'atr', 'current_price')
+
+# Alert evaluation on the ingesting node; WS_ALERTS=0 turns it off
+ALERTS_ENABLED = os.environ.get('WS_ALERTS', '1') != '0'
+ALERT_SYNC_INTERVAL = 2
+# Fired alerts older than this are not delivered (e.g. replayed by a backplane resync)
+ALERT_DELIVERY_TTL = 60
+ALERT_FETCH_CONCURRENCY = 8
+
+# Messages kept per topic for clients resuming with ?resume_from=<seq>&epoch=<epoch>
+REPLAY_BUFFER_SIZE = int(os.environ.get('WS_REPLAY_BUFFER', '256'))
+
+# Identified users: how often changed watchlists are picked up (seconds), and
+# how many symbols from watchlists the ingester adds to the ticker feed
+USER_SYNC_INTERVAL = 2
+MAX_FEED_SYMBOLS = int(os.environ.get('WS_MAX_FEED_SYMBOLS', '200'))
+# Market topics keyed by symbol; identified users only receive their symbols of these
+PER_SYMBOL_TOPICS = ('price_update', 'indicator_update')
+
+# How often watched jobs are checked for updates (seconds)
+JOB_POLL_INTERVAL = 1.0
+
+DEFAULT_SYMBOLS = ['BTC', 'ETH', 'BNB', 'SOL', 'ADA', 'DOGE', 'DOT', 'LINK', 'LTC', 'UNI']
+
+# Instrumentation
+WS_CLIENTS = metrics.gauge('ws_clients', 'Connected WebSocket clients')
+WS_QUEUE_BYTES = metrics.gauge('ws_send_queue_bytes', 'Bytes buffered for sending to WebSocket clients', ('stat',))
+WS_BROADCAST_SECONDS = metrics.histogram('ws_broadcast_seconds', 'Time to hand one message to all clients')
+WS_MESSAGES = metrics.counter('ws_messages_total', 'WebSocket messages by direction and type', ('direction', 'type'))
+WS_RESUMES = metrics.counter('ws_resumes_total', 'Reconnects by how the client was caught up', ('result',))
+WS_UPDATE_SECONDS = metrics.histogram('ws_price_update_seconds', 'Duration of one ticker refresh')
+
+def write_buffer_size(websocket):
+    transport = getattr(websocket, 'transport', None)
+    return transport.get_write_buffer_size() if transport is not None else 0
 
 class CryptoWebSocketServer:
-    def __init__(self):
+    """WebSocket fan-out of market data.
+
+    role 'standalone' polls Binance and serves clients in one process; with a
+    SocketBackplane, one 'ingest' node polls and publishes while 'edge' nodes
+    only relay the backplane to their clients.
+    """
+    def __init__(self, binance_base_url=BINANCE_BASE_URL, fear_greed_url=FEAR_GREED_URL,
+                 symbols=None, update_interval=10, market_backplane=None, role='standalone', aggregator=None):
         self.clients = set()
         self.running = False
-        self.data_cache = {}
+        self.data_cache = {}  # fear & greed and indicators; prices live in self.snapshot
+        self.snapshot = None
+        self.binance_base_url = binance_base_url
+        if aggregator is None:
+            # A custom Binance URL (e.g. ws_loadtest's fake feed) means Binance only
+            aggregator = venues.get_aggregator() if binance_base_url == BINANCE_BASE_URL \
+                else venues.build(['binance'], binance_base_url=binance_base_url)
+        self.venues = aggregator
+        # ...and a private snapshot, so a fake feed never reaches the shared one
+        self.snapshot_name = snapshot.SNAPSHOT_NAME if binance_base_url == BINANCE_BASE_URL else ''
+        self.fear_greed_url = fear_greed_url
+        self.symbols = symbols or DEFAULT_SYMBOLS
+        self.update_interval = update_interval
+        self.backplane = market_backplane or backplane.InMemoryBackplane()
+        self.role = role
+        self.sequencer = replay.Sequencer()
+        self.replay = replay.ReplayBuffer(REPLAY_BUFFER_SIZE)
+        self.scheduler = scheduler.Scheduler()
+        self.symbol_registry = None  # tradable USDT base assets, once loaded
+        self.alert_engine = None
+        self.alert_watchers = {}  # owner -> websockets receiving their alerts
+        self.last_alert_seq = 0
+        self.interests = userdata.InterestIndex()  # symbol -> identified users on this node
+        self.user_connections = {}  # user id -> websockets
+        self.connection_users = {}  # websocket -> user id
+        self.user_cursor = None
+        self.watched_symbols = []  # watchlist symbols beyond self.symbols (ingester)
+        self.job_watchers = {}  # job id -> websockets watching it
+        self.job_versions = {}  # job id -> updated_at last pushed
+        WS_CLIENTS.set_function(lambda: len(self.clients))
+        WS_QUEUE_BYTES.set_function(lambda: sum(write_buffer_size(c) for c in list(self.clients)), stat='total')
+        WS_QUEUE_BYTES.set_function(lambda: max([write_buffer_size(c) for c in list(self.clients)] or [0]), stat='max')
         
     async def register(self, websocket):
         """Register a new client"""
@@ -20,31 +118,49 @@ class CryptoWebSocketServer:
     async def unregister(self, websocket):
         """Unregister a client"""
         self.clients.discard(websocket)
+        for job_id, watchers in list(self.job_watchers.items()):
+            watchers.discard(websocket)
+            if not watchers:
+                self.unwatch_job(job_id)
+        for owner, watchers in list(self.alert_watchers.items()):
+            watchers.discard(websocket)
+            if not watchers:
+                del self.alert_watchers[owner]
+        user_id = self.connection_users.get(websocket)
+        if user_id is not None:
+            self.unregister_user(websocket, user_id)
         print(f"Client disconnected. Total clients: {len(self.clients)}")
         
     async def send_to_all(self, message):
         """Send message to all connected clients"""
         if self.clients:
-            await asyncio.gather(
-                *[client.send(message) for client in self.clients],
-                return_exceptions=True
-            )
+            with WS_BROADCAST_SECONDS.time():
+                await asyncio.gather(
+                    *[client.send(message) for client in self.clients],
+                    return_exceptions=True
+                )
+    
+    def http_get(self, url, timeout=5):
+        """GET through the shared upstream client; a live price feed never wants stale data"""
+        return upstream.get(url, timeout=timeout, stale_on_error=False)
     
     def fetch_price_data(self, symbol):
-        """Fetch current price data from Binance"""
+        """Fetch the volume-weighted composite price across venues"""
         try:
-            url = f"https://api.binance.com/api/v3/ticker/24hr?symbol={symbol.upper()}USDT"
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
+            data = self.venues.ticker(f"{symbol.upper()}USDT")
+            if data:
+                if self.snapshot is not None and self.role != 'edge':
+                    self.snapshot.write(f"{symbol.upper()}USDT", data)
+                price = data['price']
                 return {
                     'symbol': symbol.upper(),
-                    'price': float(data['lastPrice']),
-                    'change': float(data['priceChange']),
-                    'changePercent': float(data['priceChangePercent']),
-                    'volume': float(data['volume']),
-                    'high': float(data['highPrice']),
-                    'low': float(data['lowPrice']),
+                    'price': price,
+                    'change': price - price / (1 + data['change_percent'] / 100),
+                    'changePercent': data['change_percent'],
+                    'volume': data['volume'],
+                    'high': data['high'],
+                    'low': data['low'],
+                    'venues': sorted(data['venues']),
                     'timestamp': datetime.now().isoformat()
                 }
         except Exception as e:
@@ -54,7 +170,7 @@ class CryptoWebSocketServer:
     def fetch_fear_greed_index(self):
         """Fetch Fear & Greed Index"""
         try:
-            response = requests.get("https://api.alternative.me/fng/", timeout=5)
+            response = self.http_get(self.fear_greed_url, timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 if data and 'data' in data and len(data['data']) > 0:
@@ -67,53 +183,338 @@ class CryptoWebSocketServer:
             print(f"Error fetching Fear & Greed Index: {e}")
         return None
     
-    async def price_updater(self):
-        """Background task to update prices"""
-        symbols = ['BTC', 'ETH', 'BNB', 'SOL', 'ADA', 'DOGE', 'DOT', 'LINK', 'LTC', 'UNI']
+    def fetch_symbol_registry(self):
+        """Base assets of every trading USDT pair on any venue"""
+        assets = self.venues.listed('USDT')
+        if not assets:
+            raise RuntimeError("no venue returned its listings")
+        return assets
+    
+    def fetch_indicators(self, symbol, interval):
+        """Latest indicator values of a symbol from its klines"""
+        import indicators  # numpy; only the ingesting node needs it
+        _, response = self.venues.klines(f"{symbol.upper()}USDT", interval, 200)
+        if response.status_code != 200:
+            return None
+        data = indicators.parse_klines(response.json())
+        if len(data['close']) < indicators.MIN_CANDLES:
+            return None
+        values = indicators.technical_indicators(data)
+        return {field: values[field] for field in INDICATOR_FIELDS}
+    
+    async def update_prices(self):
+        """Scheduled: publish the 24h tickers of all symbols"""
+        cycle_started = time.perf_counter()
+        symbols = self.symbols + [s for s in self.watched_symbols if s not in self.symbols]
+        results = await asyncio.gather(*[asyncio.to_thread(self.fetch_price_data, symbol) for symbol in symbols])
+        price_updates = {symbol: data for symbol, data in zip(symbols, results) if data}
+        if price_updates:
+            await self.publish_market('price_update', {
+                'type': 'price_update',
+                'data': price_updates,
+                'sent_at': time.time()
+            })
+        WS_UPDATE_SECONDS.observe(time.perf_counter() - cycle_started)
+    
+    async def update_fear_greed(self):
+        """Scheduled: publish the Fear & Greed Index"""
+        fg_data = await asyncio.to_thread(self.fetch_fear_greed_index)
+        if fg_data:
+            await self.publish_market('fear_greed_update', {
+                'type': 'fear_greed_update',
+                'data': fg_data
+            })
+    
+    async def refresh_symbol_registry(self):
+        """Scheduled: reload the tradable symbols used to validate subscriptions"""
+        self.symbol_registry = await asyncio.to_thread(self.fetch_symbol_registry)
+    
+    async def update_indicators(self):
+        """Scheduled after each candle close: publish fresh indicators of all symbols"""
+        results = await asyncio.gather(
+            *[asyncio.to_thread(self.fetch_indicators, symbol, INDICATOR_INTERVAL) for symbol in self.symbols],
+            return_exceptions=True
+        )
+        updates = {symbol: values for symbol, values in zip(self.symbols, results) if isinstance(values, dict)}
+        if updates:
+            await self.publish_market('indicator_update', {
+                'type': 'indicator_update',
+                'interval': INDICATOR_INTERVAL,
+                'data': updates
+            })
+    
+    def schedule_market_tasks(self):
+        self.scheduler.every('tickers', self.update_prices, self.update_interval)
+        self.scheduler.every('fear_greed', self.update_fear_greed, FEAR_GREED_INTERVAL, jitter=5)
+        self.scheduler.every('symbol_registry', self.refresh_symbol_registry, SYMBOL_REGISTRY_INTERVAL, jitter=30)
+        if INDICATOR_INTERVAL:
+            self.scheduler.on_candle_close('indicators', self.update_indicators, INDICATOR_INTERVAL, offset=2)
+        if ALERTS_ENABLED:
+            self.alert_engine = alerts.AlertEngine(alerts.get_store())
+            self.scheduler.every('alert_sync', self.sync_alerts, ALERT_SYNC_INTERVAL)
+            self.scheduler.every('alert_tickers', self.update_alert_prices, self.update_interval)
+    
+    async def sync_users(self):
+        """Scheduled: re-index connected users whose watchlists changed; the ingester also
+        follows the most watched symbols of all users"""
+        store = userdata.get_store()
+        if self.user_cursor is None:
+            self.user_cursor = time.time()
+        # Re-read the last second: batches of other processes commit slightly out of order
+        changed, cursor = await asyncio.to_thread(store.changed_since, self.user_cursor - 1.0)
+        self.user_cursor = max(self.user_cursor, cursor)
+        for user_id in changed:
+            if user_id in self.user_connections:
+                self.interests.set_user(user_id, await asyncio.to_thread(store.load, user_id))
+        if self.role != 'edge' and (changed or not self.watched_symbols):
+            self.watched_symbols = await asyncio.to_thread(store.watched_symbols, MAX_FEED_SYMBOLS)
+    
+    async def watch_user(self, websocket, user_id):
+        """Identify a connection: from now on it gets only its user's symbols and alerts"""
+        data = await asyncio.to_thread(userdata.get_store().load, user_id)
+        previous = self.connection_users.get(websocket)
+        if previous is not None and previous != user_id:
+            self.unregister_user(websocket, previous)
+        self.connection_users[websocket] = user_id
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+        self.interests.set_user(user_id, data)
+        self.alert_watchers.setdefault(str(user_id), set()).add(websocket)
+        symbols = sorted(self.interests.symbols_by_user[user_id])
+        prices = {symbol: price for symbol in symbols if (price := self.cached_price(symbol))}
+        await websocket.send(json.dumps({'type': 'watching', 'user_id': user_id, 'symbols': symbols, 'data': prices}))
+    
+    def unregister_user(self, websocket, user_id):
+        """Forget a connection's user; the user leaves the index with their last connection"""
+        self.connection_users.pop(websocket, None)
+        connections = self.user_connections.get(user_id, set())
+        connections.discard(websocket)
+        if not connections:
+            self.user_connections.pop(user_id, None)
+            self.interests.drop_user(user_id)
+        watchers = self.alert_watchers.get(str(user_id), set())
+        watchers.discard(websocket)
+        if not watchers:
+            self.alert_watchers.pop(str(user_id), None)
+    
+    async def send_market(self, topic, message, encoded):
+        """Relay a market message: whole to anonymous clients, per-user subsets to identified ones"""
+        if topic not in PER_SYMBOL_TOPICS or not self.connection_users:
+            await self.send_to_all(encoded)
+            return
+        anonymous = [client for client in self.clients if client not in self.connection_users]
+        sends = [client.send(encoded) for client in anonymous]
+        # Users following the same symbols share one encoded message
+        encoded_by_symbols = {}
+        for user_id, symbols in self.interests.split(message['data']).items():
+            key = tuple(sorted(symbols))
+            subset = encoded_by_symbols.get(key)
+            if subset is None:
+                subset = encoded_by_symbols[key] = json.dumps(dict(message, data={s: message['data'][s] for s in key}))
+            sends.extend(client.send(subset) for client in self.user_connections.get(user_id, ()))
+        if sends:
+            with WS_BROADCAST_SECONDS.time():
+                await asyncio.gather(*sends, return_exceptions=True)
+    
+    def fetch_all_tickers(self):
+        """24h tickers of every USDT pair keyed by base asset, in alert field names"""
+        response = self.http_get(f"{self.binance_base_url}/ticker/24hr", timeout=10)
+        if response.status_code != 200:
+            raise RuntimeError(f"ticker/24hr returned {response.status_code}")
+        tickers = {}
+        for ticker in response.json():
+            symbol = ticker.get('symbol', '')
+            if symbol.endswith('USDT'):
+                tickers[symbol[:-4]] = {
+                    'price': float(ticker['lastPrice']),
+                    'change_percent': float(ticker['priceChangePercent']),
+                    'volume': float(ticker['volume'])
+                }
+        return tickers
+    
+    async def sync_alerts(self):
+        """Scheduled: pick up registered and deleted alerts; start indicator feeds they need"""
+        changes = await asyncio.to_thread(self.alert_engine.fetch)
+        fired = self.alert_engine.apply(changes)
+        for scope in list(self.alert_engine.index.scopes):
+            name = f"alert_indicators_{scope}"
+            if scope != 'tick' and name not in self.scheduler.tasks:
+                self.scheduler.on_candle_close(name, partial(self.update_alert_indicators, scope), scope, offset=2)
+        await self.deliver_alerts(fired)
+    
+    async def update_alert_prices(self):
+        """Scheduled: check ticker alerts against one all-symbol ticker request"""
+        symbols = self.alert_engine.index.symbols('tick')
+        if not symbols:
+            return
+        tickers = await asyncio.to_thread(self.fetch_all_tickers)
+        fired = []
+        for symbol in symbols:
+            values = tickers.get(symbol)
+            if values is not None:
+                fired.extend(self.alert_engine.update(symbol, 'tick', values))
+        await self.deliver_alerts(fired)
+    
+    async def update_alert_indicators(self, interval):
+        """Scheduled after each candle close: check indicator alerts of an interval"""
+        symbols = self.alert_engine.index.symbols(interval)
+        limit = asyncio.Semaphore(ALERT_FETCH_CONCURRENCY)
+        
+        async def fetch(symbol):
+            async with limit:
+                return await asyncio.to_thread(self.fetch_indicators, symbol, interval)
         
+        results = await asyncio.gather(*[fetch(symbol) for symbol in symbols], return_exceptions=True)
+        fired = []
+        for symbol, values in zip(symbols, results):
+            if isinstance(values, dict):
+                fired.extend(self.alert_engine.update(symbol, interval, values))
+        await self.deliver_alerts(fired)
+    
+    async def deliver_alerts(self, fired):
+        """Record fired alerts and publish them so the owner's node can push them"""
+        if not fired:
+            return
+        fired = [(alert, self.alert_engine.value_of(alert)) for alert in fired]
+        await asyncio.to_thread(self.alert_engine.store.mark_fired, fired)
+        await self.publish_market('alert_fired', {
+            'type': 'alert',
+            'data': [alerts.fired_payload(alert, value) for alert, value in fired],
+            'sent_at': time.time()
+        })
+    
+    async def publish_market(self, topic, message):
+        """Sequence a market message and publish it to every node"""
+        await self.backplane.publish(topic, self.sequencer.stamp(topic, message))
+    
+    async def on_market_message(self, topic, message):
+        """Backplane handler: refresh the local cache and relay to this node's clients"""
+        if topic == 'alert_fired':
+            await self.push_alerts(message)
+            return
+        encoded = json.dumps(message)
+        if not self.replay.append(topic, message, encoded):
+            return  # already relayed (snapshot replayed after a backplane reconnect)
+        if topic == 'price_update':
+            if self.role == 'edge' and self.snapshot.writable:
+                # An edge on another host than the ingester keeps its own snapshot
+                for symbol, price_data in message['data'].items():
+                    self.snapshot.write(f"{symbol}USDT", snapshot_ticker(price_data), updated_at=message.get('sent_at'))
+        elif topic == 'fear_greed_update':
+            self.data_cache['fear_greed'] = message['data']
+        elif topic == 'indicator_update':
+            for symbol, values in message['data'].items():
+                self.data_cache[f"indicators_{symbol}"] = values
+        await self.send_market(topic, message, encoded)
+        WS_MESSAGES.inc(direction='out', type=topic)
+    
+    def open_snapshot(self):
+        """The ingester writes the shared snapshot; edges on its host read it, others keep a private one"""
+        if self.role != 'edge':
+            return snapshot.MarketSnapshot.create(self.snapshot_name)
+        try:
+            return snapshot.MarketSnapshot.attach(self.snapshot_name)
+        except FileNotFoundError:
+            return snapshot.MarketSnapshot.private()
+    
+    def current_snapshot(self):
+        """The snapshot, mapped again if the ingester replaced the segment"""
+        if self.snapshot is not None and self.snapshot.retired:
+            self.snapshot = self.open_snapshot()
+        return self.snapshot
+    
+    def cached_price(self, symbol):
+        """Feed message of a symbol from the snapshot, or None if it has no row"""
+        market = self.current_snapshot()
+        record = market.read(f"{symbol}USDT") if market is not None else None
+        return snapshot.price_message(record, symbol) if record is not None else None
+    
+    def cached_state(self):
+        """Everything a new client is welcomed with"""
+        state = dict(self.data_cache)
+        market = self.current_snapshot()
+        if market is not None:
+            for record in market.read_all():
+                pair = record['symbol'].decode()
+                if pair.endswith('USDT'):
+                    state[f"price_{pair[:-4]}"] = snapshot.price_message(record, pair[:-4])
+        return state
+    
+    async def push_alerts(self, message):
+        """Send fired alerts to the connections of their owners on this node"""
+        seq = message.get('seq', 0)
+        if seq and seq <= self.last_alert_seq or time.time() - message.get('sent_at', 0) > ALERT_DELIVERY_TTL:
+            return
+        self.last_alert_seq = max(self.last_alert_seq, seq)
+        for payload in message['data']:
+            watchers = self.alert_watchers.get(payload['owner'])
+            user_id = int(payload['owner']) if payload['owner'].isdigit() else None
+            if user_id in self.user_connections and not self.interests.wants_alert(user_id, payload['symbol']):
+                continue  # muted in the user's alert preferences
+            if watchers:
+                encoded = json.dumps({'type': 'alert', 'data': payload})
+                await asyncio.gather(*[client.send(encoded) for client in watchers], return_exceptions=True)
+                WS_MESSAGES.inc(direction='out', type='alert')
+    
+    def unwatch_job(self, job_id):
+        self.job_watchers.pop(job_id, None)
+        self.job_versions.pop(job_id, None)
+    
+    async def send_job_update(self, job, watchers):
+        message = json.dumps({'type': 'job_update', 'data': job})
+        await asyncio.gather(*[client.send(message) for client in watchers], return_exceptions=True)
+        WS_MESSAGES.inc(direction='out', type='job_update')
+    
+    async def job_notifier(self):
+        """Background task pushing progress and results of watched jobs"""
         while self.running:
             try:
-                # Update prices for all symbols
-                price_updates = {}
-                for symbol in symbols:
-                    price_data = self.fetch_price_data(symbol)
-                    if price_data:
-                        price_updates[symbol] = price_data
-                        self.data_cache[f"price_{symbol}"] = price_data
-                
-                if price_updates:
-                    message = json.dumps({
-                        'type': 'price_update',
-                        'data': price_updates
-                    })
-                    await self.send_to_all(message)
-                
-                # Update Fear & Greed Index every 5 minutes
-                if int(time.time()) % 300 == 0:  # Every 5 minutes
-                    fg_data = self.fetch_fear_greed_index()
-                    if fg_data:
-                        self.data_cache['fear_greed'] = fg_data
-                        message = json.dumps({
-                            'type': 'fear_greed_update',
-                            'data': fg_data
-                        })
-                        await self.send_to_all(message)
-                
-                await asyncio.sleep(10)  # Update every 10 seconds
-                
+                if self.job_watchers:
+                    watched = await asyncio.to_thread(jobs.get_store().get_many, list(self.job_watchers))
+                    for job in watched:
+                        job_id = job['id']
+                        watchers = self.job_watchers.get(job_id)
+                        if not watchers or self.job_versions.get(job_id) == job['updated_at']:
+                            continue
+                        self.job_versions[job_id] = job['updated_at']
+                        await self.send_job_update(job, set(watchers))
+                        if job['status'] in jobs.TERMINAL_STATES:
+                            self.unwatch_job(job_id)
             except Exception as e:
-                print(f"Error in price updater: {e}")
-                await asyncio.sleep(5)
+                print(f"Error in job notifier: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
     
-    async def handle_client(self, websocket, path):
+    async def handle_client(self, websocket, path=None):
         """Handle individual client connections"""
         await self.register(websocket)
         
-        # Send cached data to new client
-        if self.data_cache:
+        # A reconnecting client gets only the messages after its last seq if
+        # the replay buffers still cover them; clients drop seqs they already have
+        request_path = path or getattr(getattr(websocket, 'request', None), 'path', '') or ''
+        query = parse_qs(urlparse(request_path).query)
+        missed = None
+        if 'resume_from' in query:
+            try:
+                missed = self.replay.since(int(query['resume_from'][0]), query.get('epoch', [None])[0])
+            except ValueError:
+                missed = None
+            WS_RESUMES.inc(result='snapshot' if missed is None else 'replayed')
+        
+        if missed is not None:
+            await websocket.send(json.dumps({
+                'type': 'resume',
+                'epoch': self.replay.epoch,
+                'seq': self.replay.last_seq,
+                'replayed': len(missed)
+            }))
+            for encoded in missed:
+                await websocket.send(encoded)
+        elif self.data_cache or self.snapshot is not None and self.snapshot.indexed:
+            # Send cached data to new client
             welcome_message = json.dumps({
                 'type': 'welcome',
-                'data': self.data_cache
+                'data': self.cached_state(),
+                'epoch': self.replay.epoch,
+                'seq': self.replay.last_seq
             })
             await websocket.send(welcome_message)
         
@@ -121,12 +522,19 @@ class CryptoWebSocketServer:
             async for message in websocket:
                 try:
                     data = json.loads(message)
+                    message_type = data.get('type')
+                    WS_MESSAGES.inc(direction='in', type=message_type if message_type in ('subscribe', 'ping', 'watch_job', 'watch_alerts', 'watch_user') else 'other')
                     
                     if data.get('type') == 'subscribe':
                         # Handle subscription requests
                         symbol = data.get('symbol', '').upper()
-                        if symbol:
-                            price_data = self.fetch_price_data(symbol)
+                        if symbol and self.symbol_registry is not None and symbol not in self.symbol_registry:
+                            await websocket.send(json.dumps({'type': 'error', 'message': f'Unknown symbol {symbol}'}))
+                        elif symbol:
+                            # Symbols on the feed are answered from the cache, others from Binance
+                            price_data = self.cached_price(symbol)
+                            if price_data is None:
+                                price_data = await asyncio.to_thread(self.fetch_price_data, symbol)
                             if price_data:
                                 response = json.dumps({
                                     'type': 'subscription_data',
@@ -135,6 +543,32 @@ class CryptoWebSocketServer:
                                 })
                                 await websocket.send(response)
                     
+                    elif data.get('type') == 'watch_alerts':
+                        # Alerts registered through /api/alerts for this owner are pushed here. Not
+                        # authenticated: like the API, the owner name alone selects the alerts
+                        owner = str(data.get('owner', ''))
+                        if owner:
+                            self.alert_watchers.setdefault(owner, set()).add(websocket)
+                    
+                    elif data.get('type') == 'watch_user':
+                        # Push only the symbols on this user's watchlist and positions (/api/users/<id>/...)
+                        # Not authenticated: like /api/users/<id>, the id alone identifies the user
+                        try:
+                            await self.watch_user(websocket, int(data.get('user_id')))
+                        except (TypeError, ValueError):
+                            await websocket.send(json.dumps({'type': 'error', 'message': 'user_id must be an integer'}))
+                    
+                    elif data.get('type') == 'watch_job':
+                        # Push updates of a job submitted through /api/jobs until it finishes
+                        job_id = str(data.get('job_id', ''))
+                        job = await asyncio.to_thread(jobs.get_store().get, job_id) if job_id else None
+                        if job is None:
+                            await websocket.send(json.dumps({'type': 'error', 'message': 'Job not found'}))
+                        elif job['status'] in jobs.TERMINAL_STATES:
+                            await self.send_job_update(job, {websocket})
+                        else:
+                            self.job_watchers.setdefault(job_id, set()).add(websocket)
+                    
                     elif data.get('type') == 'ping':
                         # Handle ping requests
                         pong_message = json.dumps({
@@ -160,19 +594,43 @@ class CryptoWebSocketServer:
     async def start_server(self, host='0.0.0.0', port=8765):
         """Start the WebSocket server"""
         self.running = True
+        self.snapshot = self.open_snapshot()
+        
+        await self.backplane.start()
+        self.backplane.subscribe(self.on_market_message)
         
-        # Start background price updater
-        asyncio.create_task(self.price_updater())
+        # Only the node that owns ingestion polls Binance; edges just relay
+        if self.role != 'edge':
+            self.schedule_market_tasks()
+        self.scheduler.every('user_sync', self.sync_users, USER_SYNC_INTERVAL)
+        self.scheduler.start()
+        asyncio.create_task(self.job_notifier())
         
-        print(f"Starting WebSocket server on {host}:{port}")
+        print(f"Starting WebSocket server ({self.role}) on {host}:{port}")
         
         async with websockets.serve(self.handle_client, host, port):
             await asyncio.Future()  # Run forever
 
+def snapshot_ticker(price_data):
+    """A price_update entry in the venues.composite() shape the snapshot stores"""
+    return {
+        'price': price_data['price'],
+        'change_percent': price_data['changePercent'],
+        'volume': price_data['volume'],
+        'high': price_data['high'],
+        'low': price_data['low'],
+        'venues': {name: {} for name in price_data.get('venues', ())}
+    }
+
 def run_websocket_server():
     """Run the WebSocket server"""
-    server = CryptoWebSocketServer()
-    asyncio.run(server.start_server())
+    metrics_port = os.environ.get('METRICS_PORT')
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+    # WS_ROLE=standalone (default), ingest or edge; see backplane.from_env
+    server = CryptoWebSocketServer(market_backplane=backplane.from_env(os.environ),
+                                   role=os.environ.get('WS_ROLE', 'standalone'))
+    asyncio.run(server.start_server(port=int(os.environ.get('WS_PORT', '8765'))))
 
 if __name__ == "__main__":
     run_websocket_server()
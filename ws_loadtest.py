@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Fan-out benchmark and soak test for CryptoWebSocketServer.
+
+Starts a local fake Binance/Fear & Greed feed, runs the WebSocket server in a
+child process against it and connects N local clients with mixed
+subscribe/ping traffic, some of which read deliberately slowly. Broadcast
+latency (ticker publish -> client receipt), memory per connection and
+message loss are written to a JSON report that can be compared with a
+previous run:
+
+    python ws_loadtest.py --clients 2000 --duration 60 --output run.json
+    python ws_loadtest.py --clients 2000 --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+from websocket_server import CryptoWebSocketServer, DEFAULT_SYMBOLS
+
+
+class FakeFeedHandler(BaseHTTPRequestHandler):
+    """Serves /api/v3/ticker/24hr and /fng/ with random-walk prices"""
+    prices = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.endswith('/ticker/24hr'):
+            symbol = parse_qs(url.query).get('symbol', ['BTCUSDT'])[0]
+            with self.lock:
+                price = self.prices.get(symbol, 100.0) * (1 + random.uniform(-0.002, 0.002))
+                self.prices[symbol] = price
+            volume = random.uniform(1000, 100000)
+            body = {
+                'symbol': symbol,
+                'lastPrice': str(price),
+                'priceChange': str(price * 0.01),
+                'priceChangePercent': '1.0',
+                'volume': str(volume),
+                'quoteVolume': str(volume * price),
+                'highPrice': str(price * 1.02),
+                'lowPrice': str(price * 0.98)
+            }
+        elif url.path.startswith('/fng'):
+            body = {'data': [{'value': str(random.randint(0, 100)), 'value_classification': 'Neutral'}]}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_feed():
+    """Start the fake upstream feed on a free local port"""
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeFeedHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_server_process(port, feed_url, update_interval, quiet):
+    """Child process entry point running the WebSocket server"""
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    raise_fd_limit()
+    server = CryptoWebSocketServer(
+        binance_base_url=f"{feed_url}/api/v3",
+        fear_greed_url=f"{feed_url}/fng/",
+        update_interval=update_interval
+    )
+    asyncio.run(server.start_server(host='127.0.0.1', port=port))
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def rss_bytes(pid):
+    """Resident set size of a process, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def latency_summary(values):
+    return {
+        'count': len(values),
+        'p50_ms': _ms(percentile(values, 50)),
+        'p90_ms': _ms(percentile(values, 90)),
+        'p99_ms': _ms(percentile(values, 99)),
+        'max_ms': _ms(max(values) if values else None)
+    }
+
+
+def _ms(value):
+    return round(value * 1000, 3) if value is not None else None
+
+
+class LoadClient:
+    """One simulated browser connection"""
+
+    def __init__(self, url, slow, slow_delay, chatter_interval):
+        self.url = url
+        self.slow = slow
+        self.slow_delay = slow_delay
+        self.chatter_interval = chatter_interval
+        self.connected = False
+        self.ticks = {}
+        self.pong_rtts = []
+        self.errors = 0
+        self._ping_sent = []
+
+    async def run(self, stop_event):
+        try:
+            async with websockets.connect(self.url, open_timeout=30) as ws:
+                self.connected = True
+                chatter = asyncio.create_task(self._chatter(ws, stop_event))
+                try:
+                    while not stop_event.is_set():
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=1)
+                        except asyncio.TimeoutError:
+                            continue
+                        received_at = time.time()
+                        message = json.loads(raw)
+                        if message.get('type') == 'price_update' and 'sent_at' in message:
+                            self.ticks[message['sent_at']] = received_at - message['sent_at']
+                        elif message.get('type') == 'pong' and self._ping_sent:
+                            self.pong_rtts.append(time.perf_counter() - self._ping_sent.pop(0))
+                        if self.slow:
+                            await asyncio.sleep(self.slow_delay)
+                finally:
+                    chatter.cancel()
+        except Exception:
+            self.errors += 1
+
+    async def _chatter(self, ws, stop_event):
+        await asyncio.sleep(random.uniform(0, self.chatter_interval))
+        while not stop_event.is_set():
+            if random.random() < 0.5:
+                self._ping_sent.append(time.perf_counter())
+                await ws.send(json.dumps({'type': 'ping'}))
+            else:
+                await ws.send(json.dumps({'type': 'subscribe', 'symbol': random.choice(DEFAULT_SYMBOLS)}))
+            await asyncio.sleep(self.chatter_interval)
+
+
+async def run_clients(args, url, server_pid):
+    stop_event = asyncio.Event()
+    slow_count = int(args.clients * args.slow_fraction)
+    clients = [
+        LoadClient(url, i < slow_count, args.slow_delay, args.chatter_interval)
+        for i in range(args.clients)
+    ]
+    random.shuffle(clients)
+
+    rss_before = rss_bytes(server_pid)
+    tasks = []
+    connect_started = time.perf_counter()
+    for start in range(0, len(clients), args.ramp_batch):
+        for client in clients[start:start + args.ramp_batch]:
+            tasks.append(asyncio.create_task(client.run(stop_event)))
+        await asyncio.sleep(args.ramp_pause)
+    while sum(c.connected for c in clients) + sum(c.errors for c in clients) < len(clients):
+        if time.perf_counter() - connect_started > args.connect_timeout:
+            break
+        await asyncio.sleep(0.2)
+    connect_seconds = time.perf_counter() - connect_started
+
+    await asyncio.sleep(args.update_interval)  # let buffers settle before measuring
+    rss_after = rss_bytes(server_pid)
+
+    window_start = time.time()
+    await asyncio.sleep(args.duration)
+    window_end = time.time()
+    await asyncio.sleep(args.grace)  # give slow readers time to drain
+    stop_event.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return clients, {
+        'connect_seconds': connect_seconds,
+        'rss_before': rss_before,
+        'rss_after': rss_after,
+        'window_start': window_start,
+        'window_end': window_end
+    }
+
+
+def build_report(args, clients, timings):
+    connected = [c for c in clients if c.connected]
+    in_window = lambda sent_at: timings['window_start'] <= sent_at <= timings['window_end']
+
+    ticks = set()
+    for client in connected:
+        ticks.update(t for t in client.ticks if in_window(t))
+
+    normal_latency, slow_latency = [], []
+    received = 0
+    for client in connected:
+        window_ticks = [latency for sent_at, latency in client.ticks.items() if in_window(sent_at)]
+        received += len(window_ticks)
+        (slow_latency if client.slow else normal_latency).extend(window_ticks)
+
+    expected = len(ticks) * len(connected)
+    rss_before, rss_after = timings['rss_before'], timings['rss_after']
+    per_connection = None
+    if rss_before is not None and rss_after is not None and connected:
+        per_connection = round((rss_after - rss_before) / len(connected))
+
+    pong_rtts = [rtt for c in connected for rtt in c.pong_rtts]
+
+    return {
+        'tool': 'ws_loadtest',
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'websockets': websockets.__version__
+        },
+        'config': {
+            'clients': args.clients,
+            'slow_fraction': args.slow_fraction,
+            'slow_delay': args.slow_delay,
+            'chatter_interval': args.chatter_interval,
+            'update_interval': args.update_interval,
+            'duration': args.duration
+        },
+        'results': {
+            'connected': len(connected),
+            'connect_failures': len(clients) - len(connected),
+            'connect_seconds': round(timings['connect_seconds'], 3),
+            'ticks': len(ticks),
+            'messages_expected': expected,
+            'messages_received': received,
+            'message_loss': round(1 - received / expected, 6) if expected else None,
+            'broadcast_latency': latency_summary(normal_latency),
+            'broadcast_latency_slow_readers': latency_summary(slow_latency),
+            'pong_rtt': latency_summary(pong_rtts),
+            'server_rss_before': rss_before,
+            'server_rss_after': rss_after,
+            'memory_per_connection': per_connection
+        }
+    }
+
+
+def flatten(data, prefix=''):
+    items = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            items.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[name] = value
+    return items
+
+
+def print_comparison(previous, current):
+    """Print numeric results side by side with the relative change"""
+    old, new = flatten(previous['results']), flatten(current['results'])
+    print(f"{'metric':45} {'previous':>14} {'current':>14} {'change':>9}")
+    for name in sorted(set(old) | set(new)):
+        a, b = old.get(name), new.get(name)
+        change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ''
+        print(f"{name:45} {str(a):>14} {str(b):>14} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket fan-out benchmark and soak test")
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--slow-fraction', type=float, default=0.05,
+                        help="share of clients that sleep between reads")
+    parser.add_argument('--slow-delay', type=float, default=2.0,
+                        help="seconds a slow reader sleeps after each message")
+    parser.add_argument('--chatter-interval', type=float, default=15.0,
+                        help="seconds between subscribe/ping messages per client")
+    parser.add_argument('--update-interval', type=float, default=1.0,
+                        help="ticker refresh interval of the server under test")
+    parser.add_argument('--duration', type=float, default=30.0, help="measurement window in seconds")
+    parser.add_argument('--grace', type=float, default=5.0, help="drain time after the window")
+    parser.add_argument('--ramp-batch', type=int, default=200)
+    parser.add_argument('--ramp-pause', type=float, default=0.2)
+    parser.add_argument('--connect-timeout', type=float, default=120.0)
+    parser.add_argument('--output', default='ws_loadtest_report.json')
+    parser.add_argument('--compare', help="previous report to compare against")
+    parser.add_argument('--server-log', action='store_true', help="show server output")
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    feed = start_fake_feed()
+    feed_url = f"http://127.0.0.1:{feed.server_address[1]}"
+    port = free_port()
+
+    server = multiprocessing.Process(
+        target=run_server_process,
+        args=(port, feed_url, args.update_interval, not args.server_log),
+        daemon=True
+    )
+    server.start()
+    time.sleep(1.0)
+
+    try:
+        clients, timings = asyncio.run(run_clients(args, f"ws://127.0.0.1:{port}", server.pid))
+    finally:
+        server.terminate()
+        server.join(5)
+        feed.shutdown()
+
+    report = build_report(args, clients, timings)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['results'], indent=2))
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()